@@ -1,13 +1,30 @@
-from flask import Flask, render_template, request, redirect, session
-from datetime import datetime, timedelta
-import psycopg2
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Blueprint, Flask, render_template, request, redirect, session
+from datetime import datetime
+from werkzeug.security import check_password_hash
 from functools import wraps
 import os
-import pandas as pd
+import csv
+import math
+import tempfile
 import io
-from flask import send_file
-import os
+import click
+from decimal import Decimal
+from flask import send_file, Response, stream_with_context, jsonify
+from db import conexion
+from calculos import calcular_cartera, columnas
+import calculos
+import resumen
+import migraciones
+import configuracion
+import lotes
+import metricas
+import libro
+import tareas
+import busqueda
+import clientes
+import vistas
+import reportes
+import instantanea
 
 #PESOS COP
 #--------------------------
@@ -16,12 +33,30 @@ def formato_cop(valor):
         return "$ 0,00"
     return "$ {:,.2f}".format(float(valor)).replace(",", "X").replace(".", ",").replace("X", ".")
 
-app = Flask(__name__)
-#FILTRO JINJA PARA FORMATO COP
-app.jinja_env.filters['cop'] = formato_cop
-app.secret_key = os.environ.get("SECRET_KEY", "clave_super_segura_cambiar_en_produccion")
+# =========================
+# APLICACIÓN
+# =========================
+# Importar este módulo no abre conexiones ni crea tablas: las rutas se
+# registran en el blueprint y create_app() arma la aplicación. El pool de
+# db.py se abre con la primera petición de cada worker.
+#
+#   gunicorn --preload "app:create_app()"
+#   flask --app app run
+bp = Blueprint("prestamos", __name__, cli_group=None)
+
+def create_app():
+    app = Flask(__name__)
+    #FILTRO JINJA PARA FORMATO COP
+    app.jinja_env.filters['cop'] = formato_cop
+    app.secret_key = os.environ.get("SECRET_KEY", "clave_super_segura_cambiar_en_produccion")
+
+    # Tiempos por petición: base de datos, plantilla y cómputo
+    metricas.instalar(app)
 
-DATABASE_URL = os.environ.get("DATABASE_URL")
+    app.register_blueprint(bp)
+    return app
+
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
 
 # =========================
 # PROTEGER RUTAS
@@ -35,11 +70,10 @@ def login_required(f):
     return wrap
 
 
-
 # =========================
 # 📊 REPORTE POR FECHA (GANANCIAS)
 # =========================
-@app.route("/reporte_corte", methods=["POST"])
+@bp.route("/reporte_corte", methods=["POST"])
 @login_required
 def reporte_corte():
 
@@ -53,148 +87,239 @@ def reporte_corte():
     if fecha_inicio > fecha_fin:
         return "La fecha inicio no puede ser mayor que la fecha fin"
 
-    conn = get_connection()
-    c = conn.cursor()
-
-    # Traer abonos dentro del rango
-    c.execute("""
-        SELECT a.fecha, p.nombre, a.monto
-        FROM abonos a
-        JOIN prestamos p ON a.prestamo_id = p.id
-        WHERE a.fecha BETWEEN %s AND %s
-        ORDER BY a.fecha ASC
-    """, (fecha_inicio, fecha_fin))
-
-    registros = c.fetchall()
+    formato = request.form.get("formato", "xlsx")
 
-    # Total ganado en ese rango
-    c.execute("""
-        SELECT COALESCE(SUM(monto),0)
-        FROM abonos
-        WHERE fecha BETWEEN %s AND %s
-    """, (fecha_inicio, fecha_fin))
-
-    total_ganado = float(c.fetchone()[0])
-
-    conn.close()
-
-    # =========================
-    # CREAR EXCEL
-    # =========================
-    output = io.BytesIO()
-
-    df = pd.DataFrame(registros, columns=["Fecha", "Cliente", "Monto"])
-
-    # Agregar fila de total
-    df_total = pd.DataFrame([["", "TOTAL GANADO", total_ganado]], 
-                            columns=["Fecha", "Cliente", "Monto"])
-
-    df = pd.concat([df, df_total])
-
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name="Reporte")
+    if formato == "mensual":
+        # Totales por mes desde el resumen, sin leer los abonos
+        with conexion() as conn:
+            meses = resumen.abonado_por_mes(conn.cursor(), fecha_inicio, fecha_fin)
+        return Response(
+            reporte_mensual_csv(meses),
+            mimetype="text/csv",
+            headers={"Content-Disposition": "attachment; filename=reporte_mensual.csv"}
+        )
 
-    output.seek(0)
+    if formato != "csv":
+        # xlsxwriter ignora sin avisar las filas después del límite de la
+        # hoja: un rango más grande saldría incompleto y con un total que no
+        # cuadra
+        with conexion() as conn:
+            cantidad = contar_abonos(conn.cursor(), fecha_inicio, fecha_fin)
+        if cantidad > MAX_FILAS_XLSX:
+            return (
+                f"El rango tiene {cantidad} abonos y Excel admite {MAX_FILAS_XLSX} "
+                "por hoja. Descárguelo en CSV o use un rango más corto."
+            )
+
+    abonos = abonos_en_rango(fecha_inicio, fecha_fin)
+
+    if formato == "csv":
+        return Response(
+            stream_with_context(reporte_csv(abonos)),
+            mimetype="text/csv",
+            headers={"Content-Disposition": "attachment; filename=reporte_ganancias.csv"}
+        )
 
     return send_file(
-        output,
+        reporte_xlsx(abonos),
         download_name="reporte_ganancias.xlsx",
+        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         as_attachment=True
     )
 
+LOTE_REPORTE = 5000
+# Filas de una hoja de Excel, menos el encabezado y el total
+MAX_FILAS_XLSX = 1048576 - 2
+
+def contar_abonos(c, fecha_inicio, fecha_fin):
+    c.execute("SELECT COUNT(*) FROM abonos WHERE fecha BETWEEN %s AND %s", (fecha_inicio, fecha_fin))
+    return c.fetchone()[0]
+
+SQL_CORTE = """
+    SELECT a.fecha, p.nombre, a.monto
+    FROM abonos a
+    JOIN prestamos p ON a.prestamo_id = p.id
+    WHERE a.fecha BETWEEN %s AND %s
+    ORDER BY a.fecha ASC
+"""
+
+def abonos_en_rango(fecha_inicio, fecha_fin):
+    # Cursor con nombre: Postgres entrega las filas por lotes y nunca
+    # se tiene el rango completo en memoria
+    with conexion() as conn:
+        c = conn.cursor(name="reporte_corte")
+        c.itersize = LOTE_REPORTE
+        c.execute(SQL_CORTE, (fecha_inicio, fecha_fin))
+
+        for fila in c:
+            yield fila
+
+        c.close()
+
+def reporte_csv(abonos):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    total_ganado = Decimal(0)
+
+    writer.writerow(["Fecha", "Cliente", "Monto"])
+
+    for fecha, nombre, monto in abonos:
+        total_ganado += monto
+        writer.writerow([fecha, nombre, monto])
+
+        # Enviar por bloques para no acumular el archivo
+        if buffer.tell() > 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    writer.writerow(["", "TOTAL GANADO", total_ganado])
+    yield buffer.getvalue()
+
+def reporte_mensual_csv(meses):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["Mes", "Total abonado"])
+    for mes, total in meses:
+        writer.writerow([f"{mes:%Y-%m}", total])
+    writer.writerow(["TOTAL GANADO", sum((total for _, total in meses), Decimal(0))])
+    return buffer.getvalue()
+
+def reporte_xlsx(abonos):
+    # Solo este reporte lo usa; no se carga al arrancar cada worker
+    import xlsxwriter
+
+    # constant_memory escribe cada fila a disco apenas se completa; el
+    # archivo final se arma en un temporal que send_file entrega por partes
+    salida = tempfile.TemporaryFile()
+    hoja_calculo = xlsxwriter.Workbook(salida, {"constant_memory": True})
+    hoja = hoja_calculo.add_worksheet("Reporte")
+    formato_fecha = hoja_calculo.add_format({"num_format": "yyyy-mm-dd"})
+    total_ganado = Decimal(0)
+
+    hoja.write_row(0, 0, ["Fecha", "Cliente", "Monto"])
+
+    fila = 0
+    for fila, (fecha, nombre, monto) in enumerate(abonos, start=1):
+        total_ganado += monto
+        hoja.write_datetime(fila, 0, fecha, formato_fecha)
+        hoja.write_string(fila, 1, nombre or "")
+        hoja.write_number(fila, 2, float(monto))
+
+    hoja.write_row(fila + 1, 0, ["", "TOTAL GANADO", float(total_ganado)])
+
+    hoja_calculo.close()
+    salida.seek(0)
+    return salida
+
 # =========================
-# CONEXIÓN
+# REPORTES DE CARTERA
 # =========================
-def get_connection():
-    return psycopg2.connect(DATABASE_URL)
+# /reportes/antiguedad?formato=xlsx
+# /reportes/recaudo_por_medio?desde=2024-01-01&hasta=2024-01-31&formato=csv
+# /reportes/interes_proyectado?meses=6       (JSON si no se indica formato)
+@bp.route("/reportes/<nombre>")
+@login_required
+def reporte(nombre):
+    formato = request.args.get("formato", "json")
+
+    try:
+        with conexion() as conn:
+            resultado = reportes.generar(conn.cursor(), nombre, request.args, datetime.now().date())
+    except reportes.ReporteInvalido as error:
+        return jsonify({"error": str(error)}), 400
+
+    if formato == "csv":
+        return Response(
+            reportes.a_csv(resultado),
+            mimetype="text/csv",
+            headers={"Content-Disposition": f"attachment; filename={nombre}.csv"}
+        )
 
+    if formato == "xlsx":
+        return send_file(
+            reportes.a_xlsx(resultado),
+            download_name=f"{nombre}.xlsx",
+            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            as_attachment=True
+        )
 
+    return jsonify(reportes.a_json(resultado))
 
 # =========================
-# INICIALIZAR BASE DE DATOS
+# MIGRACIONES
 # =========================
-def init_db():
-    conn = get_connection()
-    c = conn.cursor()
+# El esquema se crea y actualiza al desplegar, no al importar la app:
+# flask --app app migrar   (equivale a: python migraciones.py)
+@bp.cli.command("migrar")
+@click.option("--verificar-indices", is_flag=True)
+def comando_migrar(verificar_indices):
+    if verificar_indices:
+        if not migraciones.verificar_indices(click.echo):
+            raise SystemExit(1)
+        return
+    migraciones.migrar(click.echo)
+
+# Crea las particiones mensuales de abonos que falten (también corre en
+# cada migración): flask --app app particiones
+@bp.cli.command("particiones")
+def comando_particiones():
+    migraciones.mantener_particiones(click.echo)
 
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS prestamos (
-            id SERIAL PRIMARY KEY,
-            nombre TEXT,
-            cedula TEXT,
-            celular TEXT,
-            monto NUMERIC,
-            interes NUMERIC,
-            fecha_prestamo DATE,
-            fecha_pago DATE,
-            medio TEXT,
-            objeto TEXT,
-            pagado BOOLEAN DEFAULT FALSE,
-            tipo_prestamo TEXT DEFAULT 'fijo',
-            plazo_dias INTEGER DEFAULT 30
-        )
-    ''')
-
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS abonos (
-            id SERIAL PRIMARY KEY,
-            prestamo_id INTEGER REFERENCES prestamos(id) ON DELETE CASCADE,
-            fecha DATE,
-            monto NUMERIC
-        )
-    ''')
-
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS configuracion (
-            id SERIAL PRIMARY KEY,
-            mora_diaria NUMERIC
-        )
-    ''')
+# =========================
+# RESUMEN: RECONSTRUIR / VERIFICAR
+# =========================
+# flask --app app resumen verificar
+# flask --app app resumen reconstruir
+@bp.cli.command("resumen")
+@click.argument("accion", type=click.Choice(["verificar", "reconstruir"]))
+def comando_resumen(accion):
+    with conexion() as conn:
+        c = conn.cursor()
 
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS usuarios (
-            id SERIAL PRIMARY KEY,
-            usuario TEXT UNIQUE,
-            password TEXT
-        )
-    ''')
+        if accion == "reconstruir":
+            resumen.reconstruir(c)
+            resumen.nueva_version(c)
+            click.echo("Resumen reconstruido")
+            return
 
-    # Crear admin si no existe
-    c.execute("SELECT COUNT(*) FROM usuarios")
-    if c.fetchone()[0] == 0:
-        usuario = "admin"
-        password = generate_password_hash("Monteria12####")
-        c.execute(
-            "INSERT INTO usuarios (usuario, password) VALUES (%s, %s)",
-            (usuario, password)
-        )
+        diferencias = resumen.verificar(c)
 
-    c.execute("SELECT COUNT(*) FROM configuracion")
-    if c.fetchone()[0] == 0:
-        c.execute(
-            "INSERT INTO configuracion (mora_diaria) VALUES (%s)",
-            (0.5,)
-        )
+    for tabla, llave, guardado, esperado in diferencias:
+        click.echo(f"{tabla} {llave}: guardado={guardado} esperado={esperado}")
 
-    conn.commit()
-    conn.close()
+    if diferencias:
+        raise SystemExit(1)
+    click.echo("Resumen sin diferencias")
 
-init_db()
+# =========================
+# MÉTRICAS (PROMETHEUS)
+# =========================
+# Con METRICS_TOKEN definido se accede con "Authorization: Bearer <token>";
+# si no, requiere sesión iniciada. Los valores son del worker que responde.
+@bp.route("/metrics")
+def metrics():
+    if METRICS_TOKEN:
+        if request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+            return "No autorizado", 401
+    elif "usuario_id" not in session:
+        return redirect("/login")
+
+    return Response(metricas.exportar(), mimetype="text/plain; version=0.0.4")
 
 # =========================
 # LOGIN
 # =========================
-@app.route("/login", methods=["GET", "POST"])
+@bp.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
         usuario = request.form["usuario"]
         password = request.form["password"]
 
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute("SELECT id, password FROM usuarios WHERE usuario = %s", (usuario,))
-        user = c.fetchone()
-        conn.close()
+        with conexion() as conn:
+            c = conn.cursor()
+            c.execute("SELECT id, password FROM usuarios WHERE usuario = %s", (usuario,))
+            user = c.fetchone()
 
         if user and check_password_hash(user[1], password):
             session["usuario_id"] = user[0]
@@ -207,65 +332,102 @@ def login():
 # =========================
 # LOGOUT
 # =========================
-@app.route("/logout")
+@bp.route("/logout")
 @login_required
 def logout():
     session.clear()
     return redirect("/login")
 
+# =========================
+# CONCURRENCIA
+# =========================
+# Cada escritura de un préstamo bloquea su fila (SELECT ... FOR UPDATE)
+# hasta el commit y sube prestamos.version. Las páginas envían la versión
+# con la que mostraron el préstamo (?version= o un campo oculto): si otro
+# operador lo cambió mientras tanto, la acción no se aplica y se responde
+# 409. Sin versión (clientes de la API) solo se espera el bloqueo.
+MENSAJE_CONFLICTO = "El préstamo cambió mientras tanto. Recarga la página e intenta de nuevo."
+
+def bloquear_prestamo(c, id, columnas):
+    """Fila del préstamo bloqueada hasta el commit, con la versión al final."""
+    c.execute(f"SELECT {columnas}, version FROM prestamos WHERE id = %s FOR UPDATE", (id,))
+    return c.fetchone()
+
+def version_vigente(fila):
+    esperada = request.values.get("version", type=int)
+    return esperada is None or esperada == fila[-1]
+
+def conflicto(id, fila, mensaje=MENSAJE_CONFLICTO):
+    if request.args.get("formato") == "json":
+        return jsonify({"error": mensaje, "id": id, "version": fila[-1]}), 409
+    return Response(mensaje, status=409, mimetype="text/plain")
+
 # =========================
 # EDITAR PRESTAMO
 # =========================
-@app.route('/editar_prestamo/<int:id>', methods=['POST'])
+@bp.route('/editar_prestamo/<int:id>', methods=['POST'])
 @login_required
 def editar_prestamo(id):
-    conn = get_connection()
-    c = conn.cursor()
-
-    # 🔒 Verificar si está pagado
-    c.execute("SELECT pagado FROM prestamos WHERE id = %s", (id,))
-    resultado = c.fetchone()
-
-    if not resultado:
-        conn.close()
-        return redirect('/')
-
-    if resultado[0] == True:
-        conn.close()
-        return redirect('/')  # Bloquea edición si ya está pagado
-
-    # Si NO está pagado, permitir edición
-    c.execute("""
-        UPDATE prestamos
-        SET nombre = %s,
-            cedula = %s,
-            celular = %s,
-            monto = %s,
-            interes = %s,
-            fecha_prestamo = %s,
-            fecha_pago = %s,
-            medio = %s,
-            objeto = %s,
-            tipo_prestamo = %s,
-            plazo_dias = %s
-        WHERE id = %s
-    """, (
-        request.form['nombre'],
-        request.form['cedula'],
-        request.form['celular'],
-        float(request.form['monto']),
-        float(request.form['interes']),
-        request.form['fecha_prestamo'],
-        request.form['fecha_pago'],
-        request.form['medio'],
-        request.form['objeto'],
-        request.form['tipo_prestamo'],
-        int(request.form['plazo_dias'] or 30),
-        id
-    ))
-
-    conn.commit()
-    conn.close()
+    with conexion() as conn:
+        c = conn.cursor()
+
+        # 🔒 Verificar si está pagado (y bloquear la fila hasta confirmar)
+        resultado = bloquear_prestamo(c, id, "pagado, cliente_id")
+
+        if not resultado:
+            return redirect('/')
+
+        if resultado[0] == True:
+            return redirect('/')  # Bloquea edición si ya está pagado
+
+        # Otro operador lo editó después de abrir el formulario
+        if not version_vigente(resultado):
+            return conflicto(id, resultado)
+
+        # Si NO está pagado, permitir edición
+        resumen.quitar_prestamo(c, id)
+        nombre_norm = busqueda.normalizar(request.form['nombre'])
+        cliente_id = clientes.asignar(
+            c, request.form['cedula'], request.form['nombre'],
+            request.form['celular'], nombre_norm, actual=resultado[1]
+        )
+        c.execute("""
+            UPDATE prestamos
+            SET nombre = %s,
+                cedula = %s,
+                celular = %s,
+                monto = %s,
+                interes = %s,
+                fecha_prestamo = %s,
+                fecha_pago = %s,
+                medio = %s,
+                objeto = %s,
+                tipo_prestamo = %s,
+                plazo_dias = %s,
+                nombre_norm = %s,
+                cliente_id = %s,
+                version = version + 1
+            WHERE id = %s
+        """, (
+            request.form['nombre'],
+            request.form['cedula'],
+            request.form['celular'],
+            float(request.form['monto']),
+            float(request.form['interes']),
+            request.form['fecha_prestamo'],
+            request.form['fecha_pago'],
+            request.form['medio'],
+            request.form['objeto'],
+            request.form['tipo_prestamo'],
+            int(request.form['plazo_dias'] or 30),
+            nombre_norm,
+            cliente_id,
+            id
+        ))
+        # Primero los valores guardados: la exposición del cliente los usa
+        tareas.recalcular_prestamo(c, id, datetime.now().date(), configuracion.mora_vigente(c))
+        resumen.sumar_prestamo(c, id)
+        libro.registrar_condiciones(c, id, "edicion", datetime.now().date())
 
     return redirect('/')
 
@@ -273,96 +435,76 @@ def editar_prestamo(id):
 # =========================
 # 💰 MES PAGADO (solo indefinidos)
 # =========================
-@app.route("/mes_pagado/<int:id>")
+@bp.route("/mes_pagado/<int:id>")
 @login_required
 def mes_pagado(id):
-    conn = get_connection()
-    c = conn.cursor()
+    with conexion() as conn:
+        c = conn.cursor()
 
-    # Traer datos del préstamo
-    c.execute("SELECT monto, interes, tipo_prestamo FROM prestamos WHERE id = %s", (id,))
-    prestamo = c.fetchone()
+        # Traer datos del préstamo
+        prestamo = bloquear_prestamo(c, id, "monto, interes, tipo_prestamo, fecha_prestamo")
 
-    if not prestamo:
-        conn.close()
-        return redirect("/")
+        if not prestamo:
+            return redirect("/")
 
-    capital = float(prestamo[0])
-    interes = float(prestamo[1])
-    tipo = prestamo[2]
+        # Un segundo clic (u otro operador) no vuelve a cobrar el mes
+        if not version_vigente(prestamo):
+            return conflicto(id, prestamo)
 
-    # Solo aplicar si es indefinido
-    if tipo != "indefinido":
-        conn.close()
-        return redirect("/")
+        capital = float(prestamo[0])
+        interes = float(prestamo[1])
+        tipo = prestamo[2]
+        fecha_anterior = prestamo[3]
 
-    # Calcular interés mensual
-    interes_mes = capital * (interes / 100)
+        # Solo aplicar si es indefinido
+        if tipo != "indefinido":
+            return redirect("/")
 
-    hoy = datetime.now().date()
+        # Calcular interés mensual
+        interes_mes = capital * (interes / 100)
 
-    # Registrar el pago del mes como abono
-    c.execute(
-        "INSERT INTO abonos (prestamo_id, fecha, monto) VALUES (%s, %s, %s)",
-        (id, hoy, interes_mes)
-    )
+        hoy = datetime.now().date()
 
-    # Reiniciar contador cambiando fecha_prestamo a hoy
-    c.execute(
-        "UPDATE prestamos SET fecha_prestamo = %s WHERE id = %s",
-        (hoy, id)
-    )
+        # Registrar el pago del mes como abono
+        resumen.registrar_abono(c, id, hoy, interes_mes)
 
-    conn.commit()
-    conn.close()
+        # Reiniciar contador cambiando fecha_prestamo a hoy
+        resumen.quitar_prestamo(c, id)
+        c.execute(
+            "UPDATE prestamos SET fecha_prestamo = %s, version = version + 1 WHERE id = %s",
+            (hoy, id)
+        )
+        tareas.recalcular_prestamo(c, id, hoy, configuracion.mora_vigente(c))
+        resumen.sumar_prestamo(c, id)
+        libro.registrar(c, id, "reinicio_ciclo", hoy, {"fecha_anterior": str(fecha_anterior)})
 
     # Ir directo al dashboard
     return redirect("/estadisticas")
 # =========================
 # GANANCIAS
 # =========================
-@app.route('/estadisticas')
+@bp.route('/estadisticas')
 @login_required
+@vistas.cacheada
 def estadisticas():
-    conn = get_connection()
-    c = conn.cursor()
-
-    # Capital total prestado
-    c.execute("SELECT COALESCE(SUM(monto),0) FROM prestamos")
-    total_prestado = float(c.fetchone()[0])
-
-    # Total abonos recibidos
-    c.execute("SELECT COALESCE(SUM(monto),0) FROM abonos")
-    total_abonos = float(c.fetchone()[0])
-
-    # Intereses generados (solo préstamos activos)
-    c.execute("SELECT id, monto, interes, fecha_prestamo, tipo_prestamo, plazo_dias FROM prestamos")
-    prestamos = c.fetchall()
-
-    total_interes_generado = 0
-
-    for p in prestamos:
-        capital = float(p[1])
-        interes_porcentaje = float(p[2])
-        fecha_prestamo = p[3]
-        tipo = p[4]
+    with conexion() as conn:
+        c = conn.cursor()
 
         hoy = datetime.now().date()
-        dias = (hoy - fecha_prestamo).days
+        mora_diaria = configuracion.mora_diaria(c)
+        cierre = tareas.ultimo_cierre(c)
 
-        if tipo == "fijo":
-            interes = capital * (interes_porcentaje / 100)
+        # Sumas sobre la instantánea del worker, o los totales mantenidos
+        # en cada escritura (ver resumen.py)
+        if instantanea.ACTIVA:
+            totales = instantanea.totales(instantanea.actualizar(c), mora_diaria, hoy)
         else:
-            ciclos = dias // 30
-            interes = capital * (interes_porcentaje / 100) * (ciclos + 1)
-
-        total_interes_generado += interes
+            totales = resumen.leer_totales(c, hoy)
 
-    # Capital pendiente en la calle
-    c.execute("SELECT COALESCE(SUM(monto),0) FROM prestamos WHERE pagado = FALSE")
-    capital_en_calle = float(c.fetchone()[0])
-
-    conn.close()
+    total_prestado = float(totales["total_prestado"])
+    total_abonos = float(totales["total_abonos"])
+    total_interes_generado = float(totales["total_interes"])
+    capital_en_calle = float(totales["capital_en_calle"])
 
     ganancia_real = total_abonos + total_prestado
     ganancia_proyectada = total_interes_generado
@@ -373,169 +515,512 @@ def estadisticas():
         total_interes=round(total_interes_generado,2),
         capital_en_calle=round(capital_en_calle,2),
         ganancia_real=round(ganancia_real,2),
-        ganancia_proyectada=round(ganancia_proyectada,2)
+        ganancia_proyectada=round(ganancia_proyectada,2),
+        mora_diaria=mora_diaria,
+        max_mora_diaria=configuracion.MAX_MORA_DIARIA,
+        cierre=cierre
     )
 
 # =========================
-# CALCULAR MORA
+# CONFIGURACIÓN DE MORA
 # =========================
-def calcular_mora(base, fecha_vencimiento, pagado):
-    if pagado:
-        return 0, 0
+@bp.route('/configuracion', methods=['POST'])
+@login_required
+def cambiar_configuracion():
+    try:
+        mora_diaria = float(request.form['mora_diaria'])
+    except ValueError:
+        return "La mora diaria debe ser un número"
 
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT mora_diaria FROM configuracion LIMIT 1")
-    mora_porcentaje = float(c.fetchone()[0])
-    conn.close()
+    # float() también acepta "nan" e "inf"
+    if not math.isfinite(mora_diaria):
+        return "La mora diaria debe ser un número"
 
-    hoy = datetime.now().date()
-    if hoy > fecha_vencimiento:
-        dias_vencidos = (hoy - fecha_vencimiento).days
-        mora = base * (mora_porcentaje / 100) * dias_vencidos
-        return round(mora, 2), dias_vencidos
+    if mora_diaria < 0:
+        return "La mora diaria no puede ser negativa"
+
+    if mora_diaria > configuracion.MAX_MORA_DIARIA:
+        return f"La mora diaria no puede ser mayor que {configuracion.MAX_MORA_DIARIA}%"
+
+    with conexion() as conn:
+        c = conn.cursor()
+        configuracion.cambiar_mora_diaria(c, mora_diaria)
+
+        # La mora guardada por el cierre de hoy se recalcula con la tasa nueva
+        hoy = datetime.now().date()
+        if tareas.al_dia(c, hoy):
+            tareas.cerrar_dia(c, hoy, mora_diaria)
 
-    return 0, 0
+    # Solo después de confirmar, para que nadie vuelva a cachear el valor viejo
+    configuracion.invalidar()
+
+    return redirect('/estadisticas')
 
 # =========================
 # INDEX
 # =========================
-@app.route('/')
+COLUMNAS_INDEX = [
+    "id", "nombre", "cedula", "celular", "monto", "interes",
+    "fecha_prestamo", "fecha_pago", "medio", "objeto", "pagado",
+    "tipo_prestamo", "plazo_dias", "total_abonos", "version"
+]
+
+POR_PAGINA = 50
+
+# Ordenamientos permitidos: columna calculada y dirección
+ORDENES = {
+    "id": ("id", "ASC"),
+    "deuda": ("deuda_restante", "DESC"),
+    "dias": ("dias_vencidos", "DESC"),
+}
+
+# Una página de la cartera con las fórmulas de calculos.py en SQL, para
+# poder filtrar, ordenar y paginar en la base de datos
+SQL_CARTERA = """
+    SELECT id, nombre, cedula, celular, monto, interes,
+           fecha_prestamo, fecha_pago, medio, objeto, pagado,
+           tipo_prestamo, plazo_dias, total_abonos, version, {orden}
+    FROM (""" + calculos.SQL_CARTERA.format(
+    columnas="""p.id, p.nombre, p.cedula, p.celular, p.monto, p.interes,
+           p.fecha_prestamo, p.fecha_pago, p.medio, p.objeto, p.pagado,
+           p.tipo_prestamo, p.plazo_dias,
+           COALESCE(r.total_abonos, 0) AS total_abonos, p.version,
+           d.dias_vencidos, s.deuda_restante""",
+    filtro="{filtros}",
+) + """) cartera
+    WHERE {cursor}
+    ORDER BY {orden} {direccion}, id {direccion}
+    LIMIT %(limite)s
+"""
+
+# Préstamos vencidos: con el cierre de hoy (tareas.py) sirve el índice
+# sobre dias_vencidos guardado; si no, se compara el vencimiento
+VENCIDOS_GUARDADO = "p.dias_vencidos > 0"
+VENCIDOS_VIVO = """p.tipo_prestamo = 'fijo' AND p.pagado = FALSE
+                   AND p.fecha_prestamo + COALESCE(p.plazo_dias, 30) < %(hoy)s"""
+
+def leer_filtros(args):
+    orden = args.get("orden", "id")
+    return {
+        "estado": args.get("estado", ""),
+        "tipo": args.get("tipo", ""),
+        "vencidos": args.get("vencidos", ""),
+        "q": args.get("q", "").strip(),
+        "orden": orden if orden in ORDENES else "id",
+    }
+
+def leer_cursor(despues, columna):
+    """
+    Paginación por llave: "id" o "valor_id" del último registro visto ->
+    (valor, id), con valor None si se ordena por id. None si no hay cursor.
+    """
+    if not despues:
+        return None
+    try:
+        if columna == "id":
+            return None, int(despues)
+        valor, ultimo_id = despues.rsplit("_", 1)
+        return Decimal(valor), int(ultimo_id)
+    except (ValueError, ArithmeticError):
+        return None
+
+def sql_pagina(filtros, cursor, mora_porcentaje, hoy, vencidos_guardados):
+    """
+    (sql, params) de una página del listado; con vencidos_guardados el
+    filtro de vencidos usa el cierre de hoy (tareas.al_dia). También la
+    usa migraciones.verificar_indices.
+    """
+    columna, direccion = ORDENES[filtros["orden"]]
+    params = {"hoy": hoy, "mora": mora_porcentaje, "limite": POR_PAGINA + 1}
+    condiciones = ["TRUE"]
+
+    if filtros["estado"] == "pendientes":
+        condiciones.append("p.pagado = FALSE")
+    elif filtros["estado"] == "pagados":
+        condiciones.append("p.pagado = TRUE")
+
+    if filtros["tipo"] in ("fijo", "indefinido"):
+        condiciones.append("p.tipo_prestamo = %(tipo)s")
+        params["tipo"] = filtros["tipo"]
+
+    if filtros["vencidos"]:
+        condiciones.append(VENCIDOS_GUARDADO if vencidos_guardados else VENCIDOS_VIVO)
+
+    if filtros["q"]:
+        condiciones.append(busqueda.condicion(filtros["q"], params))
+
+    comparador = ">" if direccion == "ASC" else "<"
+
+    cursor_sql = "TRUE"
+    if cursor:
+        params["despues_valor"], params["despues_id"] = cursor
+        if columna == "id":
+            cursor_sql = f"id {comparador} %(despues_id)s"
+        else:
+            cursor_sql = f"({columna}, id) {comparador} (%(despues_valor)s, %(despues_id)s)"
+
+    return SQL_CARTERA.format(
+        filtros=" AND ".join(condiciones),
+        orden=columna,
+        direccion=direccion,
+        cursor=cursor_sql
+    ), params
+
+def consultar_pagina(c, filtros, despues, mora_porcentaje, hoy):
+    columna, direccion = ORDENES[filtros["orden"]]
+    cursor = leer_cursor(despues, columna)
+
+    # Desde los arreglos del worker (ver instantanea.py)
+    if instantanea.ACTIVA:
+        return instantanea.pagina(
+            instantanea.actualizar(c), filtros, (columna, direccion), cursor,
+            POR_PAGINA, mora_porcentaje, hoy, COLUMNAS_INDEX
+        )
+
+    vencidos_guardados = bool(filtros["vencidos"]) and tareas.al_dia(c, hoy)
+    c.execute(*sql_pagina(filtros, cursor, mora_porcentaje, hoy, vencidos_guardados))
+    filas = c.fetchall()
+
+    siguiente = None
+    if len(filas) > POR_PAGINA:
+        filas = filas[:POR_PAGINA]
+        ultimo = filas[-1]
+        siguiente = str(ultimo[0]) if columna == "id" else f"{ultimo[-1]}_{ultimo[0]}"
+
+    # Se descarta la columna de orden agregada al final
+    return [fila[:len(COLUMNAS_INDEX)] for fila in filas], siguiente
+
+@bp.route('/')
 @login_required
+@vistas.cacheada
 def index():
-    conn = get_connection()
-    c = conn.cursor()
+    filtros = leer_filtros(request.args)
+    hoy = datetime.now().date()
+
+    with conexion() as conn:
+        c = conn.cursor()
 
-    c.execute("SELECT * FROM prestamos")
-    prestamos = c.fetchall()
+        # Tasa de mora desde la caché del worker
+        mora_porcentaje = configuracion.mora_diaria(c)
 
-    prestamos_procesados = []
+        # Una página de préstamos con la suma de sus abonos
+        prestamos, siguiente = consultar_pagina(
+            c, filtros, request.args.get("despues"), mora_porcentaje, hoy
+        )
 
-    for p in prestamos:
-        prestamo_id = p[0]
+    return render_template('index.html',
+        prestamos=procesar_prestamos(prestamos, mora_porcentaje, hoy),
+        filtros=filtros,
+        siguiente=siguiente
+    )
 
-        c.execute("SELECT COALESCE(SUM(monto),0) FROM abonos WHERE prestamo_id = %s", (prestamo_id,))
-        total_abonos = float(c.fetchone()[0])
+def procesar_prestamos(prestamos, mora_porcentaje, hoy):
+    """Filas de COLUMNAS_INDEX -> diccionarios que usa _fila_prestamo.html."""
+    datos = columnas(prestamos, COLUMNAS_INDEX)
+    calculo = calcular_cartera(datos, mora_porcentaje, hoy)
 
-        fecha_prestamo = p[6]
-        hoy = datetime.now().date()
-        dias_transcurridos = (hoy - fecha_prestamo).days
-        capital = float(p[4])
-        interes_porcentaje = float(p[5])
-        pagado = p[10]
-
-        if p[11] == "fijo":
-            fecha_vencimiento = fecha_prestamo + timedelta(days=p[12])
-            interes = capital * (interes_porcentaje / 100)
-            base = capital + interes
-            mora, dias = calcular_mora(base, fecha_vencimiento, pagado)
-            total_deuda = base + mora
-            deuda_restante = max(total_deuda - total_abonos, 0)
-            dias_restantes = (fecha_vencimiento - hoy).days
-        else:
-            ciclos = dias_transcurridos // 30
-            interes = capital * (interes_porcentaje / 100) * (ciclos + 1)
-            total_deuda = capital + interes
-            mora = 0
-            dias = 0
-            dias_restantes = "∞"
-            deuda_restante = max(total_deuda - total_abonos, 0)
+    mora = calculo["mora"].tolist()
+    dias = calculo["dias_vencidos"].tolist()
+    dias_restantes = calculo["dias_restantes"].tolist()
+    deuda_restante = calculo["deuda_restante"].tolist()
+
+    prestamos_procesados = []
+
+    for i, p in enumerate(prestamos):
+        fijo = p[11] == "fijo"
 
         prestamos_procesados.append({
             "id": p[0],
             "nombre": p[1],
             "cedula": p[2],
             "celular": p[3],
-            "monto": capital,
-            "interes": interes_porcentaje,
+            "monto": float(p[4]),
+            "interes": float(p[5]),
             "fecha_prestamo": p[6],
             "fecha_pago": p[7],
             "medio": p[8],
             "objeto": p[9],
-            "pagado": pagado,
+            "pagado": p[10],
             "tipo_prestamo": p[11],
-            "mora": mora,
-            "dias": dias,
-            "dias_restantes": dias_restantes,
-            "total": round(deuda_restante, 2)
+            "version": p[14],
+            "mora": mora[i] if fijo else 0,
+            "dias": dias[i],
+            "dias_restantes": dias_restantes[i] if fijo else "∞",
+            "total": deuda_restante[i]
         })
 
-    conn.close()
-    return render_template('index.html', prestamos=prestamos_procesados)
+    return prestamos_procesados
+
+# =========================
+# FILA DE UN PRÉSTAMO (API)
+# =========================
+# La página reemplaza solo la fila que cambió:
+# {"id", "version" (del préstamo), "version_datos", "html"}
+SQL_PRESTAMO = """
+    SELECT p.id, p.nombre, p.cedula, p.celular, p.monto, p.interes,
+           p.fecha_prestamo, p.fecha_pago, p.medio, p.objeto, p.pagado,
+           p.tipo_prestamo, p.plazo_dias,
+           COALESCE(r.total_abonos, 0), p.version
+    FROM prestamos p
+    LEFT JOIN resumen_prestamos r ON r.prestamo_id = p.id
+    WHERE p.id = %s
+"""
+
+def fila_prestamo_json(id):
+    hoy = datetime.now().date()
+
+    with conexion() as conn:
+        c = conn.cursor()
+        c.execute(SQL_PRESTAMO, (id,))
+        prestamo = c.fetchone()
+        if not prestamo:
+            return jsonify({"error": "Préstamo no encontrado"}), 404
+
+        mora_porcentaje = configuracion.mora_diaria(c)
+        version_datos = resumen.leer_version(c)
+
+    p = procesar_prestamos([prestamo], mora_porcentaje, hoy)[0]
+    return jsonify({
+        "id": id,
+        "version": p["version"],
+        "version_datos": version_datos,
+        "html": render_template('_fila_prestamo.html', p=p),
+    })
+
+@bp.route('/api/prestamos/<int:id>')
+@login_required
+def api_prestamo(id):
+    return fila_prestamo_json(id)
+
+# =========================
+# BUSCAR
+# =========================
+# /buscar?q=ana%20pe        nombre por prefijos de palabra, sin tildes
+# /buscar?q=1032            prefijo de cédula o celular
+# Con formato=json devuelve la lista para usarla desde el formulario
+@bp.route('/buscar')
+@login_required
+def buscar():
+    q = request.args.get("q", "").strip()
+    resultados = []
+
+    if q:
+        with conexion() as conn:
+            c = conn.cursor()
+            if instantanea.ACTIVA:
+                resultados = instantanea.buscar(instantanea.actualizar(c), q)
+            else:
+                resultados = busqueda.buscar(c, q)
+
+    if request.args.get("formato") == "json":
+        return jsonify([dict(r, monto=float(r["monto"])) for r in resultados])
+
+    return render_template('buscar.html', q=q, resultados=resultados)
+
+# =========================
+# CLIENTES
+# =========================
+# /clientes?orden=deuda|capital|vencidos|prestamos, paginado como el índice
+@bp.route('/clientes')
+@login_required
+@vistas.cacheada
+def ver_clientes():
+    orden = request.args.get("orden", "deuda")
+    if orden not in clientes.ORDENES:
+        orden = "deuda"
+
+    with conexion() as conn:
+        filas, siguiente = clientes.pagina(
+            conn.cursor(), orden, request.args.get("despues"), POR_PAGINA
+        )
+
+    return render_template('clientes.html',
+        clientes=filas,
+        orden=orden,
+        ordenes=list(clientes.ORDENES),
+        siguiente=siguiente
+    )
+
+
+# Consultado por el formulario de registro al escribir la cédula
+@bp.route('/clientes/exposicion')
+@login_required
+def exposicion_cliente():
+    with conexion() as conn:
+        datos = clientes.exposicion(conn.cursor(), request.args.get("cedula", ""))
+    return jsonify(datos)
+
+# =========================
+# LIBRO DEL PRÉSTAMO
+# =========================
+FILAS_POR_PAGINA_LIBRO = 100
+
+@bp.route('/prestamo/<int:id>')
+@login_required
+@vistas.cacheada
+def ver_prestamo(id):
+    desde = max(request.args.get("desde", 0, type=int), 0)
+    hoy = datetime.now().date()
+
+    with conexion() as conn:
+        c = conn.cursor()
+        c.execute(SQL_PRESTAMO, (id,))
+        prestamo = c.fetchone()
+
+        if not prestamo:
+            return redirect('/')
+
+        mora_porcentaje = configuracion.mora_diaria(c)
+        cronograma = libro.cronograma(c, id, hoy, mora_porcentaje)
+
+    filas, hay_mas = cronograma.filas(desde, FILAS_POR_PAGINA_LIBRO)
+    calculo = calcular_cartera(columnas([prestamo], COLUMNAS_INDEX), mora_porcentaje, hoy)
+
+    return render_template('prestamo.html',
+        p=dict(zip(COLUMNAS_INDEX, prestamo)),
+        deuda=calculo["deuda_restante"].item(),
+        mora=calculo["mora"].item() if prestamo[11] == "fijo" else 0,
+        movimientos=filas,
+        desde=desde,
+        anterior=max(desde - FILAS_POR_PAGINA_LIBRO, 0) if desde else None,
+        siguiente=desde + FILAS_POR_PAGINA_LIBRO if hay_mas else None
+    )
 
 # =========================
 # AGREGAR
 # =========================
-@app.route('/agregar', methods=['POST'])
+@bp.route('/agregar', methods=['POST'])
 @login_required
 def agregar():
-    conn = get_connection()
-    c = conn.cursor()
-
-    c.execute('''
-        INSERT INTO prestamos
-        (nombre, cedula, celular, monto, interes, fecha_prestamo, fecha_pago, medio, objeto, tipo_prestamo, plazo_dias)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-    ''', (
-        request.form['nombre'],
-        request.form['cedula'],
-        request.form['celular'],
-        float(request.form['monto']),
-        float(request.form['interes']),
-        request.form['fecha_prestamo'],
-        request.form['fecha_pago'],
-        request.form['medio'],
-        request.form['objeto'],
-        request.form['tipo_prestamo'],
-        int(request.form['plazo_dias'] or 30)
-    ))
-
-    conn.commit()
-    conn.close()
+    with conexion() as conn:
+        c = conn.cursor()
+
+        # asignar bloquea el cliente: primero la cartera (orden en resumen.py)
+        resumen.bloquear_cartera(c)
+        nombre_norm = busqueda.normalizar(request.form['nombre'])
+        cliente_id = clientes.asignar(
+            c, request.form['cedula'], request.form['nombre'],
+            request.form['celular'], nombre_norm
+        )
+
+        c.execute('''
+            INSERT INTO prestamos
+            (nombre, cedula, celular, monto, interes, fecha_prestamo, fecha_pago, medio, objeto, tipo_prestamo, plazo_dias, nombre_norm, cliente_id)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            RETURNING id
+        ''', (
+            request.form['nombre'],
+            request.form['cedula'],
+            request.form['celular'],
+            float(request.form['monto']),
+            float(request.form['interes']),
+            request.form['fecha_prestamo'],
+            request.form['fecha_pago'],
+            request.form['medio'],
+            request.form['objeto'],
+            request.form['tipo_prestamo'],
+            int(request.form['plazo_dias'] or 30),
+            nombre_norm,
+            cliente_id
+        ))
+        prestamo_id = c.fetchone()[0]
+        tareas.recalcular_prestamo(c, prestamo_id, datetime.now().date(), configuracion.mora_vigente(c))
+        resumen.sumar_prestamo(c, prestamo_id)
+        libro.registrar_condiciones(c, prestamo_id, "desembolso")
+
     return redirect('/')
 
 # =========================
 # ABONAR
 # =========================
-@app.route('/abonar/<int:id>', methods=['POST'])
+@bp.route('/abonar/<int:id>', methods=['POST'])
 @login_required
 def abonar(id):
-    conn = get_connection()
-    c = conn.cursor()
+    # Los abonos solo se suman, así que no se compara la versión: dos
+    # operadores pueden abonar al mismo préstamo a la vez
+    with conexion() as conn:
+        c = conn.cursor()
 
-    c.execute(
-        "INSERT INTO abonos (prestamo_id, fecha, monto) VALUES (%s, %s, %s)",
-        (id, datetime.now().date(), float(request.form['abono']))
-    )
+        resumen.registrar_abono(c, id, datetime.now().date(), float(request.form['abono']))
+
+    # Desde el listado: solo la fila actualizada
+    if request.args.get("formato") == "json":
+        return fila_prestamo_json(id)
 
-    conn.commit()
-    conn.close()
     return redirect('/')
 
+# =========================
+# ABONOS POR LOTE (API)
+# =========================
+# POST JSON {"abonos": [{"prestamo_id": 1, "fecha": "2024-01-31", "monto": 5000}]}
+# o CSV con encabezado prestamo_id,fecha,monto. El encabezado
+# Idempotency-Key hace seguro reintentar el mismo lote.
+@bp.route('/api/abonos', methods=['POST'])
+@login_required
+def abonos_por_lote():
+    clave = request.headers.get("Idempotency-Key")
+
+    try:
+        filas = lotes.leer_filas(request)
+        with conexion() as conn:
+            c = conn.cursor()
+            resultado = lotes.procesar(c, filas, clave, datetime.now().date())
+    except lotes.LoteInvalido as error:
+        return jsonify({"error": str(error)}), 400
+
+    return jsonify(resultado)
+
 # =========================
 # PAGAR
 # =========================
-@app.route('/pagar/<int:id>')
+@bp.route('/pagar/<int:id>')
 @login_required
 def pagar(id):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("UPDATE prestamos SET pagado = TRUE WHERE id = %s", (id,))
-    conn.commit()
-    conn.close()
+    with conexion() as conn:
+        c = conn.cursor()
+        resultado = bloquear_prestamo(c, id, "pagado")
+        if not resultado or resultado[0]:
+            return redirect('/')
+
+        if not version_vigente(resultado):
+            return conflicto(id, resultado)
+
+        hoy = datetime.now().date()
+        mora_porcentaje = configuracion.mora_vigente(c)
+
+        # Solo se marca pagado sin saldo: lo que falte se registra antes
+        # como abono
+        c.execute(SQL_PRESTAMO, (id,))
+        calculo = calcular_cartera(columnas([c.fetchone()], COLUMNAS_INDEX), mora_porcentaje, hoy)
+        deuda = calculo["deuda_restante"].item()
+        if deuda > 0:
+            return conflicto(id, resultado, (
+                f"Al préstamo le faltan {formato_cop(deuda)} por pagar. "
+                "Registre el abono antes de marcarlo como pagado."
+            ))
+
+        resumen.quitar_prestamo(c, id)
+        c.execute("UPDATE prestamos SET pagado = TRUE, version = version + 1 WHERE id = %s", (id,))
+        tareas.recalcular_prestamo(c, id, hoy, mora_porcentaje)
+        resumen.sumar_prestamo(c, id)
+        libro.registrar(c, id, "pagado", hoy)
     return redirect('/')
 
 # =========================
 # ELIMINAR
 # =========================
-@app.route('/eliminar/<int:id>')
+@bp.route('/eliminar/<int:id>')
 @login_required
 def eliminar(id):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("DELETE FROM prestamos WHERE id = %s", (id,))
-    conn.commit()
-    conn.close()
+    with conexion() as conn:
+        c = conn.cursor()
+        resultado = bloquear_prestamo(c, id, "id")
+        if resultado:
+            if not version_vigente(resultado):
+                return conflicto(id, resultado)
+            resumen.quitar_prestamo(c, id)
+            resumen.quitar_abonos_de_prestamo(c, id)
+            c.execute("DELETE FROM prestamos WHERE id = %s", (id,))
     return redirect('/')
 
 # =========================
@@ -543,4 +1028,4 @@ def eliminar(id):
 # =========================
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 10000))
-    app.run(host='0.0.0.0', port=port)
\ No newline at end of file
+    create_app().run(host='0.0.0.0', port=port)
\ No newline at end of file
@@ -0,0 +1,870 @@
+import argparse
+import http.cookiejar
+import io
+import logging
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date, timedelta
+
+# =========================
+# BENCHMARK
+# =========================
+# Siembra una base local con datos de prueba y mide las consultas de la app.
+# Nunca usa DATABASE_URL: la base se indica con --url o BENCH_DATABASE_URL,
+# porque sembrar escribe miles de filas.
+#
+#   python benchmark.py postgres --datos /tmp/bench    (imprime la URL)
+#   python benchmark.py --url postgresql://localhost/bench sembrar --prestamos 1000000
+#   python benchmark.py --url postgresql://localhost/bench busqueda
+#   python benchmark.py --url postgresql://localhost/bench instantanea
+#   python benchmark.py --url postgresql://localhost/bench carga --segundos 60
+#   python benchmark.py --url postgresql://localhost/bench corte --abonos 1000000
+#   python benchmark.py arranque          (no usa la base)
+#   python benchmark.py motor --prestamos 100000    (no usa la base)
+#
+# carga sin --servidor levanta la app en el mismo proceso; con --servidor
+# mide un gunicorn ya corriendo contra la misma base, por ejemplo:
+#
+#   DATABASE_URL=... gunicorn --preload -w 4 --threads 4 "app:create_app()"
+#   python benchmark.py --url ... carga --servidor http://127.0.0.1:8000 --concurrencia 32
+#
+# Una versión anterior de la app no tiene todas las rutas de la mezcla; con
+# --rutas se miden las dos versiones solo sobre las que comparten:
+#
+#   python benchmark.py --url ... carga --servidor ... --rutas "/,/estadisticas"
+
+NOMBRES = [
+    "José", "María", "Ana", "Luis", "Carlos", "Andrés", "Sofía", "Valentina",
+    "Camilo", "Daniela", "Juan", "Paola", "Jesús", "Ángela", "Óscar", "Natalia",
+    "Felipe", "Mónica", "Sebastián", "Lucía", "Héctor", "Diana", "Iván", "Verónica",
+    "Alejandro", "Catalina", "Jorge", "Marcela", "Fernando", "Gloria", "Ricardo",
+    "Liliana", "Mauricio", "Adriana", "Hernán", "Beatriz", "Jairo", "Claudia",
+    "Wilson", "Yolanda", "Édgar", "Sandra", "Fabián", "Luz", "Álvaro", "Rosa",
+    "Germán", "Patricia", "Nicolás", "Juliana", "Santiago", "Isabella", "Mateo",
+    "Mariana", "Samuel", "Gabriela", "Emilio", "Tatiana", "Ramiro", "Esperanza",
+]
+APELLIDOS = [
+    "Pérez", "Gómez", "Núñez", "Rodríguez", "Martínez", "Hernández", "López",
+    "García", "Díaz", "Sánchez", "Ramírez", "Torres", "Muñoz", "Álvarez",
+    "Jiménez", "Castaño", "Peña", "Ospina", "Cárdenas", "Vélez", "Suárez",
+    "Quintero", "Londoño", "Córdoba", "Rincón", "Zuluaga", "Benítez", "Ávila",
+    "Moreno", "Rojas", "Vargas", "Castro", "Ortiz", "Rubio", "Mejía", "Restrepo",
+    "Giraldo", "Arango", "Betancur", "Cardona", "Escobar", "Franco", "Galeano",
+    "Henao", "Isaza", "Jaramillo", "Marín", "Naranjo", "Osorio", "Patiño",
+    "Quiroga", "Salazar", "Tobón", "Uribe", "Valencia", "Zapata", "Agudelo",
+    "Bedoya", "Cano", "Duque", "Echeverri", "Flórez", "Gaviria", "Hoyos",
+    "Ibarra", "Lozano", "Montoya", "Nieto", "Orozco", "Palacio", "Ríos",
+    "Serna", "Trujillo", "Urrego", "Villa", "Yepes", "Ruiz", "Acosta",
+]
+MEDIOS = ["Efectivo", "Nequi", "Daviplata", "Bancolombia"]
+
+
+def _percentiles(tiempos):
+    tiempos = sorted(tiempos)
+    def p(q):
+        return tiempos[min(int(len(tiempos) * q), len(tiempos) - 1)] * 1000
+    return p(0.50), p(0.95), p(0.99)
+
+
+# =========================
+# SEMBRAR
+# =========================
+def _nombre(rnd):
+    return (
+        f"{rnd.choice(NOMBRES)} {rnd.choice(NOMBRES)} "
+        f"{rnd.choice(APELLIDOS)} {rnd.choice(APELLIDOS)}"
+    )
+
+
+# Uno de cada tantos préstamos es de un cliente que ya tenía otro
+CLIENTES_REPETIDOS = 0.2
+PLAZOS = [15, 30, 60, 90]
+
+
+def _fecha_prestamo(rnd, hoy, fijo, pagado, plazo, vencidos):
+    # Entre los fijos sin pagar, la proporción `vencidos` ya pasó su plazo
+    if fijo and not pagado:
+        if rnd.random() < vencidos:
+            return hoy - timedelta(days=plazo + rnd.randint(1, 180))
+        return hoy - timedelta(days=rnd.randint(0, plazo - 1))
+    return hoy - timedelta(days=rnd.randint(0, 720))
+
+
+def sembrar(prestamos, semilla=1, abonos=3, fijos=0.6, vencidos=0.25, pagados=0.3,
+            lote=100000):
+    """
+    Agrega `prestamos` préstamos con en promedio `abonos` abonos cada uno.
+    `fijos` es la proporción con plazo, `pagados` la de pagados y
+    `vencidos` la de fijos sin pagar que ya pasaron su plazo.
+    """
+    from db import conexion
+    import busqueda
+    import clientes
+    import configuracion
+    import libro
+    import particiones
+    import resumen
+    import tareas
+
+    rnd = random.Random(semilla)
+    hoy = date.today()
+    conocidos = []
+
+    with conexion() as conn:
+        c = conn.cursor()
+        c.execute("SELECT COALESCE(MAX(id), 0) FROM prestamos")
+        desde = c.fetchone()[0]
+
+        creados = 0
+        while creados < prestamos:
+            buffer = io.StringIO()
+            for _ in range(min(lote, prestamos - creados)):
+                if conocidos and rnd.random() < CLIENTES_REPETIDOS:
+                    nombre, cedula, celular = rnd.choice(conocidos)
+                else:
+                    nombre = _nombre(rnd)
+                    cedula = str(rnd.randint(10_000_000, 1_999_999_999))
+                    celular = "3" + str(rnd.randint(0, 999_999_999)).zfill(9)
+                    # Una muestra basta para repetir clientes
+                    if len(conocidos) < 10000:
+                        conocidos.append((nombre, cedula, celular))
+
+                fijo = rnd.random() < fijos
+                pagado = rnd.random() < pagados
+                plazo = rnd.choice(PLAZOS)
+                fecha = _fecha_prestamo(rnd, hoy, fijo, pagado, plazo, vencidos)
+                buffer.write("\t".join([
+                    nombre,
+                    cedula,
+                    celular,
+                    str(rnd.choice([100000, 200000, 500000, 1000000, 2500000])),
+                    str(rnd.choice([5, 10, 15, 20])),
+                    fecha.isoformat(),
+                    (fecha + timedelta(days=plazo)).isoformat(),
+                    rnd.choice(MEDIOS),
+                    "",
+                    "t" if pagado else "f",
+                    "fijo" if fijo else "indefinido",
+                    str(plazo),
+                    busqueda.normalizar(nombre),
+                ]) + "\n")
+            buffer.seek(0)
+            c.copy_expert("""
+                COPY prestamos (nombre, cedula, celular, monto, interes, fecha_prestamo,
+                                fecha_pago, medio, objeto, pagado, tipo_prestamo,
+                                plazo_dias, nombre_norm)
+                FROM STDIN
+            """, buffer)
+            creados += min(lote, prestamos - creados)
+            print(f"{creados} préstamos", flush=True)
+
+        # Abonos entre la fecha del préstamo y hoy, de medio a uno y medio
+        # intereses del mes cada uno; caen en abonos_default y asegurar()
+        # los reparte en sus particiones
+        c.execute("SELECT setseed(%s)", (1 / (semilla + 1),))
+        c.execute("""
+            INSERT INTO abonos (prestamo_id, fecha, monto)
+            SELECT p.id,
+                   p.fecha_prestamo + (random() * (%(hoy)s - p.fecha_prestamo))::int,
+                   ROUND(p.monto * p.interes / 100 * (0.5 + random())::numeric, -2)
+            FROM prestamos p
+            CROSS JOIN LATERAL generate_series(1, (random() * 2 * %(abonos)s + p.id * 0)::int)
+            WHERE p.id > %(desde)s
+        """, {"hoy": hoy, "abonos": abonos, "desde": desde})
+        print(f"{c.rowcount} abonos", flush=True)
+        particiones.asegurar(c, hoy)
+
+        clientes.backfill(c)
+        # Sin estadísticas de las filas nuevas el planificador cree vacías
+        # las tablas y los pasos de abajo recorren una por cada fila de otra
+        c.execute("ANALYZE")
+        c.execute(tareas.SQL_CALCULO.format(filtro="TRUE"), {
+            "hoy": hoy, "mora": configuracion.mora_diaria(c),
+        })
+        resumen.reconstruir(c)
+        resumen.nueva_version(c)
+        libro.backfill(c)
+        c.execute("ANALYZE")
+
+
+# =========================
+# BÚSQUEDA
+# =========================
+def medir_busqueda(repeticiones=200, semilla=2):
+    from db import conexion
+    import busqueda
+
+    rnd = random.Random(semilla)
+
+    with conexion() as conn:
+        c = conn.cursor()
+        c.execute("SELECT cedula, celular FROM prestamos TABLESAMPLE SYSTEM (1) LIMIT 1000")
+        muestras = c.fetchall()
+
+    casos = {
+        "nombre (3 letras)": lambda: rnd.choice(NOMBRES)[:3],
+        "nombre y apellido": lambda: f"{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)}",
+        "nombre completo": lambda: _nombre(rnd),
+        "apellido sin tildes": lambda: busqueda.normalizar(rnd.choice(APELLIDOS)),
+        "cédula (6 dígitos)": lambda: rnd.choice(muestras)[0][:6],
+        "celular (7 dígitos)": lambda: rnd.choice(muestras)[1][:7],
+    }
+
+    print(f"{'consulta':<22}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'filas':>7}")
+    with conexion() as conn:
+        c = conn.cursor()
+        for nombre, generar in casos.items():
+            tiempos = []
+            filas = 0
+            for _ in range(repeticiones):
+                q = generar()
+                inicio = time.perf_counter()
+                filas += len(busqueda.buscar(c, q))
+                tiempos.append(time.perf_counter() - inicio)
+            p50, p95, p99 = _percentiles(tiempos)
+            print(f"{nombre:<22}{p50:>9.2f}{p95:>9.2f}{p99:>9.2f}{filas / repeticiones:>7.1f}")
+        conn.rollback()
+
+
+# =========================
+# INSTANTÁNEA
+# =========================
+# Memoria y latencia de instantanea.py frente a las consultas SQL que
+# reemplaza. Las escrituras para medir la actualización incremental se
+# hacen en la misma transacción y se descartan al final.
+def _memoria_de(crear):
+    import tracemalloc
+
+    tracemalloc.start()
+    objeto = crear()
+    tamano = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return objeto, tamano
+
+
+def medir_instantanea(repeticiones=50, semilla=3):
+    from db import conexion
+    import app
+    import busqueda
+    import configuracion
+    import instantanea
+    import resumen
+
+    rnd = random.Random(semilla)
+    hoy = date.today()
+    sin_filtros = {"estado": "", "tipo": "", "vencidos": "", "q": "", "orden": "id"}
+
+    with conexion() as conn:
+        c = conn.cursor()
+        mora = configuracion.mora_diaria(c)
+
+        filas, en_tuplas = _memoria_de(lambda: (
+            c.execute(instantanea.SQL_PRESTAMOS.format(filtro="TRUE")), c.fetchall()
+        )[1])
+        # filas va como argumento: el del de abajo no debe dejar al lambda sin ella
+        _, en_dicts = _memoria_de(lambda filas=filas: app.procesar_prestamos(filas, mora, hoy))
+        del filas
+
+        inicio = time.perf_counter()
+        estado = instantanea.actualizar(c)
+        carga = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        instantanea.totales(estado, mora, hoy)
+        calculo = time.perf_counter() - inicio
+
+        prestamos = len(estado["datos"]["id"])
+        print(f"{prestamos} préstamos")
+        print(f"{'filas como tuplas':<34}{en_tuplas / 2**20:>8.1f} MB")
+        print(f"{'filas como dicts de index()':<34}{en_dicts / 2**20:>8.1f} MB")
+        print(f"{'instantánea (arreglos)':<34}{instantanea.memoria(estado) / 2**20:>8.1f} MB")
+        print(f"{'carga completa':<34}{carga * 1000:>8.1f} ms")
+        print(f"{'cálculo del día (toda la cartera)':<34}{calculo * 1000:>8.1f} ms")
+
+        def listado(**filtros):
+            filtros = dict(sin_filtros, **filtros)
+            return lambda: app.consultar_pagina(c, filtros, None, mora, hoy)
+
+        casos = {
+            "listado por id": listado(),
+            "listado por deuda": listado(orden="deuda"),
+            "vencidos por días": listado(vencidos="1", orden="dias"),
+            "listado buscando nombre": listado(q=rnd.choice(APELLIDOS)),
+        }
+        busquedas = {
+            "buscar nombre y apellido": lambda: f"{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)[:3]}",
+            "buscar cédula": lambda: str(rnd.randint(10, 99)),
+        }
+
+        print(f"\n{'consulta':<28}{'SQL p50':>9}{'p95':>8}{'mem p50':>9}{'p95':>8}  ms")
+        for nombre, consulta in list(casos.items()) + list(busquedas.items()):
+            medidas = []
+            for activa in (False, True):
+                instantanea.ACTIVA = activa
+                tiempos = []
+                for _ in range(repeticiones):
+                    inicio = time.perf_counter()
+                    if nombre in busquedas:
+                        q = busquedas[nombre]()
+                        if activa:
+                            instantanea.buscar(instantanea.actualizar(c), q)
+                        else:
+                            busqueda.buscar(c, q)
+                    else:
+                        consulta()
+                    tiempos.append(time.perf_counter() - inicio)
+                medidas += _percentiles(tiempos)[:2]
+            print(f"{nombre:<28}{medidas[0]:>9.2f}{medidas[1]:>8.2f}{medidas[2]:>9.2f}{medidas[3]:>8.2f}")
+
+        tiempos = {False: [], True: []}
+        for _ in range(repeticiones):
+            for activa in (False, True):
+                inicio = time.perf_counter()
+                if activa:
+                    instantanea.totales(instantanea.actualizar(c), mora, hoy)
+                else:
+                    resumen.leer_totales(c, hoy)
+                tiempos[activa].append(time.perf_counter() - inicio)
+        sql, mem = _percentiles(tiempos[False]), _percentiles(tiempos[True])
+        print(f"{'totales de /estadisticas':<28}{sql[0]:>9.2f}{sql[1]:>8.2f}{mem[0]:>9.2f}{mem[1]:>8.2f}")
+
+        print(f"\n{'préstamos escritos':<20}{'actualizar ms':>14}{'primer listado ms':>19}")
+        ids = estado["datos"]["id"].tolist()
+        for escritos in (1, 10, 100, 1000):
+            resumen.registrar_abonos(c, [(i, hoy, 1000) for i in rnd.sample(ids, escritos)])
+            inicio = time.perf_counter()
+            estado = instantanea.actualizar(c)
+            actualizar = time.perf_counter() - inicio
+            inicio = time.perf_counter()
+            listado()()
+            primero = time.perf_counter() - inicio
+            print(f"{escritos:<20}{actualizar * 1000:>14.2f}{primero * 1000:>19.2f}")
+        conn.rollback()
+
+
+# =========================
+# REPORTE DE CORTE
+# =========================
+# /reporte_corte sobre `abonos` abonos de un año sin otros movimientos
+# (ANIO_CORTE). Los que falten se siembran repartidos entre los préstamos
+# existentes y quedan en la base para las siguientes corridas. Cada formato
+# se pide en un proceso nuevo: el RSS máximo es el de ese reporte.
+ANIO_CORTE = 2001
+
+SCRIPT_CORTE = """
+import resource, sys, time
+import app
+cliente = app.create_app().test_client()
+cliente.post("/login", data={"usuario": sys.argv[1], "password": sys.argv[2]})
+antes = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+inicio = time.perf_counter()
+respuesta = cliente.post("/reporte_corte", buffered=False, data={
+    "fecha_inicio": sys.argv[3], "fecha_fin": sys.argv[4], "formato": sys.argv[5],
+})
+primer_byte = None
+tamano = 0
+for parte in respuesta.response:
+    if primer_byte is None:
+        primer_byte = time.perf_counter() - inicio
+    tamano += len(parte)
+total = time.perf_counter() - inicio
+respuesta.close()
+print(respuesta.status_code, primer_byte, total, tamano, antes,
+      resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def medir_corte(abonos=1000000, formatos=("csv", "xlsx")):
+    from db import conexion
+    import particiones
+    import resumen
+
+    inicio_anio, fin_anio = date(ANIO_CORTE, 1, 1), date(ANIO_CORTE, 12, 31)
+
+    with conexion() as conn:
+        c = conn.cursor()
+        c.execute("SELECT COUNT(*) FROM abonos WHERE fecha BETWEEN %s AND %s",
+                  (inicio_anio, fin_anio))
+        faltan = abonos - c.fetchone()[0]
+        if faltan > 0:
+            c.execute("SELECT array_agg(id ORDER BY id) FROM prestamos")
+            ids = c.fetchone()[0]
+            if not ids:
+                sys.exit("La base no tiene préstamos; corra primero sembrar")
+            c.execute("""
+                INSERT INTO abonos (prestamo_id, fecha, monto)
+                SELECT (%(ids)s::int[])[1 + i %% %(prestamos)s],
+                       %(inicio)s::date + i %% 365,
+                       (1 + i %% 500) * 1000
+                FROM generate_series(1, %(faltan)s) AS i
+            """, {"ids": ids, "prestamos": len(ids), "inicio": inicio_anio, "faltan": faltan})
+            print(f"{c.rowcount} abonos sembrados en {ANIO_CORTE}", flush=True)
+            particiones.asegurar(c)
+            resumen.reconstruir(c)
+            resumen.nueva_version(c)
+            c.execute("ANALYZE abonos")
+
+    # Un rango que empieza el 1 de enero trae `abonos` filas: se toman los
+    # días necesarios
+    with conexion() as conn:
+        c = conn.cursor()
+        c.execute("""
+            SELECT fecha FROM (
+                SELECT fecha, SUM(COUNT(*)) OVER (ORDER BY fecha) AS acumulado
+                FROM abonos WHERE fecha BETWEEN %s AND %s GROUP BY fecha
+            ) t
+            WHERE acumulado >= %s ORDER BY fecha LIMIT 1
+        """, (inicio_anio, fin_anio, abonos))
+        fila = c.fetchone()
+        fin = fila[0] if fila else fin_anio
+        c.execute("SELECT COUNT(*) FROM abonos WHERE fecha BETWEEN %s AND %s", (inicio_anio, fin))
+        filas = c.fetchone()[0]
+
+    carpeta = os.path.dirname(os.path.abspath(__file__))
+    print(f"{filas} abonos del {inicio_anio} al {fin}")
+    print(f"{'formato':<9}{'estado':>7}{'primer byte ms':>16}{'total ms':>10}"
+          f"{'MB enviados':>13}{'RSS antes MB':>14}{'RSS máx MB':>12}")
+    for formato in formatos:
+        salida = subprocess.run(
+            [sys.executable, "-c", SCRIPT_CORTE, USUARIO, PASSWORD,
+             inicio_anio.isoformat(), fin.isoformat(), formato],
+            cwd=carpeta, capture_output=True, text=True, check=True
+        ).stdout.split()
+        estado, primer_byte, total, tamano, antes, maximo = salida[-6:]
+        primer_byte = float(primer_byte) * 1000 if primer_byte != "None" else 0
+        print(f"{formato:<9}{estado:>7}{primer_byte:>16.0f}{float(total) * 1000:>10.0f}"
+              f"{int(tamano) / 2**20:>13.1f}{int(antes) / 1024:>14.1f}{int(maximo) / 1024:>12.1f}")
+
+
+# =========================
+# MOTOR DE CARTERA
+# =========================
+# calcular_cartera() frente a las fórmulas por fila que reemplazó, sobre una
+# cartera aleatoria en memoria (tests/referencia.py).
+def medir_motor(prestamos=100000, repeticiones=5, semilla=4):
+    import numpy as np
+
+    from calculos import calcular_cartera
+    from tests.referencia import calcular_original, cartera_aleatoria
+
+    rnd = random.Random(semilla)
+    hoy = date.today()
+    mora = 2.5
+    cartera = cartera_aleatoria(rnd, prestamos, hoy)
+    # Las listas son lo que recibe procesar_prestamos(); los arreglos, lo
+    # que ya tiene instantanea.py
+    arreglos = {
+        "monto": np.array(cartera["monto"], dtype=float),
+        "interes": np.array(cartera["interes"], dtype=float),
+        "fecha_prestamo": np.array(cartera["fecha_prestamo"], dtype="datetime64[D]"),
+        "tipo_prestamo": np.array(cartera["tipo_prestamo"], dtype=object),
+        "plazo_dias": np.array(cartera["plazo_dias"], dtype=np.int64),
+        "pagado": np.array(cartera["pagado"], dtype=bool),
+        "total_abonos": np.array(cartera["total_abonos"], dtype=float),
+    }
+
+    tiempos = {"motor (listas)": [], "motor (arreglos)": [], "por fila": []}
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        calculo = calcular_cartera(cartera, mora, hoy)
+        tiempos["motor (listas)"].append(time.perf_counter() - inicio)
+        inicio = time.perf_counter()
+        calcular_cartera(arreglos, mora, hoy)
+        tiempos["motor (arreglos)"].append(time.perf_counter() - inicio)
+        inicio = time.perf_counter()
+        esperados = calcular_original(cartera, mora, hoy)
+        tiempos["por fila"].append(time.perf_counter() - inicio)
+
+    deuda = calculo["deuda_restante"].tolist()
+    distintos = sum(1 for i, e in enumerate(esperados) if e["total"] != deuda[i])
+
+    print(f"{prestamos} préstamos, {repeticiones} repeticiones")
+    print(f"{'cálculo':<18}{'mediana ms':>12}{'mín ms':>10}")
+    for nombre, valores in tiempos.items():
+        print(f"{nombre:<18}{statistics.median(valores) * 1000:>12.1f}{min(valores) * 1000:>10.1f}")
+    print(f"Deuda distinta de la fórmula por fila: {distintos}")
+
+
+# =========================
+# ARRANQUE
+# =========================
+# Lo que paga cada worker al iniciar: importar app, create_app() y la
+# primera petición (/login, sin base de datos). Cada repetición es un
+# proceso nuevo.
+SCRIPT_ARRANQUE = """
+import resource, sys, time
+inicio = time.perf_counter()
+import app
+importado = time.perf_counter()
+aplicacion = app.create_app()
+creado = time.perf_counter()
+aplicacion.test_client().get("/login")
+listo = time.perf_counter()
+pesados = [m for m in ("xlsxwriter", "pandas", "openpyxl") if m in sys.modules]
+print(importado - inicio, creado - importado, listo - creado,
+      resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, ",".join(pesados) or "-")
+"""
+
+
+def medir_arranque(repeticiones=10):
+    carpeta = os.path.dirname(os.path.abspath(__file__))
+    medidas = []
+
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        salida = subprocess.run(
+            [sys.executable, "-c", SCRIPT_ARRANQUE],
+            cwd=carpeta, capture_output=True, text=True, check=True
+        ).stdout.split()
+        total = time.perf_counter() - inicio
+        importar, crear, primera, rss = (float(v) for v in salida[:4])
+        medidas.append((importar, crear, primera, total, rss))
+        pesados = salida[4]
+
+    print(f"{'fase':<22}{'mediana ms':>12}{'máx ms':>10}")
+    for i, fase in enumerate(["importar app", "create_app()", "primera petición", "proceso completo"]):
+        valores = [m[i] * 1000 for m in medidas]
+        print(f"{fase:<22}{statistics.median(valores):>12.1f}{max(valores):>10.1f}")
+    print(f"RSS máximo: {max(m[4] for m in medidas) / 1024:.1f} MB")
+    print(f"Módulos pesados cargados: {pesados}")
+
+
+# =========================
+# POSTGRES LOCAL
+# =========================
+# Un cluster desechable en `carpeta`, solo por socket Unix. Usa initdb y
+# pg_ctl del PATH o de PG_BIN.
+def _programa_pg(nombre):
+    carpeta = os.environ.get("PG_BIN")
+    return os.path.join(carpeta, nombre) if carpeta else nombre
+
+
+def postgres_local(carpeta, puerto, detener=False):
+    carpeta = os.path.abspath(carpeta)
+    pg_ctl = _programa_pg("pg_ctl")
+
+    if detener:
+        subprocess.run([pg_ctl, "-D", carpeta, "-m", "fast", "stop"], check=True)
+        return
+
+    if not os.path.exists(os.path.join(carpeta, "PG_VERSION")):
+        subprocess.run(
+            [_programa_pg("initdb"), "-D", carpeta, "-U", "postgres", "-A", "trust", "-E", "UTF8"],
+            check=True, stdout=subprocess.DEVNULL
+        )
+
+    subprocess.run([
+        pg_ctl, "-D", carpeta, "-l", os.path.join(carpeta, "postgres.log"), "-w",
+        "-o", f"-p {puerto} -k {carpeta} -c listen_addresses=''",
+        "start",
+    ], check=True, stdout=subprocess.DEVNULL)
+
+    print(f"postgresql://postgres@/postgres?host={carpeta}&port={puerto}")
+
+
+# =========================
+# CARGA HTTP
+# =========================
+# Varios hilos recorren las rutas de la app con una mezcla ponderada y se
+# mide cada petición. Sin --servidor la app corre en este mismo proceso con
+# el servidor de werkzeug: sirve para comparar versiones, pero comparte el
+# GIL con los hilos de carga. Para elegir workers, levante gunicorn y
+# páselo con --servidor.
+USUARIO = os.environ.get("BENCH_USUARIO", "admin")
+PASSWORD = os.environ.get("BENCH_PASSWORD", "Monteria12####")
+
+
+class _SinRedirecciones(urllib.request.HTTPRedirectHandler):
+    # Se mide la ruta pedida, no la página a la que redirige
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def _formulario_prestamo(rnd, hoy):
+    fecha = hoy - timedelta(days=rnd.randint(0, 120))
+    plazo = rnd.choice(PLAZOS)
+    nombre = _nombre(rnd)
+    return {
+        "nombre": nombre,
+        "cedula": str(rnd.randint(10_000_000, 1_999_999_999)),
+        "celular": "3" + str(rnd.randint(0, 999_999_999)).zfill(9),
+        "monto": str(rnd.choice([100000, 500000, 1000000])),
+        "interes": str(rnd.choice([5, 10, 20])),
+        "fecha_prestamo": fecha.isoformat(),
+        "fecha_pago": (fecha + timedelta(days=plazo)).isoformat(),
+        "medio": rnd.choice(MEDIOS),
+        "objeto": "",
+        "tipo_prestamo": rnd.choice(["fijo", "indefinido"]),
+        "plazo_dias": str(plazo),
+    }
+
+
+def _mezcla(muestras, escrituras):
+    """[(ruta, peso, generar(rnd) -> (método, camino, formulario))]"""
+    ids, cedulas, nombres = muestras
+    hoy = date.today()
+
+    def reporte(formato, dias):
+        return lambda rnd: ("POST", "/reporte_corte", {
+            "fecha_inicio": (hoy - timedelta(days=dias)).isoformat(),
+            "fecha_fin": hoy.isoformat(),
+            "formato": formato,
+        })
+
+    mezcla = [
+        ("/", 10, lambda rnd: ("GET", "/", None)),
+        ("/ (siguiente página)", 3,
+         lambda rnd: ("GET", f"/?despues={rnd.choice(ids)}", None)),
+        ("/?orden=deuda", 3, lambda rnd: ("GET", "/?orden=deuda", None)),
+        ("/?vencidos=1&orden=dias", 3,
+         lambda rnd: ("GET", "/?vencidos=1&orden=dias", None)),
+        ("/?q=nombre", 2, lambda rnd: (
+            "GET", "/?q=" + urllib.parse.quote(rnd.choice(nombres).split()[0]), None)),
+        ("/estadisticas", 5, lambda rnd: ("GET", "/estadisticas", None)),
+        ("/prestamo/<id>", 4, lambda rnd: ("GET", f"/prestamo/{rnd.choice(ids)}", None)),
+        ("/api/prestamos/<id>", 2,
+         lambda rnd: ("GET", f"/api/prestamos/{rnd.choice(ids)}", None)),
+        ("/buscar", 3, lambda rnd: (
+            "GET", "/buscar?q=" + urllib.parse.quote(rnd.choice(nombres)[:8]), None)),
+        ("/clientes", 2, lambda rnd: ("GET", "/clientes?orden=deuda", None)),
+        ("/clientes/exposicion", 2, lambda rnd: (
+            "GET", f"/clientes/exposicion?cedula={rnd.choice(cedulas)}", None)),
+        ("/reporte_corte csv 30 días", 1, reporte("csv", 30)),
+        ("/reporte_corte xlsx 30 días", 1, reporte("xlsx", 30)),
+        ("/reporte_corte mensual 1 año", 1, reporte("mensual", 365)),
+    ]
+
+    if escrituras:
+        mezcla += [
+            ("/abonar (json)", 3, lambda rnd: (
+                "POST", f"/abonar/{rnd.choice(ids)}?formato=json",
+                {"abono": str(rnd.choice([10000, 50000, 100000]))})),
+            ("/agregar", 1, lambda rnd: ("POST", "/agregar", _formulario_prestamo(rnd, hoy))),
+            ("/editar_prestamo", 1, lambda rnd: (
+                "POST", f"/editar_prestamo/{rnd.choice(ids)}", _formulario_prestamo(rnd, hoy))),
+            ("/mes_pagado", 1, lambda rnd: ("GET", f"/mes_pagado/{rnd.choice(ids)}", None)),
+        ]
+
+    return mezcla
+
+
+def _muestras(cantidad=2000):
+    from db import conexion
+
+    with conexion() as conn:
+        c = conn.cursor()
+        c.execute("""
+            SELECT id, cedula, nombre FROM prestamos
+            WHERE pagado = FALSE
+            ORDER BY random()
+            LIMIT %s
+        """, (cantidad,))
+        filas = c.fetchall()
+
+    if not filas:
+        sys.exit("La base no tiene préstamos sin pagar; ejecute sembrar primero")
+    return [f[0] for f in filas], [f[1] for f in filas], [f[2] for f in filas]
+
+
+def _hilo_de_carga(base, mezcla, hasta, semilla, condicional, resultados, errores):
+    rnd = random.Random(semilla)
+    # Última ETag vista por camino, como haría el navegador
+    etiquetas = {}
+    galletas = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(
+        urllib.request.HTTPCookieProcessor(galletas), _SinRedirecciones
+    )
+    datos = urllib.parse.urlencode({"usuario": USUARIO, "password": PASSWORD}).encode()
+    try:
+        opener.open(base + "/login", datos).read()
+    except urllib.error.HTTPError as error:
+        # El login correcto responde 302
+        error.read()
+    if not any(galleta.name == "session" for galleta in galletas):
+        raise SystemExit("No se pudo iniciar sesión (BENCH_USUARIO / BENCH_PASSWORD)")
+
+    rutas = [ruta for ruta, _, _ in mezcla]
+    pesos = [peso for _, peso, _ in mezcla]
+    generadores = {ruta: generar for ruta, _, generar in mezcla}
+
+    while time.perf_counter() < hasta:
+        ruta = rnd.choices(rutas, pesos)[0]
+        metodo, camino, formulario = generadores[ruta](rnd)
+        datos = urllib.parse.urlencode(formulario).encode() if formulario else None
+
+        peticion = urllib.request.Request(base + camino, data=datos, method=metodo)
+        if condicional and camino in etiquetas:
+            peticion.add_header("If-None-Match", etiquetas[camino])
+
+        inicio = time.perf_counter()
+        try:
+            with opener.open(peticion) as r:
+                r.read()
+            estado = r.status
+            if condicional and r.headers.get("ETag"):
+                etiquetas[camino] = r.headers["ETag"]
+        except urllib.error.HTTPError as error:
+            error.read()
+            estado = error.code
+        except OSError:
+            estado = 0
+        duracion = time.perf_counter() - inicio
+
+        # 302 de las escrituras y 304 cuentan como respuestas correctas
+        if 0 < estado < 400:
+            resultados.setdefault(ruta, []).append(duracion)
+        else:
+            errores[ruta] = errores.get(ruta, 0) + 1
+
+
+def _servidor_local(concurrencia):
+    # Una conexión por hilo del servidor, más margen para los de carga
+    os.environ.setdefault("DB_POOL_MAX", str(concurrencia + 2))
+    from werkzeug.serving import make_server
+    import app
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    servidor = make_server("127.0.0.1", 0, app.create_app(), threaded=True)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{servidor.port}"
+
+
+def carga(segundos=30, concurrencia=8, servidor=None, escrituras=False, condicional=False,
+          semilla=3, rutas=None):
+    mezcla = _mezcla(_muestras(), escrituras)
+    if rutas:
+        desconocidas = set(rutas) - {ruta for ruta, _, _ in mezcla}
+        if desconocidas:
+            sys.exit("Rutas que no están en la mezcla: " + ", ".join(sorted(desconocidas)))
+        mezcla = [(ruta, peso, generar) for ruta, peso, generar in mezcla if ruta in rutas]
+    base = servidor.rstrip("/") if servidor else _servidor_local(concurrencia)
+
+    hasta = time.perf_counter() + segundos
+    por_hilo = [({}, {}) for _ in range(concurrencia)]
+    hilos = [
+        threading.Thread(target=_hilo_de_carga,
+                         args=(base, mezcla, hasta, semilla + i, condicional,
+                               resultados, errores))
+        for i, (resultados, errores) in enumerate(por_hilo)
+    ]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    transcurrido = time.perf_counter() - inicio
+
+    print(f"{base}: {concurrencia} hilos, {transcurrido:.1f} s"
+          + (", con escrituras" if escrituras else "")
+          + (", con If-None-Match" if condicional else ""))
+    print(f"{'ruta':<30}{'n':>7}{'errores':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>8}")
+
+    total = 0
+    for ruta, _, _ in mezcla:
+        tiempos = [t for resultados, _ in por_hilo for t in resultados.get(ruta, [])]
+        fallas = sum(errores.get(ruta, 0) for _, errores in por_hilo)
+        total += len(tiempos)
+        if not tiempos:
+            print(f"{ruta:<30}{0:>7}{fallas:>9}")
+            continue
+        p50, p95, p99 = _percentiles(tiempos)
+        print(f"{ruta:<30}{len(tiempos):>7}{fallas:>9}{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}"
+              f"{len(tiempos) / transcurrido:>8.1f}")
+    print(f"{'total':<30}{total:>7}{'':>9}{'':>27}{total / transcurrido:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del sistema de préstamos")
+    parser.add_argument("--url", default=os.environ.get("BENCH_DATABASE_URL"),
+                        help="Base de datos de prueba (o BENCH_DATABASE_URL)")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_postgres = sub.add_parser("postgres", help="Inicia (o detiene) un Postgres desechable")
+    p_postgres.add_argument("--datos", required=True, help="Carpeta del cluster")
+    p_postgres.add_argument("--puerto", type=int, default=5433)
+    p_postgres.add_argument("--detener", action="store_true")
+
+    p_sembrar = sub.add_parser("sembrar", help="Migra y siembra la base de prueba")
+    p_sembrar.add_argument("--prestamos", type=int, default=100000)
+    p_sembrar.add_argument("--abonos", type=float, default=3,
+                           help="Abonos promedio por préstamo")
+    p_sembrar.add_argument("--fijos", type=float, default=0.6,
+                           help="Proporción de préstamos con plazo")
+    p_sembrar.add_argument("--vencidos", type=float, default=0.25,
+                           help="Proporción de fijos sin pagar ya vencidos")
+    p_sembrar.add_argument("--pagados", type=float, default=0.3)
+    p_sembrar.add_argument("--semilla", type=int, default=1)
+
+    p_busqueda = sub.add_parser("busqueda", help="Latencia de /buscar en la base")
+    p_busqueda.add_argument("--repeticiones", type=int, default=200)
+
+    p_instantanea = sub.add_parser("instantanea", help="Memoria y latencia de la instantánea")
+    p_instantanea.add_argument("--repeticiones", type=int, default=50)
+
+    p_arranque = sub.add_parser("arranque", help="Tiempo y memoria al iniciar un worker")
+    p_arranque.add_argument("--repeticiones", type=int, default=10)
+
+    p_motor = sub.add_parser("motor", help="Motor de cartera frente a las fórmulas por fila")
+    p_motor.add_argument("--prestamos", type=int, default=100000)
+    p_motor.add_argument("--repeticiones", type=int, default=5)
+
+    p_corte = sub.add_parser("corte", help="RSS y primer byte de /reporte_corte")
+    p_corte.add_argument("--abonos", type=int, default=1000000)
+    p_corte.add_argument("--formatos", default="csv,xlsx")
+
+    p_carga = sub.add_parser("carga", help="Carga HTTP concurrente sobre todas las rutas")
+    p_carga.add_argument("--segundos", type=float, default=30)
+    p_carga.add_argument("--concurrencia", type=int, default=8)
+    p_carga.add_argument("--servidor", help="URL de una app ya corriendo")
+    p_carga.add_argument("--escrituras", action="store_true",
+                         help="Incluye abonos, préstamos nuevos y ediciones")
+    p_carga.add_argument("--condicional", action="store_true",
+                         help="Repite la última ETag de cada página (If-None-Match)")
+    p_carga.add_argument("--rutas",
+                         help="Solo estas rutas de la mezcla, separadas por comas")
+
+    args = parser.parse_args()
+    if args.comando == "arranque":
+        medir_arranque(args.repeticiones)
+        return
+    if args.comando == "motor":
+        medir_motor(args.prestamos, args.repeticiones)
+        return
+    if args.comando == "postgres":
+        postgres_local(args.datos, args.puerto, args.detener)
+        return
+
+    if not args.url:
+        sys.exit("Indique la base de prueba con --url o BENCH_DATABASE_URL")
+
+    # db.py lee DATABASE_URL al importarse
+    os.environ["DATABASE_URL"] = args.url
+
+    if args.comando == "sembrar":
+        import migraciones
+        migraciones.migrar()
+        sembrar(args.prestamos, args.semilla, args.abonos, args.fijos, args.vencidos,
+                args.pagados)
+    elif args.comando == "busqueda":
+        medir_busqueda(args.repeticiones)
+    elif args.comando == "instantanea":
+        import migraciones
+        migraciones.migrar()
+        medir_instantanea(args.repeticiones)
+    elif args.comando == "corte":
+        medir_corte(args.abonos, args.formatos.split(","))
+    elif args.comando == "carga":
+        carga(args.segundos, args.concurrencia, args.servidor, args.escrituras,
+              args.condicional, rutas=args.rutas.split(",") if args.rutas else None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import re
+import unicodedata
+
+from psycopg2.extras import execute_values
+
+# =========================
+# BÚSQUEDA DE CLIENTES
+# =========================
+# nombre_norm guarda el nombre en minúsculas y sin tildes ni signos
+# ("José Núñez" -> "jose nunez"); un índice GIN de texto completo sobre esa
+# columna encuentra préstamos cuyo nombre tenga todas las palabras
+# buscadas, la última como prefijo mientras se escribe ("jose nu" encuentra
+# a José Núñez). Si lo buscado son solo dígitos, se busca como prefijo de
+# cédula o celular.
+
+LIMITE = 20
+LOTE_RELLENO = 5000
+
+INDICES = [
+    """
+        CREATE INDEX IF NOT EXISTS idx_prestamos_nombre_busqueda
+        ON prestamos USING GIN (to_tsvector('simple', nombre_norm))
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_prestamos_celular ON prestamos (celular text_pattern_ops)",
+]
+
+
+def normalizar(texto):
+    """Minúsculas, sin tildes y solo letras y números separados por un espacio."""
+    texto = unicodedata.normalize("NFKD", texto or "")
+    texto = "".join(ch for ch in texto if not unicodedata.combining(ch))
+    return " ".join(re.findall(r"[a-z0-9]+", texto.lower()))
+
+
+def terminos(q):
+    """
+    ("numero", prefijo) si lo buscado son solo dígitos; si no ("nombre",
+    palabras normalizadas), donde la última se busca como prefijo.
+    """
+    numero = re.sub(r"[\s.\-]", "", q)
+    if numero.isdigit():
+        return "numero", numero
+    return "nombre", normalizar(q).split()
+
+
+def condicion(q, params):
+    """Condición SQL sobre prestamos p para lo buscado; agrega sus parámetros."""
+    tipo, valor = terminos(q)
+    if tipo == "numero":
+        params["busqueda_prefijo"] = valor + "%"
+        return "(p.cedula LIKE %(busqueda_prefijo)s OR p.celular LIKE %(busqueda_prefijo)s)"
+
+    if not valor:
+        return "FALSE"
+
+    # Palabras completas y la última como prefijo: 'jose' & 'nu':*
+    # (buscar todas como prefijo obliga a Postgres a unir listas enteras
+    # del índice y es bastante más lento)
+    palabras = valor[:-1] + [valor[-1] + ":*"]
+    params["busqueda_nombre"] = " & ".join(palabras)
+    return "to_tsvector('simple', p.nombre_norm) @@ to_tsquery('simple', %(busqueda_nombre)s)"
+
+
+def buscar(c, q, limite=LIMITE):
+    params = {"limite": limite}
+    c.execute("""
+        SELECT p.id, p.nombre, p.cedula, p.celular, p.monto, p.tipo_prestamo, p.pagado
+        FROM prestamos p
+        WHERE """ + condicion(q, params) + """
+        ORDER BY p.id DESC
+        LIMIT %(limite)s
+    """, params)
+    columnas = ["id", "nombre", "cedula", "celular", "monto", "tipo_prestamo", "pagado"]
+    return [dict(zip(columnas, fila)) for fila in c.fetchall()]
+
+
+def rellenar(c):
+    """Calcula nombre_norm de los préstamos que no lo tienen, por lotes."""
+    ultimo = 0
+    while True:
+        c.execute("""
+            SELECT id, nombre FROM prestamos
+            WHERE nombre_norm IS NULL AND id > %s
+            ORDER BY id
+            LIMIT %s
+        """, (ultimo, LOTE_RELLENO))
+        filas = c.fetchall()
+        if not filas:
+            return
+
+        execute_values(c, """
+            UPDATE prestamos p SET nombre_norm = v.nombre_norm
+            FROM (VALUES %s) AS v (id, nombre_norm)
+            WHERE p.id = v.id
+        """, [(id, normalizar(nombre)) for id, nombre in filas])
+        ultimo = filas[-1][0]
@@ -0,0 +1,167 @@
+import numpy as np
+
+# =========================
+# MOTOR DE CARTERA
+# =========================
+# Todas las reglas de interés, ciclos, vencimiento, mora y deuda restante
+# viven aquí. Se calculan por columnas para toda la cartera de una vez,
+# así index(), estadisticas() y los reportes usan exactamente las mismas
+# fórmulas.
+
+DIAS_CICLO = 30
+PLAZO_POR_DEFECTO = 30
+
+
+def redondear(valores):
+    # Redondeo a centavos con el mismo resultado que round(x, 2) y Decimal
+    # (mitad al par sobre el valor exacto), igual que redondear() en SQL
+    # (FUNCION_REDONDEAR). Solo en float64: longdouble es float64 en Windows
+    # y macOS arm64.
+    x = np.asarray(valores, dtype=float)
+    centavos = x * 100
+    # x * 100 solo cae justo en medio centavo por redondeo del producto; el
+    # error se recupera partiendo x en dos mitades (Dekker) cuyos productos
+    # por 100 son exactos
+    alto = 134217729 * x - (134217729 * x - x)
+    error = (alto * 100 - centavos) + (x - alto) * 100
+    mitad = centavos - np.floor(centavos) == 0.5
+    centavos = np.where(mitad & (error > 0), np.ceil(centavos), centavos)
+    centavos = np.where(mitad & (error < 0), np.floor(centavos), centavos)
+    return np.rint(centavos) / 100
+
+
+def columnas(filas, nombres):
+    """Convierte filas de la base de datos en un dict de columnas."""
+    if not filas:
+        return {nombre: [] for nombre in nombres}
+    return {nombre: list(col) for nombre, col in zip(nombres, zip(*filas))}
+
+
+def calcular_cartera(prestamos, mora_porcentaje, hoy):
+    """
+    prestamos es un dict de columnas (listas o arreglos NumPy) con: monto,
+    interes, fecha_prestamo, tipo_prestamo, plazo_dias, pagado y
+    total_abonos.
+    Devuelve un dict de arreglos NumPy con los campos derivados.
+    """
+    monto = np.asarray(prestamos["monto"], dtype=float)
+    interes_porcentaje = np.asarray(prestamos["interes"], dtype=float)
+    fecha_prestamo = np.asarray(prestamos["fecha_prestamo"], dtype="datetime64[D]")
+    plazo_dias = prestamos["plazo_dias"]
+    # Los arreglos de instantanea.py ya traen el plazo por defecto
+    if not isinstance(plazo_dias, np.ndarray):
+        plazo_dias = [PLAZO_POR_DEFECTO if d is None else d for d in plazo_dias]
+    plazo_dias = np.asarray(plazo_dias, dtype=np.int64)
+    fijo = np.asarray(prestamos["tipo_prestamo"], dtype=object) == "fijo"
+    pagado = np.asarray(prestamos["pagado"], dtype=bool)
+    total_abonos = np.asarray(prestamos["total_abonos"], dtype=float)
+    hoy = np.datetime64(hoy, "D")
+
+    dias_transcurridos = (hoy - fecha_prestamo).astype(np.int64)
+
+    # Fijo: un solo periodo de interés. Indefinido: uno por cada ciclo
+    # de 30 días iniciado.
+    ciclos = np.where(fijo, 0, dias_transcurridos // DIAS_CICLO)
+    interes = monto * (interes_porcentaje / 100) * (ciclos + 1)
+
+    # Vencimiento y mora solo aplican a préstamos fijos sin pagar
+    fecha_vencimiento = fecha_prestamo + plazo_dias
+    dias_restantes = (fecha_vencimiento - hoy).astype(np.int64)
+    dias_vencidos = np.where(fijo & ~pagado, np.maximum(-dias_restantes, 0), 0)
+
+    base = monto + interes
+    mora = redondear(base * (float(mora_porcentaje) / 100) * dias_vencidos)
+
+    total_deuda = base + mora
+    deuda_restante = redondear(np.maximum(total_deuda - total_abonos, 0))
+
+    return {
+        "interes_total": interes,
+        "ciclos": ciclos,
+        "fecha_vencimiento": fecha_vencimiento,
+        "dias_restantes": dias_restantes,
+        "dias_vencidos": dias_vencidos,
+        "mora": mora,
+        "total_deuda": total_deuda,
+        "deuda_restante": deuda_restante,
+        "fijo": fijo,
+    }
+
+
+# =========================
+# EN SQL
+# =========================
+# El listado, el cierre diario (tareas.py), los clientes y los reportes
+# filtran, ordenan y suman la cartera en la base con este fragmento en vez
+# de repetir las fórmulas. Va en float8 y en el mismo orden de operaciones
+# que calcular_cartera(), así da los mismos valores que los arreglos de
+# instantanea.py, empates incluidos. Los valores salen en float8: quien
+# los guarde o los sume los pasa a numeric.
+#
+# {columnas} y {filtro} pueden usar prestamos p, resumen_prestamos r,
+# d.ciclos, d.dias_vencidos, i.interes_total, m.mora y s.deuda_restante.
+# Parámetros: %(hoy)s y %(mora)s.
+SQL_CARTERA = """
+    SELECT {columnas}
+    FROM prestamos p
+    LEFT JOIN resumen_prestamos r ON r.prestamo_id = p.id
+    CROSS JOIN LATERAL (
+        SELECT CASE
+                   WHEN p.tipo_prestamo = 'fijo' THEN 0
+                   ELSE FLOOR((%(hoy)s - p.fecha_prestamo) / 30.0)::int
+               END AS ciclos,
+               CASE
+                   WHEN p.tipo_prestamo = 'fijo' AND p.pagado = FALSE
+                   THEN GREATEST(%(hoy)s - (p.fecha_prestamo + COALESCE(p.plazo_dias, 30)), 0)
+                   ELSE 0
+               END AS dias_vencidos
+    ) d
+    CROSS JOIN LATERAL (
+        SELECT p.monto::float8 * (p.interes::float8 / 100) * (d.ciclos + 1) AS interes_total
+    ) i
+    CROSS JOIN LATERAL (
+        -- Sin días vencidos no hay mora que redondear
+        SELECT CASE
+                   WHEN d.dias_vencidos = 0 THEN 0
+                   ELSE redondear(
+                       (p.monto::float8 + i.interes_total) * (%(mora)s::float8 / 100) * d.dias_vencidos
+                   )
+               END AS mora
+    ) m
+    CROSS JOIN LATERAL (
+        SELECT redondear(GREATEST(
+                   p.monto::float8 + i.interes_total + m.mora
+                   - COALESCE(r.total_abonos, 0)::float8,
+                   0
+               )) AS deuda_restante
+    ) s
+    WHERE {filtro}
+"""
+
+# redondear() de arriba en la base (migraciones.py la crea), también en
+# float8. ROUND de numeric lleva las mitades lejos del cero; aquí van al
+# par sobre el valor exacto de x. x * 100 en float8 no es exacto: cuando
+# cae justo en medio centavo, el error del producto se recupera partiendo
+# x en dos mitades (Dekker) y decide hacia dónde redondear.
+FUNCION_REDONDEAR = """
+    CREATE OR REPLACE FUNCTION redondear(x DOUBLE PRECISION) RETURNS DOUBLE PRECISION
+    LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE AS $$
+    DECLARE
+        centavos DOUBLE PRECISION := x * 100;
+        alto DOUBLE PRECISION;
+        error DOUBLE PRECISION;
+    BEGIN
+        IF centavos - floor(centavos) = 0.5 THEN
+            alto := 134217729 * x - (134217729 * x - x);
+            error := (alto * 100 - centavos) + (x - alto) * 100;
+            IF error > 0 THEN
+                centavos := ceil(centavos);
+            ELSIF error < 0 THEN
+                centavos := floor(centavos);
+            END IF;
+        END IF;
+        -- round() de float8 lleva al par las mitades exactas
+        RETURN round(centavos) / 100;
+    END
+    $$
+"""
@@ -0,0 +1,242 @@
+from decimal import Decimal
+
+# =========================
+# CLIENTES Y EXPOSICIÓN
+# =========================
+# Cada préstamo apunta a un cliente (uno por cédula). clientes guarda la
+# exposición de cada uno, mantenida igual que resumen.py: el aporte del
+# préstamo se quita antes de modificarlo y se suma después.
+#
+#   prestamos / prestamos_activos   conteo total y sin pagar
+#   capital_total                   suma de montos prestados
+#   capital_en_calle                montos sin pagar
+#   deuda                           lo que deben sus préstamos sin pagar
+#                                   (interés y mora a calculado_al)
+#   prestamos_vencidos              préstamos sin pagar con días vencidos
+#
+# La deuda usa interes_total y mora guardados en el préstamo, redondeada
+# por préstamo como deuda_restante en calculos.py; cambian cada día, así
+# que el cierre diario (tareas.py) reconstruye la tabla completa.
+
+TABLA = '''
+    CREATE TABLE IF NOT EXISTS clientes (
+        id SERIAL PRIMARY KEY,
+        cedula TEXT UNIQUE,
+        nombre TEXT,
+        celular TEXT,
+        nombre_norm TEXT,
+        prestamos INTEGER NOT NULL DEFAULT 0,
+        prestamos_activos INTEGER NOT NULL DEFAULT 0,
+        capital_total NUMERIC NOT NULL DEFAULT 0,
+        capital_en_calle NUMERIC NOT NULL DEFAULT 0,
+        deuda NUMERIC NOT NULL DEFAULT 0,
+        prestamos_vencidos INTEGER NOT NULL DEFAULT 0
+    )
+'''
+
+COLUMNAS = [
+    "prestamos", "prestamos_activos", "capital_total",
+    "capital_en_calle", "deuda", "prestamos_vencidos",
+]
+
+# Ordenamientos de /clientes: columna y dirección
+ORDENES = {
+    "deuda": ("deuda", "DESC"),
+    "capital": ("capital_en_calle", "DESC"),
+    "vencidos": ("prestamos_vencidos", "DESC"),
+    "prestamos": ("prestamos_activos", "DESC"),
+}
+
+INDICES = [
+    "CREATE INDEX IF NOT EXISTS idx_prestamos_cliente ON prestamos (cliente_id)",
+] + [
+    f"CREATE INDEX IF NOT EXISTS idx_clientes_{columna} ON clientes ({columna}, id)"
+    for columna, _ in ORDENES.values()
+]
+
+# Aporte de cada préstamo a la exposición de su cliente
+SQL_APORTE = """
+    SELECT p.cliente_id,
+           COUNT(*) AS prestamos,
+           COUNT(*) FILTER (WHERE p.pagado = FALSE) AS prestamos_activos,
+           COALESCE(SUM(p.monto), 0) AS capital_total,
+           COALESCE(SUM(p.monto) FILTER (WHERE p.pagado = FALSE), 0) AS capital_en_calle,
+           COALESCE(SUM(redondear(GREATEST(
+               p.monto::float8 + p.interes_total::float8 + p.mora::float8
+               - COALESCE(r.total_abonos, 0)::float8,
+               0
+           ))::numeric) FILTER (WHERE p.pagado = FALSE), 0) AS deuda,
+           COUNT(*) FILTER (WHERE p.pagado = FALSE AND p.dias_vencidos > 0) AS prestamos_vencidos
+    FROM prestamos p
+    LEFT JOIN resumen_prestamos r ON r.prestamo_id = p.id
+    WHERE p.cliente_id IS NOT NULL AND {filtro}
+    GROUP BY p.cliente_id
+"""
+
+
+# =========================
+# ASIGNAR
+# =========================
+def asignar(c, cedula, nombre, celular, nombre_norm, actual=None):
+    """
+    Id del cliente con esa cédula, creado si no existe; sus datos de
+    contacto quedan con los del préstamo más reciente. Sin cédula se crea
+    un cliente nuevo, salvo que `actual` (el cliente que ya tenía el
+    préstamo) tampoco tenga cédula.
+    """
+    if actual is not None and not (cedula or "").strip():
+        c.execute("""
+            UPDATE clientes
+            SET nombre = %s, celular = %s, nombre_norm = %s
+            WHERE id = %s AND cedula IS NULL
+            RETURNING id
+        """, (nombre, celular, nombre_norm, actual))
+        fila = c.fetchone()
+        if fila:
+            return fila[0]
+
+    c.execute("""
+        INSERT INTO clientes (cedula, nombre, celular, nombre_norm)
+        VALUES (NULLIF(TRIM(%s), ''), %s, %s, %s)
+        ON CONFLICT (cedula) DO UPDATE
+        SET nombre = EXCLUDED.nombre,
+            celular = EXCLUDED.celular,
+            nombre_norm = EXCLUDED.nombre_norm
+        RETURNING id
+    """, (cedula or "", nombre, celular, nombre_norm))
+    return c.fetchone()[0]
+
+
+def backfill(c):
+    """Crea los clientes a partir de los préstamos, uno por cédula."""
+    c.execute("""
+        INSERT INTO clientes (cedula, nombre, celular, nombre_norm)
+        SELECT DISTINCT ON (TRIM(cedula)) TRIM(cedula), nombre, celular, nombre_norm
+        FROM prestamos
+        WHERE NULLIF(TRIM(cedula), '') IS NOT NULL
+        ORDER BY TRIM(cedula), id DESC
+        ON CONFLICT (cedula) DO NOTHING
+    """)
+    # Recién llena, sin estadísticas el cruce por cédula recorre la tabla
+    # completa por cada préstamo
+    c.execute("ANALYZE clientes")
+    c.execute("""
+        UPDATE prestamos p SET cliente_id = cl.id
+        FROM clientes cl
+        WHERE p.cliente_id IS NULL AND cl.cedula = TRIM(p.cedula)
+    """)
+
+    # Sin cédula no hay con qué agrupar: un cliente por préstamo
+    c.execute("""
+        WITH nuevos AS MATERIALIZED (
+            SELECT id, nextval('clientes_id_seq') AS cliente_id, nombre, celular, nombre_norm
+            FROM prestamos
+            WHERE cliente_id IS NULL
+        ), creados AS (
+            INSERT INTO clientes (id, nombre, celular, nombre_norm)
+            SELECT cliente_id, nombre, celular, nombre_norm FROM nuevos
+        )
+        UPDATE prestamos p SET cliente_id = n.cliente_id
+        FROM nuevos n
+        WHERE p.id = n.id
+    """)
+    c.execute("ANALYZE clientes")
+
+
+# =========================
+# EXPOSICIÓN
+# =========================
+def _aplicar(c, filtro, params, signo):
+    asignaciones = ",\n".join(
+        f"{columna} = cl.{columna} + %(signo)s * a.{columna}" for columna in COLUMNAS
+    )
+    c.execute(f"""
+        UPDATE clientes cl
+        SET {asignaciones}
+        FROM ({SQL_APORTE.format(filtro=filtro)}) a
+        WHERE cl.id = a.cliente_id
+    """, dict(params, signo=signo))
+
+
+def sumar_prestamos(c, prestamo_ids):
+    _aplicar(c, "p.id = ANY(%(ids)s)", {"ids": list(prestamo_ids)}, 1)
+
+
+def quitar_prestamos(c, prestamo_ids):
+    _aplicar(c, "p.id = ANY(%(ids)s)", {"ids": list(prestamo_ids)}, -1)
+
+
+def reconstruir(c):
+    ceros = ", ".join(f"{columna} = 0" for columna in COLUMNAS)
+    c.execute(f"UPDATE clientes SET {ceros}")
+    _aplicar(c, "TRUE", {}, 1)
+
+
+def diferencias(c):
+    """(cliente, columna, guardado, esperado) por cada valor que no cuadra."""
+    c.execute(f"""
+        SELECT cl.id, {", ".join(f"cl.{columna}" for columna in COLUMNAS)},
+               {", ".join(f"COALESCE(a.{columna}, 0)" for columna in COLUMNAS)}
+        FROM clientes cl
+        LEFT JOIN ({SQL_APORTE.format(filtro="TRUE")}) a ON a.cliente_id = cl.id
+    """)
+    resultado = []
+    n = len(COLUMNAS)
+    for fila in c.fetchall():
+        for i, columna in enumerate(COLUMNAS):
+            guardado, esperado = fila[1 + i], fila[1 + n + i]
+            if guardado != esperado:
+                resultado.append((fila[0], columna, guardado, esperado))
+    return resultado
+
+
+# =========================
+# LECTURA
+# =========================
+def exposicion(c, cedula):
+    """Exposición del cliente con esa cédula, o None (una búsqueda por índice)."""
+    c.execute(f"""
+        SELECT id, nombre, {", ".join(COLUMNAS)}
+        FROM clientes
+        WHERE cedula = TRIM(%s)
+    """, (cedula,))
+    fila = c.fetchone()
+    if fila is None:
+        return None
+    datos = dict(zip(["id", "nombre"] + COLUMNAS, fila))
+    for columna in ("capital_total", "capital_en_calle", "deuda"):
+        datos[columna] = float(datos[columna] or Decimal(0))
+    return datos
+
+
+def pagina(c, orden, despues, limite):
+    """Una página de clientes ordenada por orden; devuelve (filas, siguiente)."""
+    columna, direccion = ORDENES.get(orden, ORDENES["deuda"])
+    comparador = ">" if direccion == "ASC" else "<"
+    params = {"limite": limite + 1}
+
+    cursor_sql = "TRUE"
+    if despues:
+        try:
+            valor, ultimo_id = despues.rsplit("_", 1)
+            params["despues_valor"] = Decimal(valor)
+            params["despues_id"] = int(ultimo_id)
+            cursor_sql = f"({columna}, id) {comparador} (%(despues_valor)s, %(despues_id)s)"
+        except (ValueError, ArithmeticError):
+            cursor_sql = "TRUE"
+
+    c.execute(f"""
+        SELECT id, nombre, cedula, celular, {", ".join(COLUMNAS)}
+        FROM clientes
+        WHERE prestamos > 0 AND {cursor_sql}
+        ORDER BY {columna} {direccion}, id {direccion}
+        LIMIT %(limite)s
+    """, params)
+    nombres = ["id", "nombre", "cedula", "celular"] + COLUMNAS
+    filas = [dict(zip(nombres, fila)) for fila in c.fetchall()]
+
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = f"{filas[-1][columna]}_{filas[-1]['id']}"
+    return filas, siguiente
@@ -0,0 +1,70 @@
+import os
+import threading
+import time
+
+# =========================
+# CACHÉ DE CONFIGURACIÓN
+# =========================
+# La tasa de mora casi nunca cambia, así que cada worker la guarda en
+# memoria para las páginas que solo la leen. Cada página cacheada compara
+# configuracion.version en la consulta de su etiqueta (vistas.py) y
+# descarta la caché si otro worker cambió la tasa; pasados CONFIG_TTL
+# segundos se vuelve a leer de todos modos. Quien guarda la tasa en la base
+# (recalcular_prestamo, el cierre) o en una caché de reportes la lee de la
+# base con mora_vigente().
+TTL = float(os.environ.get("CONFIG_TTL", 60))
+
+# Tope de la tasa de mora diaria (%) que acepta /configuracion
+MAX_MORA_DIARIA = 100
+
+_cache = {"mora_diaria": None, "version": None, "leido": 0.0}
+_lock = threading.Lock()
+
+
+def _vigente():
+    return (
+        _cache["mora_diaria"] is not None
+        and time.monotonic() - _cache["leido"] < TTL
+    )
+
+
+def mora_diaria(c):
+    """Tasa de mora diaria (%); solo consulta la base cuando vence la caché."""
+    if _vigente():
+        return _cache["mora_diaria"]
+    return mora_vigente(c)
+
+
+def mora_vigente(c):
+    """Tasa de mora diaria (%) leída de la base; renueva la caché."""
+    c.execute("SELECT mora_diaria, version FROM configuracion ORDER BY id LIMIT 1")
+    valor, version = c.fetchone()
+
+    with _lock:
+        _cache["mora_diaria"] = float(valor)
+        _cache["version"] = version
+        _cache["leido"] = time.monotonic()
+
+    return float(valor)
+
+
+def comprobar(version):
+    """Descarta la caché si la base ya tiene otra configuracion.version."""
+    with _lock:
+        if _cache["version"] != version:
+            _cache["leido"] = 0.0
+
+
+def invalidar():
+    with _lock:
+        _cache["leido"] = 0.0
+
+
+def cambiar_mora_diaria(c, valor):
+    # Llamar invalidar() después de confirmar la transacción
+    c.execute("""
+        UPDATE configuracion
+        SET mora_diaria = %s,
+            version = version + 1
+        WHERE id = (SELECT MIN(id) FROM configuracion)
+    """, (valor,))
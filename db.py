@@ -0,0 +1,122 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool
+
+from metricas import CursorMedido
+
+# =========================
+# CONFIGURACIÓN DEL POOL
+# =========================
+# El pool vive dentro de cada worker de gunicorn. DB_POOL_MAX debe ser al
+# menos el número de hilos por worker (--threads), y workers * DB_POOL_MAX
+# no debe superar el límite de conexiones de Postgres.
+DATABASE_URL = os.environ.get("DATABASE_URL")
+
+POOL_MIN = int(os.environ.get("DB_POOL_MIN", 1))
+POOL_MAX = int(os.environ.get("DB_POOL_MAX", 4))
+# Segundos que una petición espera por una conexión libre
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+# Segundos para abrir una conexión nueva
+CONNECT_TIMEOUT = int(os.environ.get("DB_CONNECT_TIMEOUT", 5))
+# Una conexión inactiva más de estos segundos se verifica antes de usarse
+IDLE_CHECK = float(os.environ.get("DB_POOL_IDLE_CHECK", 30))
+
+
+class PoolAgotado(Exception):
+    pass
+
+
+_pool = None
+_pid = None
+_cupos = None
+_ultimo_uso = {}
+_lock = threading.Lock()
+
+
+def _obtener_pool():
+    global _pool, _pid, _cupos
+
+    # Se crea de forma perezosa y de nuevo tras un fork, para que cada
+    # worker tenga sus propias conexiones.
+    if _pool is None or _pid != os.getpid():
+        with _lock:
+            if _pool is None or _pid != os.getpid():
+                _pool = pool.ThreadedConnectionPool(
+                    POOL_MIN, POOL_MAX, DATABASE_URL,
+                    connect_timeout=CONNECT_TIMEOUT,
+                    cursor_factory=CursorMedido
+                )
+                _cupos = threading.BoundedSemaphore(POOL_MAX)
+                _ultimo_uso.clear()
+                _pid = os.getpid()
+    return _pool
+
+
+def _saludable(conn):
+    if conn.closed:
+        return False
+
+    inactiva = time.monotonic() - _ultimo_uso.get(id(conn), 0)
+    if inactiva < IDLE_CHECK:
+        return True
+
+    try:
+        with conn.cursor() as c:
+            c.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _sacar(p):
+    conn = p.getconn()
+    if _saludable(conn):
+        return conn
+
+    # Conexión caída o vencida: se descarta y se abre una nueva
+    p.putconn(conn, close=True)
+    return p.getconn()
+
+
+def _devolver(p, conn, cerrar=False):
+    _ultimo_uso[id(conn)] = time.monotonic()
+    if cerrar or conn.closed:
+        _ultimo_uso.pop(id(conn), None)
+    p.putconn(conn, close=cerrar or bool(conn.closed))
+
+
+# =========================
+# CONEXIÓN
+# =========================
+@contextmanager
+def conexion():
+    """Presta una conexión del pool; confirma al salir y revierte si hay error."""
+    p = _obtener_pool()
+    cupos = _cupos
+
+    if not cupos.acquire(timeout=POOL_TIMEOUT):
+        raise PoolAgotado("No hay conexiones libres en el pool")
+
+    conn = None
+    try:
+        conn = _sacar(p)
+        try:
+            yield conn
+            conn.commit()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            _devolver(p, conn, cerrar=True)
+            conn = None
+            raise
+        except BaseException:
+            if not conn.closed:
+                conn.rollback()
+            raise
+    finally:
+        if conn is not None:
+            _devolver(p, conn)
+        cupos.release()
@@ -0,0 +1,338 @@
+import os
+import sys
+import threading
+from math import fsum
+
+import numpy as np
+
+import busqueda
+import resumen
+from calculos import PLAZO_POR_DEFECTO, calcular_cartera
+
+# =========================
+# INSTANTÁNEA DE LA CARTERA
+# =========================
+# Cada worker guarda los préstamos en arreglos NumPy, un arreglo por
+# columna y ordenados por id, en lugar de una tupla o un dict por préstamo.
+# El listado, /estadisticas y /buscar filtran, ordenan y suman sobre esos
+# arreglos; por petición solo se consulta qué cambió.
+#
+#   - la primera petición del worker carga todo, por lotes;
+#   - después se leen solo los préstamos escritos desde la versión cargada
+#     (resumen.cambios_desde) y se reemplazan, quitan o agregan;
+#   - si se reconstruyó el resumen o alguien escribió sin decir qué
+#     préstamos cambió (resumen.nueva_version sin ids) se recarga todo.
+#
+# Los valores del día (interés, mora, deuda) se calculan con calculos.py
+# sobre todos los arreglos una vez por versión, tasa y día.
+#
+# Los arreglos nunca se modifican: cada actualización arma un estado nuevo
+# y las peticiones en curso siguen con el que ya tenían.
+#
+# INSTANTANEA=0 vuelve a las consultas SQL (workers con poca memoria).
+
+ACTIVA = os.environ.get("INSTANTANEA", "1") != "0"
+LOTE_CARGA = 20000
+# /buscar revisa desde los préstamos más nuevos, de a este número
+LOTE_BUSQUEDA = 8192
+
+COLUMNAS = [
+    "id", "nombre", "cedula", "celular", "monto", "interes",
+    "fecha_prestamo", "fecha_pago", "medio", "objeto", "pagado",
+    "tipo_prestamo", "plazo_dias", "total_abonos", "version", "nombre_norm",
+]
+
+# Los montos llegan como float8 (el mismo valor que float(Decimal)): crear
+# un Decimal por valor era buena parte del tiempo de carga
+SQL_PRESTAMOS = """
+    SELECT p.id, p.nombre, p.cedula, p.celular, p.monto::float8, p.interes::float8,
+           p.fecha_prestamo, p.fecha_pago, p.medio, p.objeto, p.pagado,
+           p.tipo_prestamo, p.plazo_dias, COALESCE(r.total_abonos, 0)::float8, p.version,
+           p.nombre_norm
+    FROM prestamos p
+    LEFT JOIN resumen_prestamos r ON r.prestamo_id = p.id
+    WHERE {filtro}
+    ORDER BY p.id
+"""
+
+# Texto libre: bytes UTF-8 de ancho fijo, más una máscara de nulos
+TEXTO = ["nombre", "cedula", "celular", "objeto"]
+# Pocos valores distintos: referencias a la misma cadena
+CATEGORIAS = ["medio", "tipo_prestamo"]
+
+_estado = None
+_lock = threading.Lock()
+
+
+# =========================
+# CARGA
+# =========================
+def _convertir(filas):
+    """Filas de SQL_PRESTAMOS -> dict de arreglos."""
+    crudas = dict(zip(COLUMNAS, zip(*filas))) if filas else {c: () for c in COLUMNAS}
+
+    datos = {
+        "id": np.array(crudas["id"], dtype=np.int64),
+        "monto": np.array(crudas["monto"], dtype=float),
+        "interes": np.array(crudas["interes"], dtype=float),
+        "fecha_prestamo": np.array(crudas["fecha_prestamo"], dtype="datetime64[D]"),
+        "fecha_pago": np.array(crudas["fecha_pago"], dtype="datetime64[D]"),
+        "pagado": np.array(crudas["pagado"], dtype=bool),
+        "plazo_dias": np.array(
+            [PLAZO_POR_DEFECTO if d is None else d for d in crudas["plazo_dias"]],
+            dtype=np.int32
+        ),
+        "total_abonos": np.array(crudas["total_abonos"], dtype=float),
+        "version": np.array(crudas["version"], dtype=np.int32),
+        # " jose nunez ": las palabras se buscan con espacios a los lados
+        "busqueda": np.array([
+            b" " + (norm if norm is not None else busqueda.normalizar(nombre)).encode() + b" "
+            for norm, nombre in zip(crudas["nombre_norm"], crudas["nombre"])
+        ], dtype="S"),
+    }
+    for columna in TEXTO:
+        valores = crudas[columna]
+        datos[columna] = np.array([(v or "").encode() for v in valores], dtype="S")
+        datos[columna + "_nulo"] = np.array([v is None for v in valores], dtype=bool)
+    for columna in CATEGORIAS:
+        datos[columna] = np.array(
+            [v if v is None else sys.intern(v) for v in crudas[columna]], dtype=object
+        )
+    return datos
+
+
+def _leer(c, filtro, params=None):
+    # Cursor con nombre: las filas llegan por lotes y solo un lote existe
+    # como tuplas a la vez
+    lector = c.connection.cursor(name="instantanea")
+    lector.execute(SQL_PRESTAMOS.format(filtro=filtro), params)
+    partes = []
+    while True:
+        filas = lector.fetchmany(LOTE_CARGA)
+        if not filas:
+            break
+        partes.append(_convertir(filas))
+    lector.close()
+
+    if not partes:
+        return _convertir([])
+    return {columna: np.concatenate([p[columna] for p in partes]) for columna in partes[0]}
+
+
+def _aplicar(datos, ids, nuevas):
+    """
+    datos con los préstamos `ids` reemplazados por sus filas en `nuevas`
+    (los que no aparecen ahí se eliminaron). Devuelve arreglos nuevos.
+    """
+    actuales = datos["id"]
+    posiciones = np.searchsorted(actuales, ids)
+    existe = posiciones < len(actuales)
+    existe[existe] = actuales[posiciones[existe]] == ids[existe]
+
+    en_nuevas = np.isin(ids, nuevas["id"])
+    reemplazar = existe & en_nuevas
+    origen = np.searchsorted(nuevas["id"], ids[reemplazar])
+    destino = posiciones[reemplazar]
+
+    resultado = {}
+    for columna, valores in datos.items():
+        # astype copia; si el texto nuevo es más largo, también amplía el ancho
+        valores = valores.astype(np.result_type(valores, nuevas[columna]))
+        valores[destino] = nuevas[columna][origen]
+        resultado[columna] = valores
+
+    quitar = existe & ~en_nuevas
+    if quitar.any():
+        conservar = np.ones(len(actuales), dtype=bool)
+        conservar[posiciones[quitar]] = False
+        resultado = {columna: valores[conservar] for columna, valores in resultado.items()}
+
+    agregar = np.isin(nuevas["id"], ids[~existe])
+    if agregar.any():
+        resultado = {
+            columna: np.concatenate([valores, nuevas[columna][agregar]])
+            for columna, valores in resultado.items()
+        }
+        # Los ids nuevos casi siempre van al final; si no, se reordena
+        if np.any(np.diff(resultado["id"]) < 0):
+            orden = np.argsort(resultado["id"], kind="stable")
+            resultado = {columna: valores[orden] for columna, valores in resultado.items()}
+
+    return resultado
+
+
+def _nuevo_estado(version, datos):
+    return {"version": version, "datos": datos, "calculo": None}
+
+
+def actualizar(c):
+    """Estado vigente del worker, al día con la base. Una o dos consultas si nada cambió."""
+    global _estado
+
+    with _lock:
+        if _estado is None:
+            version = resumen.leer_version(c)
+            _estado = _nuevo_estado(version, _leer(c, "TRUE"))
+            return _estado
+
+        version, recarga, ids = resumen.cambios_desde(c, _estado["version"])
+        if recarga > _estado["version"]:
+            _estado = _nuevo_estado(version, _leer(c, "TRUE"))
+        elif version != _estado["version"]:
+            datos = _estado["datos"]
+            if ids:
+                ids = np.unique(np.array(ids, dtype=np.int64))
+                nuevas = _leer(c, "p.id = ANY(%(ids)s)", {"ids": ids.tolist()})
+                datos = _aplicar(datos, ids, nuevas)
+            _estado = _nuevo_estado(version, datos)
+        return _estado
+
+
+def memoria(estado):
+    """Bytes que ocupan los arreglos (las categorías se comparten)."""
+    return sum(valores.nbytes for valores in estado["datos"].values())
+
+
+# =========================
+# CÁLCULO
+# =========================
+def _calculo(estado, mora_porcentaje, hoy):
+    calculo = estado["calculo"]
+    if calculo is None or calculo["clave"] != (mora_porcentaje, hoy):
+        calculo = dict(calcular_cartera(estado["datos"], mora_porcentaje, hoy))
+        calculo["clave"] = (mora_porcentaje, hoy)
+        calculo["ordenes"] = {}
+        estado["calculo"] = calculo
+    return calculo
+
+
+def _orden(estado, calculo, columna, direccion):
+    """Posiciones ordenadas por (columna, id); se guarda con el cálculo."""
+    orden = calculo["ordenes"].get((columna, direccion))
+    if orden is None:
+        orden = np.lexsort((estado["datos"]["id"], calculo[columna]))
+        if direccion == "DESC":
+            orden = orden[::-1]
+        calculo["ordenes"][(columna, direccion)] = orden
+    return orden
+
+
+def _coincide(datos, q, desde=0, hasta=None):
+    """Máscara de los préstamos que encuentra busqueda.condicion(q), en desde:hasta."""
+    tramo = slice(desde, hasta)
+    tipo, valor = busqueda.terminos(q)
+    if tipo == "numero":
+        prefijo = valor.encode()
+        return (np.char.startswith(datos["cedula"][tramo], prefijo)
+                | np.char.startswith(datos["celular"][tramo], prefijo))
+
+    nombres = datos["busqueda"][tramo]
+    if not valor:
+        return np.zeros(len(nombres), dtype=bool)
+
+    mascara = np.char.find(nombres, b" " + valor[-1].encode()) >= 0
+    for palabra in valor[:-1]:
+        mascara &= np.char.find(nombres, b" " + palabra.encode() + b" ") >= 0
+    return mascara
+
+
+# =========================
+# LECTURA
+# =========================
+def filas(estado, posiciones, nombres):
+    """Tuplas con las columnas `nombres` de los préstamos en `posiciones`."""
+    datos = estado["datos"]
+    columnas = []
+    for nombre in nombres:
+        valores = datos[nombre][posiciones]
+        if nombre in TEXTO:
+            nulos = datos[nombre + "_nulo"][posiciones]
+            columnas.append([
+                None if nulo else valor.decode() for valor, nulo in zip(valores, nulos)
+            ])
+        else:
+            # tolist() entrega int, float, bool, date (o None) y str
+            columnas.append(valores.tolist())
+    return list(zip(*columnas))
+
+
+def pagina(estado, filtros, orden, cursor, limite, mora_porcentaje, hoy, nombres):
+    """
+    Igual que consultar_pagina en app.py, desde la instantánea: orden es
+    (columna, dirección) y cursor (valor, id) del último registro visto o
+    None. Devuelve (filas, siguiente).
+    """
+    datos = estado["datos"]
+    calculo = _calculo(estado, mora_porcentaje, hoy)
+    ids = datos["id"]
+
+    mascara = np.ones(len(ids), dtype=bool)
+    if filtros["estado"] == "pendientes":
+        mascara &= ~datos["pagado"]
+    elif filtros["estado"] == "pagados":
+        mascara &= datos["pagado"]
+
+    if filtros["tipo"] in ("fijo", "indefinido"):
+        mascara &= datos["tipo_prestamo"] == filtros["tipo"]
+
+    if filtros["vencidos"]:
+        mascara &= calculo["dias_vencidos"] > 0
+
+    if filtros["q"]:
+        mascara &= _coincide(datos, filtros["q"])
+
+    columna, direccion = orden
+    if columna == "id":
+        if cursor:
+            mascara &= ids > cursor[1] if direccion == "ASC" else ids < cursor[1]
+        posiciones = np.flatnonzero(mascara)
+        if direccion == "DESC":
+            posiciones = posiciones[::-1]
+    else:
+        clave = calculo[columna]
+        if cursor:
+            valor, ultimo_id = float(cursor[0]), cursor[1]
+            if direccion == "ASC":
+                mascara &= (clave > valor) | ((clave == valor) & (ids > ultimo_id))
+            else:
+                mascara &= (clave < valor) | ((clave == valor) & (ids < ultimo_id))
+        posiciones = _orden(estado, calculo, columna, direccion)
+        posiciones = posiciones[mascara[posiciones]]
+
+    posiciones = posiciones[:limite + 1]
+    siguiente = None
+    if len(posiciones) > limite:
+        posiciones = posiciones[:limite]
+        ultima = posiciones[-1]
+        siguiente = str(ids[ultima]) if columna == "id" else f"{calculo[columna][ultima].item()}_{ids[ultima]}"
+
+    return filas(estado, posiciones, nombres), siguiente
+
+
+def buscar(estado, q, limite=busqueda.LIMITE):
+    """Igual que busqueda.buscar, desde la instantánea."""
+    # Los más nuevos primero: casi siempre basta con el último tramo
+    encontradas = []
+    hasta = len(estado["datos"]["id"])
+    while hasta > 0 and sum(len(p) for p in encontradas) < limite:
+        desde = max(hasta - LOTE_BUSQUEDA, 0)
+        encontradas.append(desde + np.flatnonzero(_coincide(estado["datos"], q, desde, hasta))[::-1])
+        hasta = desde
+    posiciones = np.concatenate(encontradas)[:limite] if encontradas else np.array([], dtype=np.int64)
+    nombres = ["id", "nombre", "cedula", "celular", "monto", "tipo_prestamo", "pagado"]
+    return [dict(zip(nombres, fila)) for fila in filas(estado, posiciones, nombres)]
+
+
+def totales(estado, mora_porcentaje, hoy):
+    """Igual que resumen.leer_totales, sumando los arreglos."""
+    datos = estado["datos"]
+    calculo = _calculo(estado, mora_porcentaje, hoy)
+    if "totales" not in calculo:
+        # fsum: suma exacta, sin el error que acumula sumar 100.000 floats
+        calculo["totales"] = {
+            "total_prestado": fsum(datos["monto"].tolist()),
+            "total_abonos": fsum(datos["total_abonos"].tolist()),
+            "capital_en_calle": fsum(datos["monto"][~datos["pagado"]].tolist()),
+            "total_interes": fsum(calculo["interes_total"].tolist()),
+        }
+    return calculo["totales"]
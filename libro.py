@@ -0,0 +1,320 @@
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from psycopg2.extras import execute_values, Json
+
+from calculos import DIAS_CICLO, PLAZO_POR_DEFECTO, redondear
+
+# =========================
+# LIBRO DEL PRÉSTAMO
+# =========================
+# movimientos guarda los hechos de cada préstamo en orden:
+#
+#   desembolso      condiciones iniciales (copiadas de la fila)
+#   edicion         condiciones nuevas tras editar
+#   abono           pago registrado
+#   reinicio_ciclo  "mes pagado": el conteo de ciclos arranca de nuevo
+#   pagado          préstamo marcado como pagado
+#
+# Los cargos que dependen del tiempo (interés por ciclo y mora) no se
+# guardan: el cronograma los genera al reproducir los movimientos, con las
+# mismas reglas de calculos.py, de modo que el saldo final coincide con el
+# listado.
+
+TABLA = '''
+    CREATE TABLE IF NOT EXISTS movimientos (
+        id BIGSERIAL PRIMARY KEY,
+        prestamo_id INTEGER NOT NULL REFERENCES prestamos(id) ON DELETE CASCADE,
+        tipo TEXT NOT NULL,
+        fecha DATE NOT NULL,
+        monto NUMERIC,
+        detalle JSONB
+    )
+'''
+
+INDICE = '''
+    CREATE INDEX IF NOT EXISTS idx_movimientos_prestamo
+    ON movimientos (prestamo_id, id)
+'''
+
+# Condiciones del préstamo tal como están en la fila
+SQL_CONDICIONES = """
+    jsonb_build_object(
+        'interes', interes,
+        'tipo_prestamo', tipo_prestamo,
+        'plazo_dias', plazo_dias,
+        'fecha_prestamo', fecha_prestamo
+    )
+"""
+
+
+# =========================
+# REGISTRAR
+# =========================
+def registrar_condiciones(c, prestamo_id, tipo, fecha=None):
+    """Guarda un desembolso o edición con las condiciones actuales de la fila."""
+    c.execute("""
+        INSERT INTO movimientos (prestamo_id, tipo, fecha, monto, detalle)
+        SELECT id, %(tipo)s, COALESCE(%(fecha)s, fecha_prestamo), monto,
+               """ + SQL_CONDICIONES + """
+        FROM prestamos
+        WHERE id = %(id)s
+    """, {"id": prestamo_id, "tipo": tipo, "fecha": fecha})
+
+
+def registrar(c, prestamo_id, tipo, fecha, detalle=None):
+    c.execute("""
+        INSERT INTO movimientos (prestamo_id, tipo, fecha, detalle)
+        VALUES (%s, %s, %s, %s)
+    """, (prestamo_id, tipo, fecha, Json(detalle) if detalle else None))
+
+
+def registrar_abonos(c, abono_ids, abonos):
+    execute_values(c, """
+        INSERT INTO movimientos (prestamo_id, tipo, fecha, monto, detalle)
+        VALUES %s
+    """, [
+        (prestamo_id, "abono", fecha, monto, Json({"abono_id": abono_id}))
+        for abono_id, (prestamo_id, fecha, monto) in zip(abono_ids, abonos)
+    ])
+
+
+def backfill(c):
+    """Movimientos iniciales para préstamos creados antes del libro."""
+    c.execute("""
+        INSERT INTO movimientos (prestamo_id, tipo, fecha, monto, detalle)
+        SELECT id, 'desembolso', fecha_prestamo, monto, """ + SQL_CONDICIONES + """
+        FROM prestamos
+        WHERE NOT EXISTS (SELECT 1 FROM movimientos m WHERE m.prestamo_id = prestamos.id)
+        ORDER BY id
+    """)
+    c.execute("""
+        INSERT INTO movimientos (prestamo_id, tipo, fecha, monto, detalle)
+        SELECT a.prestamo_id, 'abono', a.fecha, a.monto,
+               jsonb_build_object('abono_id', a.id)
+        FROM abonos a
+        WHERE a.prestamo_id IS NOT NULL
+          AND NOT EXISTS (
+              SELECT 1 FROM movimientos m
+              WHERE m.prestamo_id = a.prestamo_id AND m.tipo = 'abono'
+                AND (m.detalle->>'abono_id')::int = a.id
+          )
+        ORDER BY a.prestamo_id, a.fecha, a.id
+    """)
+    # El último abono de todos los préstamos en una pasada: MAX(fecha) por
+    # préstamo se planea recorriendo el índice de fecha de cada partición
+    c.execute("""
+        INSERT INTO movimientos (prestamo_id, tipo, fecha)
+        SELECT p.id, 'pagado', COALESCE(u.ultimo, p.fecha_pago, p.fecha_prestamo)
+        FROM prestamos p
+        LEFT JOIN (
+            SELECT prestamo_id, MAX(fecha) AS ultimo
+            FROM abonos
+            GROUP BY prestamo_id
+        ) u ON u.prestamo_id = p.id
+        WHERE p.pagado = TRUE
+          AND NOT EXISTS (
+              SELECT 1 FROM movimientos m
+              WHERE m.prestamo_id = p.id AND m.tipo = 'pagado'
+          )
+    """)
+
+
+# =========================
+# CRONOGRAMA
+# =========================
+def _condiciones(movimiento):
+    detalle = movimiento["detalle"]
+    return {
+        "capital": Decimal(movimiento["monto"]),
+        "interes": Decimal(str(detalle["interes"])),
+        "fijo": detalle["tipo_prestamo"] == "fijo",
+        "plazo_dias": detalle["plazo_dias"] or PLAZO_POR_DEFECTO,
+        "inicio": _fecha(detalle["fecha_prestamo"]),
+    }
+
+
+def _fecha(valor):
+    # detalle llega de JSONB, con las fechas como texto
+    if isinstance(valor, str):
+        return date.fromisoformat(valor)
+    return valor
+
+
+def _centavos(valor):
+    return Decimal(repr(redondear(valor).item()))
+
+
+def generar(movimientos, hoy, mora_porcentaje):
+    """
+    Reproduce los movimientos (ordenados por id) y produce, de forma
+    perezosa, las filas del libro: fecha, concepto, cargo, abono y saldo.
+    """
+    estado = None
+    saldo = Decimal(0)
+    cargos_periodo = Decimal(0)
+    ciclos_periodo = 0
+    mora_cargada = Decimal(0)
+    pagado = any(m["tipo"] == "pagado" for m in movimientos)
+
+    def base():
+        # Capital más interés del periodo, en float como calculos.py
+        capital = float(estado["capital"])
+        return capital + capital * (float(estado["interes"]) / 100) * ciclos_periodo
+
+    def saldo_mostrado():
+        # Como deuda_restante en calculos.py: (capital + interés) + mora
+        # menos lo demás (abonos y periodos cerrados), redondeado y sin
+        # saldo a favor. Sumado en Decimal, un medio centavo exacto puede
+        # caer al otro lado del que da el listado.
+        if estado is None:
+            return _centavos(max(float(saldo), 0))
+        abonado = estado["capital"] + cargos_periodo + mora_cargada - saldo
+        return _centavos(max(base() + float(mora_cargada) - float(abonado), 0))
+
+    def fila(fecha, concepto, cargo=Decimal(0), abono=Decimal(0)):
+        nonlocal saldo
+        saldo += cargo - abono
+        return {"fecha": fecha, "concepto": concepto,
+                "cargo": cargo, "abono": abono, "saldo": saldo_mostrado()}
+
+    def ciclos_hasta(desde, hasta):
+        # Ciclos iniciados entre desde y hasta, igual que calculos.py
+        return max((hasta - desde).days // DIAS_CICLO + 1, 0)
+
+    def cargos_de_interes(desde_ciclo, hasta_ciclo):
+        nonlocal cargos_periodo, ciclos_periodo
+        cuota = estado["capital"] * estado["interes"] / 100
+        for k in range(desde_ciclo, hasta_ciclo):
+            cargos_periodo += cuota
+            ciclos_periodo += 1
+            yield fila(
+                estado["inicio"] + timedelta(days=k * DIAS_CICLO),
+                f"Interés ciclo {k + 1}" if not estado["fijo"] else "Interés del plazo",
+                cargo=cuota
+            )
+
+    ciclos_emitidos = 0
+    for movimiento in movimientos:
+        tipo = movimiento["tipo"]
+
+        # Antes de cada hecho, los ciclos de interés ya iniciados
+        if estado and not estado["fijo"]:
+            hasta = ciclos_hasta(estado["inicio"], min(movimiento["fecha"], hoy))
+            yield from cargos_de_interes(ciclos_emitidos, hasta)
+            ciclos_emitidos = max(ciclos_emitidos, hasta)
+
+        if tipo in ("desembolso", "edicion"):
+            if estado:
+                # La edición reemplaza las condiciones: se reversa lo cargado
+                yield fila(movimiento["fecha"], "Edición: reverso de condiciones",
+                           abono=estado["capital"] + cargos_periodo)
+            estado = _condiciones(movimiento)
+            cargos_periodo = Decimal(0)
+            ciclos_periodo = 0
+            ciclos_emitidos = 0
+            yield fila(estado["inicio"],
+                       "Desembolso" if tipo == "desembolso" else "Desembolso (editado)",
+                       cargo=estado["capital"])
+            if estado["fijo"]:
+                yield from cargos_de_interes(0, 1)
+                ciclos_emitidos = 1
+
+        elif tipo == "abono":
+            yield fila(movimiento["fecha"], "Abono", abono=Decimal(movimiento["monto"]))
+
+        elif tipo == "reinicio_ciclo" and estado:
+            # Mes pagado: los ciclos del periodo anterior quedan saldados
+            if cargos_periodo:
+                yield fila(movimiento["fecha"], "Mes pagado: cierre de ciclos",
+                           abono=cargos_periodo)
+            estado["inicio"] = movimiento["fecha"]
+            cargos_periodo = Decimal(0)
+            ciclos_periodo = 0
+            ciclos_emitidos = 0
+
+        elif tipo == "pagado":
+            yield fila(movimiento["fecha"], "Marcado como pagado")
+
+    if estado is None:
+        return
+
+    # Ciclos iniciados hasta hoy
+    if not estado["fijo"]:
+        yield from cargos_de_interes(ciclos_emitidos, ciclos_hasta(estado["inicio"], hoy))
+        return
+
+    # Mora de préstamos fijos vencidos y sin pagar, por tramos de 30 días
+    vencimiento = estado["inicio"] + timedelta(days=estado["plazo_dias"])
+    dias_vencidos = (hoy - vencimiento).days
+    if pagado or dias_vencidos <= 0:
+        return
+
+    mora_total = _centavos(base() * (mora_porcentaje / 100) * dias_vencidos)
+    for desde in range(0, dias_vencidos, DIAS_CICLO):
+        dias = min(DIAS_CICLO, dias_vencidos - desde)
+        if desde + dias >= dias_vencidos:
+            tramo = mora_total - mora_cargada
+        else:
+            tramo = _centavos(base() * (mora_porcentaje / 100) * dias)
+        mora_cargada += tramo
+        yield fila(vencimiento + timedelta(days=desde + 1),
+                   f"Mora {dias} días", cargo=tramo)
+
+
+class Cronograma:
+    """Filas del libro generadas a medida que se piden y guardadas."""
+
+    def __init__(self, generador):
+        self._generador = generador
+        self._filas = []
+        self._completo = False
+        self._lock = threading.Lock()
+
+    def filas(self, inicio, cantidad):
+        with self._lock:
+            while not self._completo and len(self._filas) < inicio + cantidad:
+                try:
+                    self._filas.append(next(self._generador))
+                except StopIteration:
+                    self._completo = True
+            return self._filas[inicio:inicio + cantidad], (
+                not self._completo or len(self._filas) > inicio + cantidad
+            )
+
+
+# Cronogramas memorizados por (préstamo, último movimiento, día, tasa)
+MAX_CRONOGRAMAS = 256
+_cronogramas = OrderedDict()
+_cronogramas_lock = threading.Lock()
+
+
+def cronograma(c, prestamo_id, hoy, mora_porcentaje):
+    c.execute("SELECT MAX(id) FROM movimientos WHERE prestamo_id = %s", (prestamo_id,))
+    ultimo = c.fetchone()[0]
+    llave = (prestamo_id, ultimo, hoy, mora_porcentaje)
+
+    with _cronogramas_lock:
+        if llave in _cronogramas:
+            _cronogramas.move_to_end(llave)
+            return _cronogramas[llave]
+
+    c.execute("""
+        SELECT id, tipo, fecha, monto, detalle
+        FROM movimientos
+        WHERE prestamo_id = %s
+        ORDER BY id
+    """, (prestamo_id,))
+    movimientos = [
+        {"id": f[0], "tipo": f[1], "fecha": f[2], "monto": f[3], "detalle": f[4]}
+        for f in c.fetchall()
+    ]
+
+    nuevo = Cronograma(generar(movimientos, hoy, mora_porcentaje))
+    with _cronogramas_lock:
+        _cronogramas[llave] = nuevo
+        while len(_cronogramas) > MAX_CRONOGRAMAS:
+            _cronogramas.popitem(last=False)
+    return nuevo
@@ -0,0 +1,124 @@
+import csv
+import io
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from psycopg2.extras import Json
+
+import resumen
+
+# =========================
+# LOTES DE ABONOS
+# =========================
+# Carga de muchos abonos en una sola transacción (la ruta del cobrador al
+# final del día). Con una clave de idempotencia, reenviar el mismo lote
+# devuelve el resultado guardado en vez de registrar los abonos otra vez.
+
+LIMITE_LOTE = 5000
+
+
+class LoteInvalido(Exception):
+    pass
+
+
+def leer_filas(request):
+    """Filas crudas del cuerpo: JSON ({"abonos": [...]} o lista) o CSV."""
+    if request.mimetype == "text/csv":
+        texto = request.get_data(as_text=True)
+        return list(csv.DictReader(io.StringIO(texto)))
+
+    datos = request.get_json(silent=True)
+    if isinstance(datos, dict):
+        datos = datos.get("abonos")
+    if not isinstance(datos, list):
+        raise LoteInvalido("Se esperaba una lista de abonos en JSON o un CSV")
+    return datos
+
+
+def validar_fila(fila, hoy):
+    """Devuelve (prestamo_id, fecha, monto) o lanza ValueError con el motivo."""
+    if not isinstance(fila, dict):
+        raise ValueError("fila inválida")
+
+    try:
+        prestamo_id = int(fila.get("prestamo_id"))
+    except (TypeError, ValueError):
+        raise ValueError("prestamo_id inválido")
+
+    fecha = fila.get("fecha") or None
+    if fecha is None:
+        fecha = hoy
+    else:
+        try:
+            fecha = datetime.strptime(str(fecha), "%Y-%m-%d").date()
+        except ValueError:
+            raise ValueError("fecha inválida, use AAAA-MM-DD")
+
+    try:
+        monto = Decimal(str(fila.get("monto")))
+    except InvalidOperation:
+        raise ValueError("monto inválido")
+    if not monto.is_finite() or monto <= 0:
+        raise ValueError("el monto debe ser mayor que cero")
+
+    return prestamo_id, fecha, monto
+
+
+def procesar(c, filas, clave, hoy):
+    """
+    Valida y registra el lote dentro de la transacción de c.
+    Devuelve el resultado por fila (el mismo si la clave ya se procesó).
+    """
+    if len(filas) > LIMITE_LOTE:
+        raise LoteInvalido(f"El lote supera el máximo de {LIMITE_LOTE} abonos")
+
+    if clave:
+        # Si otra petición con la misma clave está en curso, esto espera a
+        # que termine; después se devuelve lo que esa petición guardó
+        c.execute("""
+            INSERT INTO lotes_abonos (clave) VALUES (%s)
+            ON CONFLICT (clave) DO NOTHING
+            RETURNING clave
+        """, (clave,))
+        if c.fetchone() is None:
+            c.execute("SELECT resultado FROM lotes_abonos WHERE clave = %s", (clave,))
+            return c.fetchone()[0]
+
+    resultados = []
+    validas = []
+    for i, fila in enumerate(filas):
+        try:
+            validas.append((i, validar_fila(fila, hoy)))
+        except ValueError as error:
+            resultados.append({"fila": i, "estado": "error", "error": str(error)})
+
+    # Existencia de todos los préstamos del lote en una sola consulta
+    ids = sorted({abono[0] for _, abono in validas})
+    c.execute("SELECT id FROM prestamos WHERE id = ANY(%s)", (ids,))
+    existentes = {fila[0] for fila in c.fetchall()}
+
+    por_insertar = []
+    for i, abono in validas:
+        if abono[0] in existentes:
+            por_insertar.append((i, abono))
+        else:
+            resultados.append({"fila": i, "estado": "error", "error": "el préstamo no existe"})
+
+    abono_ids = resumen.registrar_abonos(c, [abono for _, abono in por_insertar])
+    for (i, _), abono_id in zip(por_insertar, abono_ids):
+        resultados.append({"fila": i, "estado": "ok", "abono_id": abono_id})
+
+    resultados.sort(key=lambda r: r["fila"])
+    resultado = {
+        "insertados": len(abono_ids),
+        "rechazados": len(resultados) - len(abono_ids),
+        "resultados": resultados,
+    }
+
+    if clave:
+        c.execute(
+            "UPDATE lotes_abonos SET resultado = %s WHERE clave = %s",
+            (Json(resultado), clave)
+        )
+
+    return resultado
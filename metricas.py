@@ -0,0 +1,179 @@
+import logging
+import os
+import threading
+import time
+
+from flask import before_render_template, template_rendered, request
+from psycopg2.extensions import cursor as CursorBase
+
+# =========================
+# MÉTRICAS POR PETICIÓN
+# =========================
+# Cada petición mide su tiempo total y lo separa en base de datos (tiempo
+# y número de consultas, medidos en el cursor), plantilla (señales de
+# render_template) y cómputo (el resto). Los acumulados son por worker y
+# se publican en /metrics en formato Prometheus.
+
+UMBRAL_LENTO_MS = float(os.environ.get("SLOW_REQUEST_MS", 1000))
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+log = logging.getLogger("metricas")
+
+_hilo = threading.local()
+_lock = threading.Lock()
+_peticiones = {}
+_rutas = {}
+
+
+def _medicion():
+    return getattr(_hilo, "medicion", None)
+
+
+class CursorMedido(CursorBase):
+    """Cursor que suma tiempo y número de consultas a la petición actual."""
+
+    def execute(self, query, vars=None):
+        medicion = _medicion()
+        if medicion is None:
+            return super().execute(query, vars)
+
+        inicio = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            medicion["db"] += time.perf_counter() - inicio
+            medicion["consultas"] += 1
+
+    def executemany(self, query, vars_list):
+        medicion = _medicion()
+        if medicion is None:
+            return super().executemany(query, vars_list)
+
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            medicion["db"] += time.perf_counter() - inicio
+            medicion["consultas"] += 1
+
+
+# =========================
+# GANCHOS DE FLASK
+# =========================
+def _iniciar():
+    _hilo.medicion = {
+        "inicio": time.perf_counter(),
+        "db": 0.0,
+        "consultas": 0,
+        "plantilla": 0.0,
+        "plantilla_inicio": None,
+        "estado": 500,
+    }
+
+
+def _antes_de_plantilla(sender, template, context, **extra):
+    medicion = _medicion()
+    if medicion is not None:
+        medicion["plantilla_inicio"] = time.perf_counter()
+
+
+def _despues_de_plantilla(sender, template, context, **extra):
+    medicion = _medicion()
+    if medicion is not None and medicion["plantilla_inicio"] is not None:
+        medicion["plantilla"] += time.perf_counter() - medicion["plantilla_inicio"]
+        medicion["plantilla_inicio"] = None
+
+
+def _guardar_estado(respuesta):
+    medicion = _medicion()
+    if medicion is not None:
+        medicion["estado"] = respuesta.status_code
+    return respuesta
+
+
+def _terminar(error=None):
+    medicion = _medicion()
+    _hilo.medicion = None
+    if medicion is None:
+        return
+
+    total = time.perf_counter() - medicion["inicio"]
+    computo = max(total - medicion["db"] - medicion["plantilla"], 0.0)
+    ruta = request.endpoint or "desconocida"
+
+    with _lock:
+        llave = (ruta, medicion["estado"])
+        _peticiones[llave] = _peticiones.get(llave, 0) + 1
+
+        acumulado = _rutas.setdefault(ruta, {
+            "conteo": 0, "total": 0.0, "db": 0.0, "consultas": 0,
+            "plantilla": 0.0, "computo": 0.0, "buckets": [0] * len(BUCKETS),
+        })
+        acumulado["conteo"] += 1
+        acumulado["total"] += total
+        acumulado["db"] += medicion["db"]
+        acumulado["consultas"] += medicion["consultas"]
+        acumulado["plantilla"] += medicion["plantilla"]
+        acumulado["computo"] += computo
+        for i, limite in enumerate(BUCKETS):
+            if total <= limite:
+                acumulado["buckets"][i] += 1
+
+    if total * 1000 >= UMBRAL_LENTO_MS:
+        log.warning(
+            "Petición lenta %s %s (%s): total=%.1fms db=%.1fms consultas=%d "
+            "plantilla=%.1fms computo=%.1fms",
+            request.method, request.path, ruta, total * 1000,
+            medicion["db"] * 1000, medicion["consultas"],
+            medicion["plantilla"] * 1000, computo * 1000
+        )
+
+
+def instalar(app):
+    app.before_request(_iniciar)
+    app.after_request(_guardar_estado)
+    app.teardown_request(_terminar)
+    before_render_template.connect(_antes_de_plantilla, app)
+    template_rendered.connect(_despues_de_plantilla, app)
+
+
+# =========================
+# EXPOSICIÓN PROMETHEUS
+# =========================
+def exportar():
+    lineas = []
+
+    def serie(nombre, tipo, ayuda):
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} {tipo}")
+
+    with _lock:
+        peticiones = dict(_peticiones)
+        rutas = {ruta: dict(datos, buckets=list(datos["buckets"]))
+                 for ruta, datos in _rutas.items()}
+
+    serie("app_requests_total", "counter", "Peticiones atendidas por ruta y estado")
+    for (ruta, estado), conteo in sorted(peticiones.items()):
+        lineas.append(f'app_requests_total{{ruta="{ruta}",estado="{estado}"}} {conteo}')
+
+    serie("app_request_seconds", "histogram", "Duración total de la petición")
+    for ruta, datos in sorted(rutas.items()):
+        for limite, conteo in zip(BUCKETS, datos["buckets"]):
+            lineas.append(f'app_request_seconds_bucket{{ruta="{ruta}",le="{limite}"}} {conteo}')
+        lineas.append(f'app_request_seconds_bucket{{ruta="{ruta}",le="+Inf"}} {datos["conteo"]}')
+        lineas.append(f'app_request_seconds_sum{{ruta="{ruta}"}} {datos["total"]:.6f}')
+        lineas.append(f'app_request_seconds_count{{ruta="{ruta}"}} {datos["conteo"]}')
+
+    for nombre, campo, ayuda in [
+        ("app_db_seconds_total", "db", "Tiempo en la base de datos"),
+        ("app_db_queries_total", "consultas", "Consultas ejecutadas"),
+        ("app_template_seconds_total", "plantilla", "Tiempo renderizando plantillas"),
+        ("app_compute_seconds_total", "computo", "Tiempo en Python fuera de base de datos y plantillas"),
+    ]:
+        serie(nombre, "counter", ayuda)
+        for ruta, datos in sorted(rutas.items()):
+            valor = datos[campo]
+            valor = f"{valor:.6f}" if isinstance(valor, float) else valor
+            lineas.append(f'{nombre}{{ruta="{ruta}"}} {valor}')
+
+    return "\n".join(lineas) + "\n"
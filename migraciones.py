@@ -0,0 +1,604 @@
+import sys
+from datetime import date
+
+from werkzeug.security import generate_password_hash
+
+from db import conexion
+import resumen
+import libro
+import particiones
+import busqueda
+
+# =========================
+# MIGRACIONES
+# =========================
+# Cada paso se aplica una sola vez, en orden, y queda registrado en
+# schema_version. Se ejecutan al desplegar (fase release del Procfile):
+#
+#   python migraciones.py
+#   python migraciones.py --verificar-indices
+#   python migraciones.py --particiones
+#
+# Los workers nunca ejecutan DDL al arrancar.
+
+# Llave del candado que evita dos migraciones simultáneas
+CANDADO = 7301
+
+
+def _001_esquema_base(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS prestamos (
+            id SERIAL PRIMARY KEY,
+            nombre TEXT,
+            cedula TEXT,
+            celular TEXT,
+            monto NUMERIC,
+            interes NUMERIC,
+            fecha_prestamo DATE,
+            fecha_pago DATE,
+            medio TEXT,
+            objeto TEXT,
+            pagado BOOLEAN DEFAULT FALSE,
+            tipo_prestamo TEXT DEFAULT 'fijo',
+            plazo_dias INTEGER DEFAULT 30
+        )
+    ''')
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS abonos (
+            id SERIAL PRIMARY KEY,
+            prestamo_id INTEGER REFERENCES prestamos(id) ON DELETE CASCADE,
+            fecha DATE,
+            monto NUMERIC
+        )
+    ''')
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS configuracion (
+            id SERIAL PRIMARY KEY,
+            mora_diaria NUMERIC
+        )
+    ''')
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS usuarios (
+            id SERIAL PRIMARY KEY,
+            usuario TEXT UNIQUE,
+            password TEXT
+        )
+    ''')
+
+    # Crear admin si no existe
+    c.execute("SELECT COUNT(*) FROM usuarios")
+    if c.fetchone()[0] == 0:
+        c.execute(
+            "INSERT INTO usuarios (usuario, password) VALUES (%s, %s)",
+            ("admin", generate_password_hash("Monteria12####"))
+        )
+
+    c.execute("SELECT COUNT(*) FROM configuracion")
+    if c.fetchone()[0] == 0:
+        c.execute("INSERT INTO configuracion (mora_diaria) VALUES (%s)", (0.5,))
+
+
+def _002_indices_listado(c):
+    c.execute("CREATE INDEX IF NOT EXISTS idx_abonos_prestamo ON abonos (prestamo_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_prestamos_pagado ON prestamos (pagado, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_prestamos_tipo ON prestamos (tipo_prestamo, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_prestamos_cedula ON prestamos (cedula text_pattern_ops)")
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_prestamos_vencimiento
+        ON prestamos ((fecha_prestamo + COALESCE(plazo_dias, 30)))
+        WHERE tipo_prestamo = 'fijo' AND pagado = FALSE
+    """)
+
+
+def _003_resumen_cartera(c):
+    for sql in resumen.TABLAS:
+        c.execute(sql)
+
+    c.execute("SELECT COUNT(*) FROM resumen_cartera")
+    if c.fetchone()[0] == 0:
+        resumen.reconstruir(c)
+
+
+def _004_indice_reporte_corte(c):
+    # Cubre el reporte por rango sin visitar la tabla
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_abonos_fecha
+        ON abonos (fecha) INCLUDE (prestamo_id, monto)
+    """)
+    c.execute("ANALYZE prestamos")
+    c.execute("ANALYZE abonos")
+
+
+def _005_version_configuracion(c):
+    c.execute("""
+        ALTER TABLE configuracion
+        ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1
+    """)
+
+
+def _006_lotes_abonos(c):
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS lotes_abonos (
+            clave TEXT PRIMARY KEY,
+            resultado JSONB,
+            creado TIMESTAMP DEFAULT NOW()
+        )
+    """)
+
+
+def _007_libro_de_prestamos(c):
+    c.execute(libro.TABLA)
+    c.execute(libro.INDICE)
+    libro.backfill(c)
+
+
+def _008_particionar_abonos(c):
+    particiones.convertir(c)
+
+    # En bases creadas desde cero, la migración 3 ya la creó y llenó
+    c.execute(resumen.TABLAS[-1])
+    c.execute("DELETE FROM resumen_mensual")
+    c.execute("INSERT INTO resumen_mensual (mes, total) " + resumen.SQL_MENSUAL)
+
+
+def _009_cierre_diario(c):
+    c.execute("""
+        ALTER TABLE prestamos
+        ADD COLUMN IF NOT EXISTS mora NUMERIC NOT NULL DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS dias_vencidos INTEGER NOT NULL DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS proxima_fecha_pago DATE,
+        ADD COLUMN IF NOT EXISTS calculado_al DATE
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS cierres_diarios (
+            fecha DATE PRIMARY KEY,
+            prestamos_vencidos INTEGER NOT NULL,
+            mora_total NUMERIC NOT NULL,
+            mora_porcentaje NUMERIC NOT NULL,
+            ejecutado TIMESTAMP DEFAULT NOW()
+        )
+    """)
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_prestamos_dias_vencidos
+        ON prestamos (dias_vencidos, id)
+    """)
+
+
+def _010_busqueda_de_clientes(c):
+    c.execute("ALTER TABLE prestamos ADD COLUMN IF NOT EXISTS nombre_norm TEXT")
+    busqueda.rellenar(c)
+    for sql in busqueda.INDICES:
+        c.execute(sql)
+    c.execute("ANALYZE prestamos")
+
+
+# La migración 11 con el SQL que ejecutó al publicarse: los módulos siguen
+# cambiando y una base nueva debe pasar por lo mismo que producción
+_011_TABLA_CLIENTES = """
+    CREATE TABLE IF NOT EXISTS clientes (
+        id SERIAL PRIMARY KEY,
+        cedula TEXT UNIQUE,
+        nombre TEXT,
+        celular TEXT,
+        nombre_norm TEXT,
+        prestamos INTEGER NOT NULL DEFAULT 0,
+        prestamos_activos INTEGER NOT NULL DEFAULT 0,
+        capital_total NUMERIC NOT NULL DEFAULT 0,
+        capital_en_calle NUMERIC NOT NULL DEFAULT 0,
+        deuda NUMERIC NOT NULL DEFAULT 0,
+        prestamos_vencidos INTEGER NOT NULL DEFAULT 0
+    )
+"""
+
+_011_CLIENTES_CON_CEDULA = """
+    INSERT INTO clientes (cedula, nombre, celular, nombre_norm)
+    SELECT DISTINCT ON (TRIM(cedula)) TRIM(cedula), nombre, celular, nombre_norm
+    FROM prestamos
+    WHERE NULLIF(TRIM(cedula), '') IS NOT NULL
+    ORDER BY TRIM(cedula), id DESC
+    ON CONFLICT (cedula) DO NOTHING
+"""
+
+_011_ASIGNAR_POR_CEDULA = """
+    UPDATE prestamos p SET cliente_id = cl.id
+    FROM clientes cl
+    WHERE p.cliente_id IS NULL AND cl.cedula = TRIM(p.cedula)
+"""
+
+_011_CLIENTES_SIN_CEDULA = """
+    WITH nuevos AS MATERIALIZED (
+        SELECT id, nextval('clientes_id_seq') AS cliente_id, nombre, celular, nombre_norm
+        FROM prestamos
+        WHERE cliente_id IS NULL
+    ), creados AS (
+        INSERT INTO clientes (id, nombre, celular, nombre_norm)
+        SELECT cliente_id, nombre, celular, nombre_norm FROM nuevos
+    )
+    UPDATE prestamos p SET cliente_id = n.cliente_id
+    FROM nuevos n
+    WHERE p.id = n.id
+"""
+
+_011_CALCULO = """
+    UPDATE prestamos p
+    SET dias_vencidos = v.dias_vencidos,
+        interes_total = v.interes_total,
+        mora = ROUND((v.monto + v.interes_total) * (%(mora)s::numeric / 100) * v.dias_vencidos, 2),
+        proxima_fecha_pago = v.proxima_fecha_pago,
+        calculado_al = %(fecha)s
+    FROM (
+        SELECT id, monto,
+               monto * (interes / 100) * CASE
+                   WHEN tipo_prestamo = 'fijo' THEN 1
+                   ELSE FLOOR((%(fecha)s - fecha_prestamo) / 30.0) + 1
+               END AS interes_total,
+               CASE
+                   WHEN tipo_prestamo = 'fijo' AND pagado = FALSE
+                   THEN GREATEST(%(fecha)s - (fecha_prestamo + COALESCE(plazo_dias, 30)), 0)
+                   ELSE 0
+               END AS dias_vencidos,
+               CASE
+                   WHEN pagado THEN NULL
+                   WHEN tipo_prestamo = 'fijo' THEN fecha_prestamo + COALESCE(plazo_dias, 30)
+                   ELSE fecha_prestamo + 30 * GREATEST(
+                       FLOOR((%(fecha)s - fecha_prestamo) / 30.0)::int + 1, 0
+                   )
+               END AS proxima_fecha_pago
+        FROM prestamos
+    ) v
+    WHERE p.id = v.id
+"""
+
+_011_EXPOSICION = """
+    UPDATE clientes cl
+    SET prestamos = a.prestamos,
+        prestamos_activos = a.prestamos_activos,
+        capital_total = a.capital_total,
+        capital_en_calle = a.capital_en_calle,
+        deuda = a.deuda,
+        prestamos_vencidos = a.prestamos_vencidos
+    FROM (
+        SELECT p.cliente_id,
+               COUNT(*) AS prestamos,
+               COUNT(*) FILTER (WHERE p.pagado = FALSE) AS prestamos_activos,
+               COALESCE(SUM(p.monto), 0) AS capital_total,
+               COALESCE(SUM(p.monto) FILTER (WHERE p.pagado = FALSE), 0) AS capital_en_calle,
+               COALESCE(SUM(GREATEST(
+                   p.monto + p.interes_total + p.mora - COALESCE(r.total_abonos, 0), 0
+               )) FILTER (WHERE p.pagado = FALSE), 0) AS deuda,
+               COUNT(*) FILTER (WHERE p.pagado = FALSE AND p.dias_vencidos > 0) AS prestamos_vencidos
+        FROM prestamos p
+        LEFT JOIN resumen_prestamos r ON r.prestamo_id = p.id
+        WHERE p.cliente_id IS NOT NULL
+        GROUP BY p.cliente_id
+    ) a
+    WHERE cl.id = a.cliente_id
+"""
+
+_011_INDICES = [
+    "CREATE INDEX IF NOT EXISTS idx_prestamos_cliente ON prestamos (cliente_id)",
+    "CREATE INDEX IF NOT EXISTS idx_clientes_deuda ON clientes (deuda, id)",
+    "CREATE INDEX IF NOT EXISTS idx_clientes_capital_en_calle ON clientes (capital_en_calle, id)",
+    "CREATE INDEX IF NOT EXISTS idx_clientes_prestamos_vencidos ON clientes (prestamos_vencidos, id)",
+    "CREATE INDEX IF NOT EXISTS idx_clientes_prestamos_activos ON clientes (prestamos_activos, id)",
+]
+
+
+def _mora_diaria(c):
+    c.execute("SELECT mora_diaria FROM configuracion ORDER BY id LIMIT 1")
+    return c.fetchone()[0]
+
+
+def _011_clientes(c):
+    c.execute(_011_TABLA_CLIENTES)
+    c.execute("""
+        ALTER TABLE prestamos
+        ADD COLUMN IF NOT EXISTS cliente_id INTEGER REFERENCES clientes (id),
+        ADD COLUMN IF NOT EXISTS interes_total NUMERIC NOT NULL DEFAULT 0
+    """)
+    # Un cliente por cédula; sin cédula, uno por préstamo
+    c.execute(_011_CLIENTES_CON_CEDULA)
+    # Recién llena, sin estadísticas el cruce por cédula recorre la tabla
+    # completa por cada préstamo
+    c.execute("ANALYZE clientes")
+    c.execute(_011_ASIGNAR_POR_CEDULA)
+    c.execute(_011_CLIENTES_SIN_CEDULA)
+    c.execute("ANALYZE clientes")
+
+    # La deuda del cliente necesita interes_total y mora en cada préstamo
+    c.execute(_011_CALCULO, {"fecha": date.today(), "mora": _mora_diaria(c)})
+    c.execute(_011_EXPOSICION)
+    for sql in _011_INDICES:
+        c.execute(sql)
+    c.execute("ANALYZE prestamos")
+    c.execute("ANALYZE clientes")
+
+
+def _012_version_de_datos(c):
+    c.execute(resumen.TABLA_VERSION)
+    c.execute("INSERT INTO version_datos (id) VALUES (1) ON CONFLICT (id) DO NOTHING")
+
+
+def _013_version_de_prestamos(c):
+    # Sube en cada escritura del préstamo; ver "CONCURRENCIA" en app.py
+    c.execute("ALTER TABLE prestamos ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1")
+
+
+
+def _014_prestamos_cambiados(c):
+    c.execute("ALTER TABLE version_datos ADD COLUMN IF NOT EXISTS recarga BIGINT NOT NULL DEFAULT 0")
+    for sentencia in resumen.TABLA_CAMBIOS:
+        c.execute(sentencia)
+
+
+# La migración 15 con el SQL que ejecutó al publicarse (ver la 11)
+_015_REDONDEAR = """
+    CREATE OR REPLACE FUNCTION redondear(x DOUBLE PRECISION) RETURNS DOUBLE PRECISION
+    LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE AS $$
+    DECLARE
+        centavos DOUBLE PRECISION := x * 100;
+        alto DOUBLE PRECISION;
+        error DOUBLE PRECISION;
+    BEGIN
+        IF centavos - floor(centavos) = 0.5 THEN
+            alto := 134217729 * x - (134217729 * x - x);
+            error := (alto * 100 - centavos) + (x - alto) * 100;
+            IF error > 0 THEN
+                centavos := ceil(centavos);
+            ELSIF error < 0 THEN
+                centavos := floor(centavos);
+            END IF;
+        END IF;
+        RETURN round(centavos) / 100;
+    END
+    $$
+"""
+
+_015_CALCULO = """
+    UPDATE prestamos p
+    SET dias_vencidos = v.dias_vencidos,
+        interes_total = v.interes_total::text::numeric,
+        mora = v.mora::numeric,
+        proxima_fecha_pago = v.proxima_fecha_pago,
+        calculado_al = %(hoy)s
+    FROM (
+        SELECT p.id, d.dias_vencidos, i.interes_total,
+               CASE
+                   WHEN d.dias_vencidos = 0 THEN 0
+                   ELSE redondear(
+                       (p.monto::float8 + i.interes_total) * (%(mora)s::float8 / 100) * d.dias_vencidos
+                   )
+               END AS mora,
+               CASE
+                   WHEN p.pagado THEN NULL
+                   WHEN p.tipo_prestamo = 'fijo' THEN p.fecha_prestamo + COALESCE(p.plazo_dias, 30)
+                   ELSE p.fecha_prestamo + 30 * GREATEST(d.ciclos + 1, 0)
+               END AS proxima_fecha_pago
+        FROM prestamos p
+        CROSS JOIN LATERAL (
+            SELECT CASE
+                       WHEN p.tipo_prestamo = 'fijo' THEN 0
+                       ELSE FLOOR((%(hoy)s - p.fecha_prestamo) / 30.0)::int
+                   END AS ciclos,
+                   CASE
+                       WHEN p.tipo_prestamo = 'fijo' AND p.pagado = FALSE
+                       THEN GREATEST(%(hoy)s - (p.fecha_prestamo + COALESCE(p.plazo_dias, 30)), 0)
+                       ELSE 0
+                   END AS dias_vencidos
+        ) d
+        CROSS JOIN LATERAL (
+            SELECT p.monto::float8 * (p.interes::float8 / 100) * (d.ciclos + 1) AS interes_total
+        ) i
+        WHERE p.pagado = FALSE
+    ) v
+    WHERE p.id = v.id
+"""
+
+_015_EXPOSICION = """
+    UPDATE clientes cl
+    SET prestamos = COALESCE(a.prestamos, 0),
+        prestamos_activos = COALESCE(a.prestamos_activos, 0),
+        capital_total = COALESCE(a.capital_total, 0),
+        capital_en_calle = COALESCE(a.capital_en_calle, 0),
+        deuda = COALESCE(a.deuda, 0),
+        prestamos_vencidos = COALESCE(a.prestamos_vencidos, 0)
+    FROM clientes c2
+    LEFT JOIN (
+        SELECT p.cliente_id,
+               COUNT(*) AS prestamos,
+               COUNT(*) FILTER (WHERE p.pagado = FALSE) AS prestamos_activos,
+               COALESCE(SUM(p.monto), 0) AS capital_total,
+               COALESCE(SUM(p.monto) FILTER (WHERE p.pagado = FALSE), 0) AS capital_en_calle,
+               COALESCE(SUM(redondear(GREATEST(
+                   p.monto::float8 + p.interes_total::float8 + p.mora::float8
+                   - COALESCE(r.total_abonos, 0)::float8,
+                   0
+               ))::numeric) FILTER (WHERE p.pagado = FALSE), 0) AS deuda,
+               COUNT(*) FILTER (WHERE p.pagado = FALSE AND p.dias_vencidos > 0) AS prestamos_vencidos
+        FROM prestamos p
+        LEFT JOIN resumen_prestamos r ON r.prestamo_id = p.id
+        WHERE p.cliente_id IS NOT NULL
+        GROUP BY p.cliente_id
+    ) a ON a.cliente_id = c2.id
+    WHERE cl.id = c2.id
+"""
+
+
+def _015_redondeo_al_par(c):
+    # Los valores guardados y la deuda de los clientes se redondeaban con
+    # ROUND de numeric; se recalculan con redondear() (ver calculos.py)
+    c.execute(_015_REDONDEAR)
+    c.execute(_015_CALCULO, {"hoy": date.today(), "mora": _mora_diaria(c)})
+    c.execute(_015_EXPOSICION)
+
+
+MIGRACIONES = [
+    (1, "esquema base", _001_esquema_base),
+    (2, "índices del listado", _002_indices_listado),
+    (3, "resumen de cartera", _003_resumen_cartera),
+    (4, "índice del reporte por fecha", _004_indice_reporte_corte),
+    (5, "versión de la configuración", _005_version_configuracion),
+    (6, "lotes de abonos idempotentes", _006_lotes_abonos),
+    (7, "libro de movimientos por préstamo", _007_libro_de_prestamos),
+    (8, "abonos particionados por mes", _008_particionar_abonos),
+    (9, "cierre diario de mora y vencimientos", _009_cierre_diario),
+    (10, "búsqueda de clientes", _010_busqueda_de_clientes),
+    (11, "clientes y exposición", _011_clientes),
+    (12, "versión de los datos", _012_version_de_datos),
+    (13, "versión de cada préstamo", _013_version_de_prestamos),
+    (14, "préstamos cambiados por versión", _014_prestamos_cambiados),
+    (15, "redondeo al par en SQL", _015_redondeo_al_par),
+]
+
+
+def migrar(salida=print):
+    with conexion() as conn:
+        c = conn.cursor()
+        c.execute("SELECT pg_advisory_lock(%s)", (CANDADO,))
+
+        try:
+            c.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    descripcion TEXT,
+                    aplicada TIMESTAMP DEFAULT NOW()
+                )
+            """)
+            conn.commit()
+
+            c.execute("SELECT version FROM schema_version")
+            aplicadas = {fila[0] for fila in c.fetchall()}
+
+            # Cada paso en su propia transacción
+            for version, descripcion, paso in MIGRACIONES:
+                if version in aplicadas:
+                    continue
+                paso(c)
+                c.execute(
+                    "INSERT INTO schema_version (version, descripcion) VALUES (%s, %s)",
+                    (version, descripcion)
+                )
+                conn.commit()
+                salida(f"Migración {version}: {descripcion}")
+
+            _mantener_particiones(c, salida)
+            conn.commit()
+        finally:
+            conn.rollback()
+            c.execute("SELECT pg_advisory_unlock(%s)", (CANDADO,))
+
+
+# =========================
+# PARTICIONES
+# =========================
+def _mantener_particiones(c, salida):
+    for mes in particiones.asegurar(c):
+        salida(f"Partición creada: abonos {mes:%Y-%m}")
+
+
+def mantener_particiones(salida=print):
+    with conexion() as conn:
+        c = conn.cursor()
+        c.execute("SELECT pg_advisory_lock(%s)", (CANDADO,))
+        try:
+            _mantener_particiones(c, salida)
+            conn.commit()
+        finally:
+            conn.rollback()
+            c.execute("SELECT pg_advisory_unlock(%s)", (CANDADO,))
+
+
+# =========================
+# VERIFICAR ÍNDICES
+# =========================
+def consultas_calientes():
+    """
+    (nombre, sql, params, índice, uso) de las consultas del camino
+    caliente, armadas con el mismo código que las ejecuta. uso es "orden"
+    si el índice da el orden de la página o "filtro" si selecciona las
+    filas.
+    """
+    # app importa este módulo; se importa aquí para no crear un ciclo
+    import app
+
+    hoy = date.today()
+
+    def pagina(cursor=None, guardados=False, **filtros):
+        filtros = dict({"estado": "", "tipo": "", "vencidos": "", "q": "", "orden": "id"}, **filtros)
+        # La tasa de mora no cambia el plan
+        return app.sql_pagina(filtros, cursor, 1, hoy, guardados)
+
+    consultas = [
+        ("listado", pagina(), "prestamos_pkey", "orden"),
+        ("listado, página siguiente", pagina(cursor=(None, 100)), "prestamos_pkey", "orden"),
+        ("listado sin pagar", pagina(estado="pendientes"), "idx_prestamos_pagado", "filtro"),
+        ("listado por tipo", pagina(tipo="fijo"), "idx_prestamos_tipo", "filtro"),
+        ("vencidos sin cierre del día", pagina(vencidos="1"), "idx_prestamos_vencimiento", "filtro"),
+        ("vencidos según el cierre diario", pagina(vencidos="1", guardados=True),
+         "idx_prestamos_dias_vencidos", "filtro"),
+        ("búsqueda por nombre", pagina(q="jose nu"), "idx_prestamos_nombre_busqueda", "filtro"),
+        ("búsqueda por cédula", pagina(q="1234"), "idx_prestamos_cedula", "filtro"),
+        ("búsqueda por celular", pagina(q="1234"), "idx_prestamos_celular", "filtro"),
+    ]
+    consultas = [(nombre, sql, params, indice, uso) for nombre, (sql, params), indice, uso in consultas]
+    consultas += [
+        ("reporte de corte", app.SQL_CORTE, (date(2024, 1, 1), date(2024, 1, 31)),
+         "idx_abonos_fecha", "filtro"),
+        ("abonos de un préstamo", resumen.SQL_ABONADO, (1,), "idx_abonos_prestamo", "filtro"),
+    ]
+    return consultas
+
+
+def _indices_del_plan(nodo):
+    if "Index Name" in nodo:
+        yield nodo["Index Name"]
+    for hijo in nodo.get("Plans", []):
+        yield from _indices_del_plan(hijo)
+
+
+def _indice_raiz(c, nombre):
+    # En tablas particionadas el plan nombra el índice de cada partición
+    c.execute("SELECT COALESCE(pg_partition_root(%s::regclass)::text, %s)", (nombre, nombre))
+    return c.fetchone()[0]
+
+
+def verificar_indices(salida=print):
+    """Comprueba con EXPLAIN que cada consulta caliente usa su índice."""
+    fallas = 0
+
+    with conexion() as conn:
+        c = conn.cursor()
+        # Con tablas pequeñas el planificador prefiere leer todo; se
+        # desactiva para comprobar que el índice es utilizable
+        c.execute("SET LOCAL enable_seqscan = off")
+
+        for nombre, sql, params, indice, uso in consultas_calientes():
+            # Un filtro se comprueba solo con bitmap scans: si no, según
+            # las estadísticas la página puede recorrer la llave en orden
+            # de id y filtrar, y no se sabría si el índice sirve
+            c.execute(f"SET LOCAL enable_indexscan = {'off' if uso == 'filtro' else 'on'}")
+            c.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            plan = c.fetchone()[0][0]["Plan"]
+            usados = {_indice_raiz(c, i) for i in _indices_del_plan(plan)}
+
+            if indice in usados:
+                salida(f"OK    {nombre}: {indice}")
+            else:
+                fallas += 1
+                salida(f"FALLA {nombre}: esperaba {indice}, usa {sorted(usados) or 'Seq Scan'}")
+
+        conn.rollback()
+
+    return fallas == 0
+
+
+if __name__ == "__main__":
+    if "--verificar-indices" in sys.argv:
+        sys.exit(0 if verificar_indices() else 1)
+    if "--particiones" in sys.argv:
+        mantener_particiones()
+    else:
+        migrar()
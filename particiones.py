@@ -0,0 +1,167 @@
+import os
+from datetime import date
+
+# =========================
+# PARTICIONES DE ABONOS
+# =========================
+# abonos está particionada por mes (abonos_AAAA_MM) para que un reporte por
+# rango solo lea los meses que pide, sin importar cuánta historia haya.
+#
+#   abonos_default  recibe lo que no cae en un mes creado (fechas muy
+#                   antiguas o futuras); el mantenimiento lo reparte
+#
+# El mantenimiento corre en cada migración y con:
+#
+#   flask --app app particiones   (equivale a: python migraciones.py --particiones)
+
+# Meses futuros que se dejan creados por adelantado
+MESES_ADELANTE = int(os.environ.get("ABONOS_MESES_ADELANTE", 12))
+
+PADRE = '''
+    CREATE TABLE abonos (
+        id INTEGER NOT NULL DEFAULT nextval('abonos_id_seq'),
+        prestamo_id INTEGER REFERENCES prestamos(id) ON DELETE CASCADE,
+        fecha DATE NOT NULL,
+        monto NUMERIC,
+        PRIMARY KEY (id, fecha)
+    ) PARTITION BY RANGE (fecha)
+'''
+
+DEFECTO = "CREATE TABLE IF NOT EXISTS abonos_default PARTITION OF abonos DEFAULT"
+
+INDICES = [
+    "CREATE INDEX IF NOT EXISTS idx_abonos_prestamo ON abonos (prestamo_id)",
+    "CREATE INDEX IF NOT EXISTS idx_abonos_fecha ON abonos (fecha) INCLUDE (prestamo_id, monto)",
+]
+
+
+def inicio_de_mes(fecha):
+    return fecha.replace(day=1)
+
+
+def mes_siguiente(mes):
+    if mes.month == 12:
+        return date(mes.year + 1, 1, 1)
+    return date(mes.year, mes.month + 1, 1)
+
+
+def _nombre(mes):
+    return f"abonos_{mes:%Y_%m}"
+
+
+def _existentes(c):
+    c.execute("""
+        SELECT hijo.relname
+        FROM pg_inherits i
+        JOIN pg_class hijo ON hijo.oid = i.inhrelid
+        WHERE i.inhparent = 'abonos'::regclass
+    """)
+    return {fila[0] for fila in c.fetchall()}
+
+
+def _crear_mes(c, mes):
+    """
+    Crea la partición del mes pasando a ella las filas que ya estén en
+    abonos_default (no se puede adjuntar un rango que el default contiene).
+    """
+    nombre = _nombre(mes)
+    hasta = mes_siguiente(mes)
+
+    c.execute(f"CREATE TABLE {nombre} (LIKE abonos INCLUDING DEFAULTS)")
+    # Con el CHECK, ATTACH no necesita revisar las filas de la partición
+    c.execute(
+        f"ALTER TABLE {nombre} ADD CONSTRAINT {nombre}_rango "
+        f"CHECK (fecha >= %s AND fecha < %s)",
+        (mes, hasta)
+    )
+    c.execute(f"""
+        WITH movidos AS (
+            DELETE FROM abonos_default
+            WHERE fecha >= %s AND fecha < %s
+            RETURNING id, prestamo_id, fecha, monto
+        )
+        INSERT INTO {nombre} (id, prestamo_id, fecha, monto)
+        SELECT id, prestamo_id, fecha, monto FROM movidos
+    """, (mes, hasta))
+    c.execute(
+        f"ALTER TABLE abonos ATTACH PARTITION {nombre} FOR VALUES FROM (%s) TO (%s)",
+        (mes, hasta)
+    )
+    c.execute(f"ALTER TABLE {nombre} DROP CONSTRAINT {nombre}_rango")
+
+
+def asegurar(c, hoy=None, meses_adelante=MESES_ADELANTE):
+    """
+    Deja creadas las particiones desde el mes actual hasta meses_adelante y
+    reparte lo que haya caído en abonos_default. Devuelve los meses creados.
+    """
+    hoy = hoy or date.today()
+    existentes = _existentes(c)
+
+    c.execute("SELECT DISTINCT date_trunc('month', fecha)::date FROM abonos_default")
+    meses = {fila[0] for fila in c.fetchall()}
+
+    mes = inicio_de_mes(hoy)
+    for _ in range(meses_adelante + 1):
+        meses.add(mes)
+        mes = mes_siguiente(mes)
+
+    creados = []
+    for mes in sorted(meses):
+        if _nombre(mes) not in existentes:
+            _crear_mes(c, mes)
+            creados.append(mes)
+    return creados
+
+
+def convertir(c):
+    """Pasa la tabla abonos sin particionar a la tabla particionada."""
+    c.execute("LOCK TABLE abonos IN ACCESS EXCLUSIVE MODE")
+
+    c.execute("SELECT COUNT(*) FROM abonos WHERE fecha IS NULL")
+    sin_fecha = c.fetchone()[0]
+    if sin_fecha:
+        raise RuntimeError(
+            f"Hay {sin_fecha} abonos sin fecha; asigne una fecha antes de particionar"
+        )
+
+    # Liberar los nombres para la tabla nueva
+    c.execute("ALTER TABLE abonos RENAME TO abonos_anterior")
+    c.execute("ALTER TABLE abonos_anterior RENAME CONSTRAINT abonos_pkey TO abonos_anterior_pkey")
+    c.execute("""
+        ALTER TABLE abonos_anterior
+        RENAME CONSTRAINT abonos_prestamo_id_fkey TO abonos_anterior_prestamo_id_fkey
+    """)
+    c.execute("DROP INDEX IF EXISTS idx_abonos_prestamo")
+    c.execute("DROP INDEX IF EXISTS idx_abonos_fecha")
+    # La secuencia de ids pasa a la tabla nueva
+    c.execute("ALTER SEQUENCE abonos_id_seq OWNED BY NONE")
+
+    c.execute(PADRE)
+    c.execute(DEFECTO)
+    c.execute("ALTER SEQUENCE abonos_id_seq OWNED BY abonos.id")
+
+    c.execute("""
+        SELECT DISTINCT date_trunc('month', fecha)::date
+        FROM abonos_anterior
+        ORDER BY 1
+    """)
+    for (mes,) in c.fetchall():
+        c.execute(
+            f"CREATE TABLE {_nombre(mes)} PARTITION OF abonos "
+            f"FOR VALUES FROM (%s) TO (%s)",
+            (mes, mes_siguiente(mes))
+        )
+
+    c.execute("""
+        INSERT INTO abonos (id, prestamo_id, fecha, monto)
+        SELECT id, prestamo_id, fecha, monto FROM abonos_anterior
+    """)
+    c.execute("DROP TABLE abonos_anterior")
+
+    # Índices después de copiar; las particiones nuevas los heredan
+    for sql in INDICES:
+        c.execute(sql)
+
+    asegurar(c)
+    c.execute("ANALYZE abonos")
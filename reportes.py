@@ -0,0 +1,305 @@
+import csv
+import io
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import calculos
+import configuracion
+import particiones
+import resumen
+
+# =========================
+# REPORTES DE CARTERA
+# =========================
+# Agregados para el cierre de mes, calculados en SQL con GROUP BY y
+# funciones de ventana:
+#
+#   antiguedad           deuda sin pagar por días vencidos
+#                        (al día, 1-30, 31-60, 61-90, 90+)
+#   recaudo_por_medio    abonos por mes y medio del préstamo entre desde y
+#                        hasta
+#   interes_proyectado   interés que causarán los préstamos sin pagar en
+#                        los próximos `meses` meses
+#
+# Cada resultado queda en el worker con la versión de los datos
+# (resumen.py), la tasa de mora y el día: mientras no cambien, el
+# mismo reporte con los mismos parámetros no vuelve a consultar la cartera.
+# Las salidas son JSON, CSV y XLSX.
+
+MAX_RESULTADOS = int(os.environ.get("CACHE_REPORTES", 64))
+MAX_MESES = 24
+
+# mora y deuda ya vienen en centavos exactos; ROUND solo les da escala 2
+SQL_DEUDA = calculos.SQL_CARTERA.format(
+    columnas="""p.monto, ROUND(m.mora::numeric, 2) AS mora, d.dias_vencidos,
+               ROUND(s.deuda_restante::numeric, 2) AS deuda""",
+    filtro="p.pagado = FALSE",
+)
+
+SQL_ANTIGUEDAD = """
+    WITH deuda AS (""" + SQL_DEUDA + """),
+    tramos (orden, tramo) AS (
+        VALUES (0, 'al día'), (1, '1-30'), (2, '31-60'), (3, '61-90'), (4, '90+')
+    ),
+    por_tramo AS (
+        SELECT CASE
+                   WHEN dias_vencidos = 0 THEN 0
+                   WHEN dias_vencidos <= 30 THEN 1
+                   WHEN dias_vencidos <= 60 THEN 2
+                   WHEN dias_vencidos <= 90 THEN 3
+                   ELSE 4
+               END AS orden,
+               COUNT(*) AS prestamos,
+               SUM(monto) AS capital,
+               SUM(mora) AS mora,
+               SUM(deuda) AS deuda
+        FROM deuda
+        GROUP BY 1
+    )
+    SELECT t.tramo,
+           COALESCE(d.prestamos, 0),
+           COALESCE(d.capital, 0),
+           COALESCE(d.mora, 0),
+           COALESCE(d.deuda, 0),
+           COALESCE(ROUND(100 * d.deuda / NULLIF(SUM(d.deuda) OVER (), 0), 2), 0)
+    FROM tramos t
+    LEFT JOIN por_tramo d ON d.orden = t.orden
+    ORDER BY t.orden
+"""
+
+# Los abonos no guardan con qué se pagaron: el medio es el del préstamo
+# (prestamos.medio, por donde llegó el cliente), no el del abono
+SQL_RECAUDO_POR_MEDIO = """
+    SELECT date_trunc('month', a.fecha)::date AS mes,
+           COALESCE(NULLIF(TRIM(p.medio), ''), 'sin medio') AS medio_prestamo,
+           COUNT(*) AS abonos,
+           SUM(a.monto) AS total,
+           ROUND(100 * SUM(a.monto) / NULLIF(SUM(SUM(a.monto)) OVER (
+               PARTITION BY date_trunc('month', a.fecha)::date
+           ), 0), 2) AS porcentaje_del_mes
+    FROM abonos a
+    JOIN prestamos p ON p.id = a.prestamo_id
+    WHERE a.fecha BETWEEN %(desde)s AND %(hasta)s
+    GROUP BY 1, 2
+    ORDER BY 1, 4 DESC, 2
+"""
+
+# Los indefinidos causan un mes de interés al empezar cada ciclo de 30 días
+# (fecha_prestamo + 30k); los fijos se cobran con el capital al vencer, así
+# que su interés cae en el mes del vencimiento (los ya vencidos están en
+# antiguedad).
+SQL_INTERES_PROYECTADO = """
+    WITH meses AS (
+        SELECT generate_series(%(primer_mes)s::date, %(ultimo_mes)s::date, '1 month')::date AS mes
+    ),
+    causaciones AS (
+        SELECT p.fecha_prestamo + 30 * k AS fecha,
+               p.monto * (p.interes / 100) AS interes
+        FROM prestamos p,
+             generate_series(
+                 FLOOR((%(hoy)s - p.fecha_prestamo) / 30.0)::int + 1,
+                 FLOOR((%(fin)s - p.fecha_prestamo) / 30.0)::int
+             ) AS k
+        WHERE p.pagado = FALSE
+          AND p.tipo_prestamo = 'indefinido'
+          AND p.fecha_prestamo <= %(hoy)s
+
+        UNION ALL
+
+        SELECT p.fecha_prestamo + COALESCE(p.plazo_dias, 30),
+               p.monto * (p.interes / 100)
+        FROM prestamos p
+        WHERE p.pagado = FALSE
+          AND p.tipo_prestamo = 'fijo'
+          AND p.fecha_prestamo + COALESCE(p.plazo_dias, 30) BETWEEN %(hoy)s AND %(fin)s
+    )
+    SELECT m.mes,
+           COUNT(c.fecha) AS causaciones,
+           ROUND(COALESCE(SUM(c.interes), 0), 2) AS interes,
+           ROUND(SUM(COALESCE(SUM(c.interes), 0)) OVER (ORDER BY m.mes), 2) AS acumulado
+    FROM meses m
+    LEFT JOIN causaciones c ON date_trunc('month', c.fecha)::date = m.mes
+    GROUP BY m.mes
+    ORDER BY m.mes
+"""
+
+
+class ReporteInvalido(Exception):
+    pass
+
+
+def _fecha(args, nombre, por_defecto):
+    valor = args.get(nombre) or None
+    if valor is None:
+        return por_defecto
+    try:
+        return datetime.strptime(valor, "%Y-%m-%d").date()
+    except ValueError:
+        raise ReporteInvalido(f"{nombre} debe tener el formato AAAA-MM-DD")
+
+
+# =========================
+# PARÁMETROS
+# =========================
+def _parametros_antiguedad(args, hoy):
+    return {}
+
+
+def _parametros_recaudo(args, hoy):
+    desde = _fecha(args, "desde", particiones.inicio_de_mes(hoy))
+    hasta = _fecha(args, "hasta", hoy)
+    if desde > hasta:
+        raise ReporteInvalido("La fecha desde no puede ser mayor que la fecha hasta")
+    return {"desde": desde, "hasta": hasta}
+
+
+def _parametros_proyeccion(args, hoy):
+    try:
+        meses = int(args.get("meses") or 6)
+    except ValueError:
+        raise ReporteInvalido("meses debe ser un número")
+    if not 1 <= meses <= MAX_MESES:
+        raise ReporteInvalido(f"meses debe estar entre 1 y {MAX_MESES}")
+    return {"meses": meses}
+
+
+def _consulta_proyeccion(params, hoy):
+    primer_mes = particiones.inicio_de_mes(hoy)
+    ultimo_mes = primer_mes
+    for _ in range(params["meses"] - 1):
+        ultimo_mes = particiones.mes_siguiente(ultimo_mes)
+    return {
+        "primer_mes": primer_mes,
+        "ultimo_mes": ultimo_mes,
+        "fin": particiones.mes_siguiente(ultimo_mes) - timedelta(days=1),
+    }
+
+
+# nombre: (título, columnas, consulta, lectura de parámetros, parámetros
+# adicionales de la consulta)
+REPORTES = {
+    "antiguedad": (
+        "Antigüedad de la cartera",
+        ["Tramo", "Préstamos", "Capital", "Mora", "Deuda", "% de la deuda"],
+        SQL_ANTIGUEDAD, _parametros_antiguedad, None,
+    ),
+    "recaudo_por_medio": (
+        "Recaudo por medio del préstamo",
+        ["Mes", "Medio del préstamo", "Abonos", "Total", "% del mes"],
+        SQL_RECAUDO_POR_MEDIO, _parametros_recaudo, None,
+    ),
+    "interes_proyectado": (
+        "Interés proyectado por mes",
+        ["Mes", "Causaciones", "Interés", "Acumulado"],
+        SQL_INTERES_PROYECTADO, _parametros_proyeccion, _consulta_proyeccion,
+    ),
+}
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+# =========================
+# GENERAR
+# =========================
+def generar(c, nombre, args, hoy):
+    """
+    Resultado del reporte con los parámetros de `args` (request.args):
+    {"reporte", "titulo", "parametros", "columnas", "filas"}. Lanza
+    ReporteInvalido si el reporte o los parámetros no sirven.
+    """
+    if nombre not in REPORTES:
+        raise ReporteInvalido(f"Reporte desconocido: {nombre}")
+    titulo, nombres_columnas, sql, leer_parametros, consulta = REPORTES[nombre]
+    params = leer_parametros(args, hoy)
+
+    # La tasa va en la llave leída de la base: con la de la caché del
+    # worker se guardaría un reporte con la tasa vieja bajo la versión nueva
+    mora = configuracion.mora_vigente(c)
+    clave = (nombre, tuple(sorted(params.items())), hoy, resumen.leer_version(c), mora)
+    with _lock:
+        resultado = _cache.get(clave)
+        if resultado is not None:
+            _cache.move_to_end(clave)
+            return resultado
+
+    valores = dict(params, hoy=hoy, mora=mora)
+    if consulta:
+        valores.update(consulta(params, hoy))
+    c.execute(sql, valores)
+
+    resultado = {
+        "reporte": nombre,
+        "titulo": titulo,
+        "parametros": dict(params, fecha=hoy),
+        "columnas": nombres_columnas,
+        "filas": c.fetchall(),
+    }
+    with _lock:
+        _cache[clave] = resultado
+        while len(_cache) > MAX_RESULTADOS:
+            _cache.popitem(last=False)
+    return resultado
+
+
+# =========================
+# SALIDAS
+# =========================
+def _json(valor):
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, date):
+        return valor.isoformat()
+    return valor
+
+
+def a_json(resultado):
+    return {
+        "reporte": resultado["reporte"],
+        "titulo": resultado["titulo"],
+        "parametros": {k: _json(v) for k, v in resultado["parametros"].items()},
+        "columnas": resultado["columnas"],
+        "filas": [[_json(valor) for valor in fila] for fila in resultado["filas"]],
+    }
+
+
+def a_csv(resultado):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(resultado["columnas"])
+    writer.writerows(resultado["filas"])
+    return buffer.getvalue()
+
+
+def a_xlsx(resultado):
+    # Solo los reportes lo usan; no se carga al arrancar cada worker
+    import xlsxwriter
+
+    salida = tempfile.TemporaryFile()
+    hoja_calculo = xlsxwriter.Workbook(salida)
+    hoja = hoja_calculo.add_worksheet(resultado["titulo"][:31])
+    formato_fecha = hoja_calculo.add_format({"num_format": "yyyy-mm-dd"})
+    formato_titulo = hoja_calculo.add_format({"bold": True})
+
+    hoja.write_string(0, 0, resultado["titulo"], formato_titulo)
+    hoja.write_string(1, 0, ", ".join(
+        f"{k}: {_json(v)}" for k, v in resultado["parametros"].items()
+    ))
+    hoja.write_row(3, 0, resultado["columnas"], formato_titulo)
+
+    for fila, valores in enumerate(resultado["filas"], start=4):
+        for columna, valor in enumerate(valores):
+            if isinstance(valor, date):
+                hoja.write_datetime(fila, columna, valor, formato_fecha)
+            elif isinstance(valor, (int, float, Decimal)):
+                hoja.write_number(fila, columna, float(valor))
+            else:
+                hoja.write_string(fila, columna, str(valor))
+
+    hoja_calculo.close()
+    salida.seek(0)
+    return salida
@@ -0,0 +1,478 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from psycopg2.extras import execute_values
+
+import clientes
+import libro
+import particiones
+
+# =========================
+# RESUMEN DE CARTERA
+# =========================
+# Totales que /estadisticas y el listado necesitan, mantenidos en la misma
+# transacción que cada escritura para no recalcularlos sobre toda la
+# historia en cada visita.
+#
+#   resumen_cartera      una sola fila con los totales de la cartera
+#   resumen_prestamos    total abonado por préstamo
+#   resumen_indefinidos  interés por ciclo de los indefinidos, agrupado por
+#                        fecha_prestamo (los ciclos dependen de la fecha)
+#   resumen_diario       total abonado por día
+#   resumen_mensual      total abonado por mes (primer día del mes)
+#   clientes             exposición por cliente (ver clientes.py)
+#   version_datos        contador que sube con cada escritura; las vistas
+#                        cacheadas lo usan como ETag (ver vistas.py)
+#   prestamos_cambiados  versión de la última escritura de cada préstamo,
+#                        para que instantanea.py lea solo lo que cambió
+#
+# Los cambios a un préstamo se aplican quitando su aporte antes de
+# modificarlo y sumándolo de nuevo después.
+#
+# Toda escritura toma los bloqueos en este orden, para que dos escrituras a
+# la vez se esperen en vez de bloquearse mutuamente:
+#
+#   1. las filas de prestamos que escribe, en orden de id
+#   2. la fila de resumen_cartera (bloquear_cartera si va a tocar clientes
+#      antes de sumar o quitar un préstamo)
+#   3. las filas de clientes
+#   4. la fila de version_datos (nueva_version, siempre al final)
+
+TABLAS = [
+    '''
+        CREATE TABLE IF NOT EXISTS resumen_cartera (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total_prestado NUMERIC NOT NULL DEFAULT 0,
+            total_abonos NUMERIC NOT NULL DEFAULT 0,
+            capital_en_calle NUMERIC NOT NULL DEFAULT 0,
+            interes_fijo NUMERIC NOT NULL DEFAULT 0
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS resumen_prestamos (
+            prestamo_id INTEGER PRIMARY KEY REFERENCES prestamos(id) ON DELETE CASCADE,
+            total_abonos NUMERIC NOT NULL DEFAULT 0
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS resumen_indefinidos (
+            fecha_prestamo DATE PRIMARY KEY,
+            base_interes NUMERIC NOT NULL DEFAULT 0
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS resumen_diario (
+            fecha DATE PRIMARY KEY,
+            total NUMERIC NOT NULL DEFAULT 0
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS resumen_mensual (
+            mes DATE PRIMARY KEY,
+            total NUMERIC NOT NULL DEFAULT 0
+        )
+    ''',
+]
+
+TABLA_VERSION = '''
+    CREATE TABLE IF NOT EXISTS version_datos (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version BIGINT NOT NULL DEFAULT 0,
+        recarga BIGINT NOT NULL DEFAULT 0
+    )
+'''
+
+# Sin llave foránea: la fila de un préstamo eliminado avisa que se eliminó
+TABLA_CAMBIOS = [
+    '''
+        CREATE TABLE IF NOT EXISTS prestamos_cambiados (
+            prestamo_id INTEGER PRIMARY KEY,
+            version BIGINT NOT NULL
+        )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_prestamos_cambiados_version ON prestamos_cambiados (version)",
+]
+
+# Consultas que calculan los mismos valores desde las tablas base; se usan
+# para reconstruir y para verificar
+SQL_CARTERA = """
+    SELECT
+        (SELECT COALESCE(SUM(monto), 0) FROM prestamos),
+        (SELECT COALESCE(SUM(monto), 0) FROM abonos),
+        (SELECT COALESCE(SUM(monto), 0) FROM prestamos WHERE pagado = FALSE),
+        (SELECT COALESCE(SUM(monto * interes / 100), 0)
+         FROM prestamos WHERE tipo_prestamo = 'fijo')
+"""
+
+SQL_PRESTAMOS = """
+    SELECT prestamo_id, SUM(monto)
+    FROM abonos
+    WHERE prestamo_id IS NOT NULL
+    GROUP BY prestamo_id
+"""
+
+SQL_INDEFINIDOS = """
+    SELECT fecha_prestamo, SUM(monto * interes / 100)
+    FROM prestamos
+    WHERE tipo_prestamo IS DISTINCT FROM 'fijo'
+    GROUP BY fecha_prestamo
+"""
+
+SQL_DIARIO = """
+    SELECT fecha, SUM(monto) FROM abonos GROUP BY fecha
+"""
+
+SQL_MENSUAL = """
+    SELECT date_trunc('month', fecha)::date, SUM(monto) FROM abonos GROUP BY 1
+"""
+
+
+# =========================
+# PRÉSTAMOS
+# =========================
+def _aplicar_prestamo(c, prestamo_id, signo):
+    c.execute("""
+        UPDATE resumen_cartera r
+        SET total_prestado = r.total_prestado + %(signo)s * p.monto,
+            capital_en_calle = r.capital_en_calle
+                + %(signo)s * CASE WHEN p.pagado = FALSE THEN p.monto ELSE 0 END,
+            interes_fijo = r.interes_fijo
+                + %(signo)s * CASE WHEN p.tipo_prestamo = 'fijo'
+                                   THEN p.monto * p.interes / 100 ELSE 0 END
+        FROM prestamos p
+        WHERE r.id = 1 AND p.id = %(id)s
+    """, {"signo": signo, "id": prestamo_id})
+
+    c.execute("""
+        INSERT INTO resumen_indefinidos (fecha_prestamo, base_interes)
+        SELECT fecha_prestamo, %(signo)s * monto * interes / 100
+        FROM prestamos
+        WHERE id = %(id)s AND tipo_prestamo IS DISTINCT FROM 'fijo'
+        ON CONFLICT (fecha_prestamo) DO UPDATE
+        SET base_interes = resumen_indefinidos.base_interes + EXCLUDED.base_interes
+    """, {"signo": signo, "id": prestamo_id})
+
+
+def bloquear_cartera(c):
+    """Toma la fila de resumen_cartera hasta el commit (paso 2 del orden)."""
+    c.execute("SELECT 1 FROM resumen_cartera WHERE id = 1 FOR NO KEY UPDATE")
+
+
+def sumar_prestamo(c, prestamo_id):
+    """Agrega el aporte del préstamo tal como está ahora en la tabla."""
+    _aplicar_prestamo(c, prestamo_id, 1)
+    clientes.sumar_prestamos(c, [prestamo_id])
+    nueva_version(c, [prestamo_id])
+
+
+def quitar_prestamo(c, prestamo_id):
+    """Retira el aporte del préstamo; llamar antes de modificarlo."""
+    _aplicar_prestamo(c, prestamo_id, -1)
+    clientes.quitar_prestamos(c, [prestamo_id])
+    nueva_version(c, [prestamo_id])
+
+
+# Total abonado a un préstamo (por idx_abonos_prestamo)
+SQL_ABONADO = "SELECT COALESCE(SUM(monto), 0) FROM abonos WHERE prestamo_id = %s"
+
+
+def quitar_abonos_de_prestamo(c, prestamo_id):
+    """Retira los abonos del préstamo; llamar antes de eliminarlo."""
+    c.execute(f"""
+        UPDATE resumen_cartera
+        SET total_abonos = total_abonos - ({SQL_ABONADO})
+        WHERE id = 1
+    """, (prestamo_id,))
+
+    c.execute("""
+        UPDATE resumen_diario d
+        SET total = d.total - a.total
+        FROM (
+            SELECT fecha, SUM(monto) AS total
+            FROM abonos
+            WHERE prestamo_id = %s
+            GROUP BY fecha
+        ) a
+        WHERE d.fecha = a.fecha
+    """, (prestamo_id,))
+
+    c.execute("""
+        UPDATE resumen_mensual m
+        SET total = m.total - a.total
+        FROM (
+            SELECT date_trunc('month', fecha)::date AS mes, SUM(monto) AS total
+            FROM abonos
+            WHERE prestamo_id = %s
+            GROUP BY 1
+        ) a
+        WHERE m.mes = a.mes
+    """, (prestamo_id,))
+    nueva_version(c, [prestamo_id])
+
+
+# =========================
+# ABONOS
+# =========================
+def registrar_abono(c, prestamo_id, fecha, monto):
+    """Inserta el abono y actualiza los totales en la misma transacción."""
+    return registrar_abonos(c, [(prestamo_id, fecha, monto)])[0]
+
+
+def registrar_abonos(c, abonos):
+    """
+    Inserta un lote de abonos (prestamo_id, fecha, monto), actualiza los
+    totales con una sentencia por tabla y los anota en el libro de cada
+    préstamo. Devuelve los ids en el mismo orden.
+    """
+    if not abonos:
+        return []
+
+    # Un abono también es una escritura del préstamo: invalida las páginas
+    # abiertas con la versión anterior. Va antes del INSERT, que deja a cada
+    # préstamo con un bloqueo compartido por la llave foránea: dos abonos al
+    # mismo préstamo se esperan aquí en vez de bloquearse mutuamente.
+    c.execute("""
+        UPDATE prestamos p SET version = p.version + 1
+        FROM (
+            SELECT id FROM prestamos WHERE id = ANY(%s) ORDER BY id FOR UPDATE
+        ) bloqueados
+        WHERE p.id = bloqueados.id
+    """, (sorted({prestamo_id for prestamo_id, _, _ in abonos}),))
+
+    ids = execute_values(
+        c,
+        "INSERT INTO abonos (prestamo_id, fecha, monto) VALUES %s RETURNING id",
+        abonos,
+        fetch=True
+    )
+
+    por_prestamo = defaultdict(Decimal)
+    por_dia = defaultdict(Decimal)
+    por_mes = defaultdict(Decimal)
+    for prestamo_id, fecha, monto in abonos:
+        # str() da el mismo valor que psycopg2 envía para un float
+        monto = Decimal(str(monto))
+        por_prestamo[prestamo_id] += monto
+        por_dia[fecha] += monto
+        por_mes[fecha.replace(day=1)] += monto
+
+    c.execute(
+        "UPDATE resumen_cartera SET total_abonos = total_abonos + %s WHERE id = 1",
+        (sum(por_prestamo.values()),)
+    )
+
+    # La deuda de los clientes depende del total abonado por préstamo
+    clientes.quitar_prestamos(c, por_prestamo)
+    execute_values(c, """
+        INSERT INTO resumen_prestamos (prestamo_id, total_abonos)
+        VALUES %s
+        ON CONFLICT (prestamo_id) DO UPDATE
+        SET total_abonos = resumen_prestamos.total_abonos + EXCLUDED.total_abonos
+    """, list(por_prestamo.items()))
+    clientes.sumar_prestamos(c, por_prestamo)
+
+    execute_values(c, """
+        INSERT INTO resumen_diario (fecha, total)
+        VALUES %s
+        ON CONFLICT (fecha) DO UPDATE
+        SET total = resumen_diario.total + EXCLUDED.total
+    """, list(por_dia.items()))
+
+    execute_values(c, """
+        INSERT INTO resumen_mensual (mes, total)
+        VALUES %s
+        ON CONFLICT (mes) DO UPDATE
+        SET total = resumen_mensual.total + EXCLUDED.total
+    """, list(por_mes.items()))
+
+    nueva_version(c, list(por_prestamo))
+
+    ids = [fila[0] for fila in ids]
+    libro.registrar_abonos(c, ids, abonos)
+    return ids
+
+
+# =========================
+# VERSIÓN DE LOS DATOS
+# =========================
+def nueva_version(c, prestamo_ids=None):
+    """
+    Marca que los datos cambiaron. La fila queda bloqueada hasta el commit,
+    igual que la de resumen_cartera que toda escritura ya actualiza, así
+    que las versiones se confirman en orden.
+
+    prestamo_ids son los préstamos escritos; None si pudo cambiar
+    cualquiera (las instantáneas se recargan completas).
+    """
+    if prestamo_ids is None:
+        c.execute("UPDATE version_datos SET version = version + 1, recarga = version + 1 WHERE id = 1")
+        return
+
+    c.execute("UPDATE version_datos SET version = version + 1 WHERE id = 1 RETURNING version")
+    version = c.fetchone()[0]
+    if prestamo_ids:
+        execute_values(c, """
+            INSERT INTO prestamos_cambiados (prestamo_id, version)
+            VALUES %s
+            ON CONFLICT (prestamo_id) DO UPDATE SET version = EXCLUDED.version
+        """, [(prestamo_id, version) for prestamo_id in sorted(set(prestamo_ids))])
+
+
+def leer_version(c):
+    c.execute("SELECT version FROM version_datos WHERE id = 1")
+    return c.fetchone()[0]
+
+
+def cambios_desde(c, version):
+    """
+    (version, recarga, ids) con la versión actual, la última que obliga a
+    recargar todo y los préstamos escritos después de `version`.
+    """
+    c.execute("SELECT version, recarga FROM version_datos WHERE id = 1")
+    actual, recarga = c.fetchone()
+    ids = []
+    if actual != version and recarga <= version:
+        # Lo confirmado después de leer `actual` se vuelve a leer la
+        # próxima vez; releer un préstamo no cambia el resultado
+        c.execute("SELECT prestamo_id FROM prestamos_cambiados WHERE version > %s", (version,))
+        ids = [fila[0] for fila in c.fetchall()]
+    return actual, recarga, ids
+
+
+# =========================
+# LECTURA
+# =========================
+def leer_totales(c, hoy):
+    c.execute("""
+        SELECT total_prestado, total_abonos, capital_en_calle, interes_fijo
+        FROM resumen_cartera
+        WHERE id = 1
+    """)
+    total_prestado, total_abonos, capital_en_calle, interes_fijo = c.fetchone()
+
+    # Un ciclo de interés por cada 30 días iniciados, igual que calculos.py
+    c.execute("""
+        SELECT COALESCE(SUM(base_interes * (FLOOR((%s - fecha_prestamo) / 30.0) + 1)), 0)
+        FROM resumen_indefinidos
+        WHERE base_interes <> 0
+    """, (hoy,))
+    interes_indefinidos = c.fetchone()[0]
+
+    return {
+        "total_prestado": total_prestado,
+        "total_abonos": total_abonos,
+        "capital_en_calle": capital_en_calle,
+        "total_interes": interes_fijo + interes_indefinidos,
+    }
+
+
+def abonado_por_mes(c, inicio, fin):
+    """
+    Total abonado por mes entre inicio y fin (inclusive) sin leer abonos:
+    los meses completos salen de resumen_mensual y las puntas del rango de
+    resumen_diario. Devuelve [(mes, total)] ordenado.
+    """
+    primero_completo = inicio if inicio.day == 1 else particiones.mes_siguiente(inicio)
+    # Si fin es el último día de su mes, ese mes también está completo
+    despues_del_ultimo = particiones.inicio_de_mes(fin + timedelta(days=1))
+
+    if primero_completo >= despues_del_ultimo:
+        primero_completo = despues_del_ultimo = fin + timedelta(days=1)
+
+    c.execute("""
+        SELECT mes, SUM(total)
+        FROM (
+            SELECT mes, total
+            FROM resumen_mensual
+            WHERE mes >= %(primero)s AND mes < %(despues)s
+            UNION ALL
+            SELECT date_trunc('month', fecha)::date, total
+            FROM resumen_diario
+            WHERE (fecha >= %(inicio)s AND fecha < LEAST(%(primero)s, %(fin_excl)s))
+               OR (fecha >= GREATEST(%(despues)s, %(inicio)s) AND fecha < %(fin_excl)s)
+        ) t
+        GROUP BY mes
+        HAVING SUM(total) <> 0
+        ORDER BY mes
+    """, {
+        "inicio": inicio, "fin_excl": fin + timedelta(days=1),
+        "primero": primero_completo, "despues": despues_del_ultimo,
+    })
+    return c.fetchall()
+
+
+# =========================
+# RECONSTRUIR / VERIFICAR
+# =========================
+def reconstruir(c):
+    c.execute("LOCK TABLE prestamos, abonos IN SHARE MODE")
+    c.execute("DELETE FROM resumen_cartera")
+    c.execute("DELETE FROM resumen_prestamos")
+    c.execute("DELETE FROM resumen_indefinidos")
+    c.execute("DELETE FROM resumen_diario")
+    c.execute("DELETE FROM resumen_mensual")
+
+    c.execute("""
+        INSERT INTO resumen_cartera
+            (id, total_prestado, total_abonos, capital_en_calle, interes_fijo)
+        SELECT 1, * FROM (""" + SQL_CARTERA + """) t
+    """)
+    c.execute("INSERT INTO resumen_prestamos (prestamo_id, total_abonos) " + SQL_PRESTAMOS)
+    c.execute("INSERT INTO resumen_indefinidos (fecha_prestamo, base_interes) " + SQL_INDEFINIDOS)
+    c.execute("INSERT INTO resumen_diario (fecha, total) " + SQL_DIARIO)
+    c.execute("INSERT INTO resumen_mensual (mes, total) " + SQL_MENSUAL)
+
+    # La migración 3 llega aquí antes de que exista la tabla de clientes
+    c.execute("SELECT to_regclass('clientes')")
+    if c.fetchone()[0] is not None:
+        clientes.reconstruir(c)
+
+
+def _diferencias(nombre, actual, esperado):
+    # Filas con valor cero equivalen a filas ausentes
+    actual = {k: v for k, v in actual if v != 0}
+    esperado = {k: v for k, v in esperado if v != 0}
+    return [
+        (nombre, llave, actual.get(llave), esperado.get(llave))
+        for llave in sorted(set(actual) | set(esperado), key=str)
+        if actual.get(llave) != esperado.get(llave)
+    ]
+
+
+def verificar(c):
+    """Devuelve (tabla, llave, guardado, esperado) por cada diferencia."""
+    diferencias = []
+
+    c.execute("""
+        SELECT total_prestado, total_abonos, capital_en_calle, interes_fijo
+        FROM resumen_cartera WHERE id = 1
+    """)
+    fila = c.fetchone() or (None,) * 4
+    c.execute(SQL_CARTERA)
+    columnas = ["total_prestado", "total_abonos", "capital_en_calle", "interes_fijo"]
+    diferencias += _diferencias(
+        "resumen_cartera", zip(columnas, fila), zip(columnas, c.fetchone())
+    )
+
+    for tabla, sql_actual, sql_esperado in [
+        ("resumen_prestamos",
+         "SELECT prestamo_id, total_abonos FROM resumen_prestamos", SQL_PRESTAMOS),
+        ("resumen_indefinidos",
+         "SELECT fecha_prestamo, base_interes FROM resumen_indefinidos", SQL_INDEFINIDOS),
+        ("resumen_diario",
+         "SELECT fecha, total FROM resumen_diario", SQL_DIARIO),
+        ("resumen_mensual",
+         "SELECT mes, total FROM resumen_mensual", SQL_MENSUAL),
+    ]:
+        c.execute(sql_actual)
+        actual = c.fetchall()
+        c.execute(sql_esperado)
+        diferencias += _diferencias(tabla, actual, c.fetchall())
+
+    diferencias += [
+        ("clientes", (cliente_id, columna), guardado, esperado)
+        for cliente_id, columna, guardado, esperado in clientes.diferencias(c)
+    ]
+
+    return diferencias
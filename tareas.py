@@ -0,0 +1,227 @@
+import logging
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from db import conexion
+import calculos
+import clientes
+import configuracion
+import resumen
+
+# =========================
+# CIERRE DIARIO
+# =========================
+# Una vez al día se guardan en cada préstamo sin pagar los valores que
+# dependen de la fecha: interes_total, mora, dias_vencidos y
+# proxima_fecha_pago (con calculado_al = fecha del cierre). Así "qué
+# préstamos están vencidos" es una consulta sobre columnas indexadas. Cada
+# fecha queda registrada en cierres_diarios con los totales del día; si el
+# proceso estuvo caído, la siguiente ejecución cierra los días que falten
+# en orden. Después se reconstruye la exposición de los clientes. Un día
+# pasado (los atrasados, o --fecha) solo registra sus totales: los
+# préstamos y los clientes siempre guardan los valores de hoy.
+#
+# Proceso worker del Procfile:
+#
+#   python tareas.py              espera y cierra cada día a CIERRE_HORA
+#   python tareas.py --una-vez    cierra los días pendientes y termina
+#   python tareas.py --fecha AAAA-MM-DD   vuelve a cerrar esa fecha
+#
+# Las escrituras sobre un préstamo lo recalculan al momento con
+# recalcular_prestamo (antes de sumar su aporte en resumen.py), para que
+# el cierre del día siga vigente.
+
+HORA_CIERRE = os.environ.get("CIERRE_HORA", "00:05")
+# Segundos antes de reintentar un cierre que falló
+REINTENTO = 600
+
+# Llave del candado que evita dos cierres simultáneos
+CANDADO = 7302
+
+log = logging.getLogger("tareas")
+
+# Fórmulas de calculos.py a la fecha %(hoy)s. interes_total pasa por texto
+# para guardar el float8 completo (el cast directo a numeric lo corta a 15
+# dígitos) y que clientes.py sume lo mismo que el listado.
+SQL_CALCULO = """
+    UPDATE prestamos p
+    SET dias_vencidos = v.dias_vencidos,
+        interes_total = v.interes_total::text::numeric,
+        mora = v.mora::numeric,
+        proxima_fecha_pago = v.proxima_fecha_pago,
+        calculado_al = %(hoy)s
+    FROM (""" + calculos.SQL_CARTERA.format(
+    columnas="""p.id, d.dias_vencidos, i.interes_total, m.mora,
+               CASE
+                   WHEN p.pagado THEN NULL
+                   WHEN p.tipo_prestamo = 'fijo' THEN p.fecha_prestamo + COALESCE(p.plazo_dias, 30)
+                   -- Indefinido: inicio del siguiente ciclo de 30 días
+                   ELSE p.fecha_prestamo + 30 * GREATEST(d.ciclos + 1, 0)
+               END AS proxima_fecha_pago""",
+    filtro="{filtro}",
+) + """) v
+    WHERE p.id = v.id
+"""
+
+_dias_cerrados = set()
+
+
+# =========================
+# CÁLCULO
+# =========================
+def recalcular_prestamo(c, prestamo_id, hoy, mora_porcentaje):
+    """Actualiza los valores guardados de un préstamo recién escrito."""
+    c.execute(SQL_CALCULO.format(filtro="p.id = %(id)s"), {
+        "id": prestamo_id, "hoy": hoy, "mora": mora_porcentaje,
+    })
+
+
+def cerrar_dia(c, fecha, mora_porcentaje, guardar=True):
+    """
+    Registra el cierre de `fecha` con sus totales. Con guardar (el cierre
+    de hoy) además calcula y guarda los valores de todos los préstamos sin
+    pagar; un día pasado no los toca, porque el listado y /clientes usan
+    los de hoy.
+    """
+    parametros = {"fecha": fecha, "hoy": fecha, "mora": mora_porcentaje}
+    if guardar:
+        # Los préstamos en orden de id antes que los clientes, como las
+        # demás escrituras (ver resumen.py)
+        c.execute("""
+            SELECT COUNT(*) FROM (
+                SELECT id FROM prestamos WHERE pagado = FALSE ORDER BY id FOR NO KEY UPDATE
+            ) bloqueados
+        """)
+        c.execute(SQL_CALCULO.format(filtro="p.pagado = FALSE"), parametros)
+        # La deuda de cada cliente depende de los valores recién calculados
+        clientes.reconstruir(c)
+        # Solo cambian valores del día, que instantanea.py calcula por su cuenta
+        resumen.nueva_version(c, [])
+
+    c.execute("""
+        INSERT INTO cierres_diarios (fecha, prestamos_vencidos, mora_total, mora_porcentaje)
+        SELECT %(fecha)s,
+               COUNT(*) FILTER (WHERE dias_vencidos > 0),
+               COALESCE(SUM(mora::numeric), 0),
+               %(mora)s
+        FROM (""" + calculos.SQL_CARTERA.format(
+        columnas="d.dias_vencidos, m.mora",
+        filtro="p.pagado = FALSE AND p.fecha_prestamo <= %(fecha)s",
+    ) + """) dia
+        ON CONFLICT (fecha) DO UPDATE
+        SET prestamos_vencidos = EXCLUDED.prestamos_vencidos,
+            mora_total = EXCLUDED.mora_total,
+            mora_porcentaje = EXCLUDED.mora_porcentaje,
+            ejecutado = NOW()
+    """, parametros)
+
+
+# =========================
+# LECTURA
+# =========================
+def al_dia(c, hoy):
+    """True si el cierre de hoy ya corrió y los valores guardados sirven."""
+    if hoy in _dias_cerrados:
+        return True
+
+    c.execute("SELECT 1 FROM cierres_diarios WHERE fecha = %s", (hoy,))
+    if c.fetchone() is None:
+        return False
+
+    _dias_cerrados.add(hoy)
+    return True
+
+
+def ultimo_cierre(c):
+    c.execute("""
+        SELECT fecha, prestamos_vencidos, mora_total
+        FROM cierres_diarios
+        ORDER BY fecha DESC
+        LIMIT 1
+    """)
+    fila = c.fetchone()
+    if fila is None:
+        return None
+    return {"fecha": fila[0], "prestamos_vencidos": fila[1], "mora_total": fila[2]}
+
+
+# =========================
+# EJECUCIÓN
+# =========================
+def ejecutar(hoy=None, fecha=None, salida=print):
+    """
+    Cierra los días pendientes hasta hoy (o solo `fecha`, aunque ya esté
+    cerrada). Cada día va en su propia transacción; solo el de hoy guarda
+    valores en los préstamos. Devuelve las fechas cerradas.
+    """
+    hoy = hoy or date.today()
+    cerradas = []
+
+    with conexion() as conn:
+        c = conn.cursor()
+        c.execute("SELECT pg_try_advisory_lock(%s)", (CANDADO,))
+        if not c.fetchone()[0]:
+            salida("Otro cierre está en curso")
+            return cerradas
+
+        try:
+            if fecha:
+                fechas = [fecha]
+            else:
+                c.execute("SELECT MAX(fecha) FROM cierres_diarios")
+                ultimo = c.fetchone()[0]
+                desde = ultimo + timedelta(days=1) if ultimo else hoy
+                fechas = [desde + timedelta(days=i) for i in range((hoy - desde).days + 1)]
+
+            # La tasa se lee de la base, no de la caché del proceso
+            mora_porcentaje = configuracion.mora_vigente(c)
+
+            for dia in fechas:
+                cerrar_dia(c, dia, mora_porcentaje, guardar=dia == hoy)
+                conn.commit()
+                cerradas.append(dia)
+                salida(f"Cierre {dia}")
+        finally:
+            conn.rollback()
+            c.execute("SELECT pg_advisory_unlock(%s)", (CANDADO,))
+
+    return cerradas
+
+
+def _segundos_hasta_el_cierre():
+    ahora = datetime.now()
+    hora, minuto = map(int, HORA_CIERRE.split(":"))
+    proximo = ahora.replace(hour=hora, minute=minuto, second=0, microsecond=0)
+    if proximo <= ahora:
+        proximo += timedelta(days=1)
+    return (proximo - ahora).total_seconds()
+
+
+def trabajar():
+    # migraciones usa este módulo; se importa aquí para no crear un ciclo
+    import migraciones
+
+    # Al arrancar se ponen al día los cierres atrasados
+    while True:
+        try:
+            ejecutar(salida=log.info)
+            migraciones.mantener_particiones(log.info)
+            espera = _segundos_hasta_el_cierre()
+        except Exception:
+            log.exception("Falló el cierre diario")
+            espera = REINTENTO
+        time.sleep(espera)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+
+    if "--fecha" in sys.argv:
+        fecha = datetime.strptime(sys.argv[sys.argv.index("--fecha") + 1], "%Y-%m-%d").date()
+        ejecutar(fecha=fecha)
+    elif "--una-vez" in sys.argv:
+        ejecutar()
+    else:
+        trabajar()
@@ -0,0 +1,104 @@
+from datetime import timedelta
+
+# =========================
+# REFERENCIA DEL MOTOR
+# =========================
+# Las reglas por fila como estaban en index(), estadisticas() y
+# calcular_mora() antes de calculos.py, copiadas sin cambios (salvo recibir
+# la mora y la fecha como parámetros en vez de leerlas de la base y del
+# reloj), y carteras aleatorias para compararlas con calcular_cartera().
+# Las usan las pruebas y `python benchmark.py motor`.
+
+# Montos que caen justo en medio centavo (exactos en binario) o muy cerca
+MONTOS_BORDE = [0.125, 0.375, 2.675, 100.125, 1000.005, 1234.565, 250000.5, 0.005]
+
+
+def calcular_mora(base, fecha_vencimiento, pagado, mora_porcentaje, hoy):
+    if pagado:
+        return 0, 0
+
+    if hoy > fecha_vencimiento:
+        dias_vencidos = (hoy - fecha_vencimiento).days
+        mora = base * (mora_porcentaje / 100) * dias_vencidos
+        return round(mora, 2), dias_vencidos
+
+    return 0, 0
+
+
+def prestamo_original(monto, interes, fecha_prestamo, tipo_prestamo, plazo_dias,
+                      pagado, total_abonos, mora_porcentaje, hoy):
+    """Un préstamo como lo calculaba index() (y el interés de estadisticas())."""
+    dias_transcurridos = (hoy - fecha_prestamo).days
+    capital = float(monto)
+    interes_porcentaje = float(interes)
+
+    if tipo_prestamo == "fijo":
+        fecha_vencimiento = fecha_prestamo + timedelta(days=plazo_dias)
+        interes = capital * (interes_porcentaje / 100)
+        base = capital + interes
+        mora, dias = calcular_mora(base, fecha_vencimiento, pagado, mora_porcentaje, hoy)
+        total_deuda = base + mora
+        deuda_restante = max(total_deuda - total_abonos, 0)
+        dias_restantes = (fecha_vencimiento - hoy).days
+    else:
+        ciclos = dias_transcurridos // 30
+        interes = capital * (interes_porcentaje / 100) * (ciclos + 1)
+        total_deuda = capital + interes
+        mora = 0
+        dias = 0
+        dias_restantes = "∞"
+        deuda_restante = max(total_deuda - total_abonos, 0)
+
+    return {
+        "interes": interes,
+        "mora": mora,
+        "dias": dias,
+        "dias_restantes": dias_restantes,
+        "total": round(deuda_restante, 2),
+    }
+
+
+def cartera_aleatoria(rnd, cantidad, hoy):
+    """
+    Columnas de `cantidad` préstamos (fijos e indefinidos, pagados, al día,
+    vencidos y por empezar) con montos, tasas y abonos que incluyen valores
+    en el borde del redondeo.
+    """
+    cartera = {nombre: [] for nombre in (
+        "monto", "interes", "fecha_prestamo", "tipo_prestamo", "plazo_dias",
+        "pagado", "total_abonos",
+    )}
+    for _ in range(cantidad):
+        if rnd.random() < 0.2:
+            monto = rnd.choice(MONTOS_BORDE)
+            interes = rnd.choice([0, 0.5, 12.5, 50])
+        else:
+            monto = rnd.choice([rnd.randint(1, 5000) * 1000, round(rnd.uniform(1, 1e6), 2)])
+            interes = rnd.choice([5, 10, 12.5, 20, round(rnd.uniform(0, 30), 2)])
+
+        total_deuda = monto * (1 + interes / 100)
+        total_abonos = rnd.choice([
+            0, 0, round(rnd.uniform(0, total_deuda), 2), total_deuda,
+            round(total_deuda - rnd.choice(MONTOS_BORDE), 2), total_deuda * 2,
+        ])
+
+        cartera["monto"].append(monto)
+        cartera["interes"].append(interes)
+        cartera["fecha_prestamo"].append(hoy - timedelta(days=rnd.randint(-10, 800)))
+        cartera["tipo_prestamo"].append(rnd.choice(["fijo", "indefinido"]))
+        cartera["plazo_dias"].append(rnd.choice([1, 15, 30, 45, 60, 90]))
+        cartera["pagado"].append(rnd.random() < 0.25)
+        cartera["total_abonos"].append(total_abonos)
+    return cartera
+
+
+def calcular_original(cartera, mora_porcentaje, hoy):
+    """prestamo_original() para cada préstamo de la cartera."""
+    return [
+        prestamo_original(*valores, mora_porcentaje, hoy)
+        for valores in zip(
+            cartera["monto"], cartera["interes"], cartera["fecha_prestamo"],
+            cartera["tipo_prestamo"], cartera["plazo_dias"], cartera["pagado"],
+            cartera["total_abonos"],
+        )
+    ]
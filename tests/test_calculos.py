@@ -0,0 +1,147 @@
+import random
+from datetime import date, timedelta
+from decimal import ROUND_HALF_EVEN, Decimal
+
+import numpy as np
+import pytest
+
+from calculos import calcular_cartera, redondear
+from tests.referencia import MONTOS_BORDE, calcular_original, cartera_aleatoria
+
+# calcular_cartera() debe dar, préstamo por préstamo, exactamente lo que
+# daban los ciclos por fila de index() y estadisticas() (tests/referencia.py)
+
+HOY = date(2024, 3, 15)
+
+
+def comparar(cartera, mora_porcentaje, hoy):
+    calculo = calcular_cartera(cartera, mora_porcentaje, hoy)
+    esperados = calcular_original(cartera, mora_porcentaje, hoy)
+
+    for i, esperado in enumerate(esperados):
+        fijo = cartera["tipo_prestamo"][i] == "fijo"
+        obtenido = {
+            "interes": calculo["interes_total"][i].item(),
+            "mora": calculo["mora"][i].item() if fijo else 0,
+            "dias": calculo["dias_vencidos"][i].item(),
+            "dias_restantes": calculo["dias_restantes"][i].item() if fijo else "∞",
+            "total": calculo["deuda_restante"][i].item(),
+        }
+        fila = {nombre: columna[i] for nombre, columna in cartera.items()}
+        assert obtenido == esperado, fila
+
+
+@pytest.mark.parametrize("semilla", range(20))
+def test_cartera_aleatoria(semilla):
+    rnd = random.Random(semilla)
+    hoy = HOY + timedelta(days=rnd.randint(0, 365))
+    mora_porcentaje = rnd.choice([0, 0.5, 1, 2.5, 3.33, 50])
+    comparar(cartera_aleatoria(rnd, 500, hoy), mora_porcentaje, hoy)
+
+
+def test_casos_limite():
+    # Fijo que vence hoy, ayer y mañana; indefinido en el día 29, 30 y 31;
+    # pagados con mora y préstamos con fecha futura
+    casos = [
+        # monto, interes, días desde el préstamo, tipo, plazo, pagado, abonos
+        (1000000, 10, 30, "fijo", 30, False, 0),
+        (1000000, 10, 31, "fijo", 30, False, 0),
+        (1000000, 10, 29, "fijo", 30, False, 0),
+        (1000000, 10, 400, "fijo", 30, True, 0),
+        (1000000, 10, 29, "indefinido", 30, False, 0),
+        (1000000, 10, 30, "indefinido", 30, False, 0),
+        (1000000, 10, 31, "indefinido", 30, False, 0),
+        (1000000, 10, -5, "indefinido", 30, False, 0),
+        (1000000, 10, -5, "fijo", 30, False, 0),
+        (1000000, 10, 45, "fijo", 30, False, 5000000),
+        (1000000, 10, 45, "indefinido", 30, True, 1100000),
+    ]
+    cartera = {
+        "monto": [c[0] for c in casos],
+        "interes": [c[1] for c in casos],
+        "fecha_prestamo": [HOY - timedelta(days=c[2]) for c in casos],
+        "tipo_prestamo": [c[3] for c in casos],
+        "plazo_dias": [c[4] for c in casos],
+        "pagado": [c[5] for c in casos],
+        "total_abonos": [c[6] for c in casos],
+    }
+    comparar(cartera, 2, HOY)
+
+
+@pytest.mark.parametrize("mora_porcentaje", [1, 12.5, 25, 50])
+def test_redondeo_en_medio_centavo(mora_porcentaje):
+    # Mora y deuda que quedan exactamente en medio centavo o muy cerca
+    n = len(MONTOS_BORDE)
+    cartera = {
+        "monto": MONTOS_BORDE * 2,
+        "interes": [0] * (2 * n),
+        "fecha_prestamo": [HOY - timedelta(days=31)] * (2 * n),
+        "tipo_prestamo": ["fijo"] * n + ["indefinido"] * n,
+        "plazo_dias": [30] * (2 * n),
+        "pagado": [False] * (2 * n),
+        "total_abonos": [0] * (2 * n),
+    }
+    comparar(cartera, mora_porcentaje, HOY)
+
+
+def test_redondear_como_round_y_decimal():
+    rnd = random.Random(7)
+    valores = MONTOS_BORDE + [k / 1000 for k in range(-2000, 2000, 5)]
+    valores += [rnd.uniform(-1e7, 1e7) for _ in range(5000)]
+
+    obtenidos = redondear(valores).tolist()
+    for valor, obtenido in zip(valores, obtenidos):
+        assert obtenido == round(valor, 2), valor
+        exacto = Decimal(valor).quantize(Decimal("0.01"), rounding=ROUND_HALF_EVEN)
+        assert obtenido == float(exacto), valor
+
+
+def test_redondear_producto_en_medio_centavo():
+    # x * 100 en float64 da justo ,5 aunque el valor exacto quede por encima
+    # o por debajo: el resultado no puede depender de que haya longdouble
+    valores = [
+        777820.455, 833820.885, 988230.945, 683704.675,
+        30414.595, 813651.315, 680499.065, 944662.205,
+    ]
+    for valor in valores:
+        centavos = valor * 100
+        assert centavos - int(centavos) == 0.5
+        assert Decimal(valor) * 100 != Decimal(centavos)
+
+    for valor, obtenido in zip(valores, redondear(valores).tolist()):
+        exacto = Decimal(valor).quantize(Decimal("0.01"), rounding=ROUND_HALF_EVEN)
+        assert obtenido == float(exacto), valor
+
+
+def test_plazo_por_defecto():
+    cartera = {
+        "monto": [1000, 1000],
+        "interes": [10, 10],
+        "fecha_prestamo": [HOY - timedelta(days=40)] * 2,
+        "tipo_prestamo": ["fijo", "fijo"],
+        "plazo_dias": [None, 30],
+        "pagado": [False, False],
+        "total_abonos": [0, 0],
+    }
+    calculo = calcular_cartera(cartera, 1, HOY)
+    for campo in ("fecha_vencimiento", "dias_vencidos", "mora", "deuda_restante"):
+        assert calculo[campo][0] == calculo[campo][1], campo
+
+
+def test_arreglos_como_columnas():
+    # instantanea.py pasa arreglos NumPy en vez de listas
+    rnd = random.Random(11)
+    cartera = cartera_aleatoria(rnd, 300, HOY)
+    arreglos = {
+        "monto": np.array(cartera["monto"], dtype=float),
+        "interes": np.array(cartera["interes"], dtype=float),
+        "fecha_prestamo": np.array(cartera["fecha_prestamo"], dtype="datetime64[D]"),
+        "tipo_prestamo": np.array(cartera["tipo_prestamo"], dtype=object),
+        "plazo_dias": np.array(cartera["plazo_dias"], dtype=np.int64),
+        "pagado": np.array(cartera["pagado"], dtype=bool),
+        "total_abonos": np.array(cartera["total_abonos"], dtype=float),
+    }
+    de_listas = calcular_cartera(cartera, 2.5, HOY)
+    de_arreglos = calcular_cartera(arreglos, 2.5, HOY)
+    for campo, valores in de_listas.items():
+        assert np.array_equal(valores, de_arreglos[campo]), campo
@@ -0,0 +1,89 @@
+import os
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from calculos import SQL_CARTERA, calcular_cartera
+from tests.referencia import cartera_aleatoria
+
+# calculos.SQL_CARTERA y redondear() en la base deben dar lo mismo que
+# calcular_cartera(), medio centavo incluido: el listado ordena por deuda en
+# SQL o en instantanea.py según el worker. Corre sobre tablas temporales
+# que tapan las de la base y se descartan al final.
+
+URL = os.environ.get("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not URL, reason="Sin TEST_DATABASE_URL")
+
+HOY = date(2024, 3, 15)
+CAMPOS = ("interes_total", "dias_vencidos", "mora", "deuda_restante")
+
+
+@pytest.fixture
+def cursor():
+    # db.py lee DATABASE_URL al importarse
+    os.environ["DATABASE_URL"] = URL
+    import migraciones
+    from db import conexion
+
+    migraciones.migrar(salida=lambda *_: None)
+    with conexion() as conn:
+        c = conn.cursor()
+        c.execute("CREATE TEMP TABLE prestamos (LIKE public.prestamos INCLUDING DEFAULTS)")
+        c.execute("CREATE TEMP TABLE resumen_prestamos (LIKE public.resumen_prestamos)")
+        try:
+            yield c
+        finally:
+            conn.rollback()
+
+
+def comparar(c, cartera, mora_porcentaje, hoy):
+    filas = list(zip(*(cartera[nombre] for nombre in (
+        "monto", "interes", "fecha_prestamo", "tipo_prestamo", "plazo_dias", "pagado",
+    ))))
+    c.execute("DELETE FROM resumen_prestamos")
+    c.execute("DELETE FROM prestamos")
+    for i, fila in enumerate(filas, 1):
+        c.execute("""
+            INSERT INTO prestamos (id, monto, interes, fecha_prestamo, tipo_prestamo, plazo_dias, pagado)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, (i,) + fila)
+        c.execute(
+            "INSERT INTO resumen_prestamos (prestamo_id, total_abonos) VALUES (%s, %s)",
+            (i, cartera["total_abonos"][i - 1]),
+        )
+
+    c.execute(SQL_CARTERA.format(
+        columnas="i.interes_total, d.dias_vencidos, m.mora, s.deuda_restante",
+        filtro="TRUE",
+    ) + " ORDER BY p.id", {"hoy": hoy, "mora": mora_porcentaje})
+    calculo = calcular_cartera(cartera, mora_porcentaje, hoy)
+
+    for i, fila in enumerate(c.fetchall()):
+        esperado = tuple(calculo[campo][i].item() for campo in CAMPOS)
+        assert fila == esperado, filas[i]
+
+
+@pytest.mark.parametrize("semilla", range(5))
+def test_cartera_aleatoria(cursor, semilla):
+    rnd = random.Random(semilla)
+    hoy = HOY + timedelta(days=rnd.randint(0, 365))
+    mora_porcentaje = rnd.choice([0.5, 1, 2.5, 3.33, 50])
+    comparar(cursor, cartera_aleatoria(rnd, 300, hoy), mora_porcentaje, hoy)
+
+
+def test_deuda_en_medio_centavo(cursor):
+    # ROUND de numeric subía 100.125 y 2.675; redondear() los deja como
+    # calcular_cartera() (100.12 y 2.67)
+    montos = [100.125, 100.12, 100.13, 2.675, 2.67, 2.68, 0.125, 1000.005]
+    n = len(montos)
+    cartera = {
+        "monto": montos,
+        "interes": [0] * n,
+        "fecha_prestamo": [HOY - timedelta(days=5)] * n,
+        "tipo_prestamo": ["fijo"] * n,
+        "plazo_dias": [30] * n,
+        "pagado": [False] * n,
+        "total_abonos": [0] * n,
+    }
+    comparar(cursor, cartera, 1, HOY)
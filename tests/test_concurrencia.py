@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+from datetime import date, timedelta
+
+import pytest
+
+# =========================
+# CONCURRENCIA
+# =========================
+# Dos escrituras a la vez sobre los mismos préstamos o clientes no deben
+# terminar en DeadlockDetected: todas toman los bloqueos en el orden de
+# resumen.py. Necesitan una base desechable en TEST_DATABASE_URL (se migra
+# y se escribe en ella); sin esa variable se omiten.
+
+URL = os.environ.get("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not URL, reason="Sin TEST_DATABASE_URL")
+
+# Lo que tarda la escritura que llega primero en el paso donde la segunda
+# la alcanza
+ESPERA = 0.5
+
+
+@pytest.fixture(scope="module")
+def app():
+    # db.py lee DATABASE_URL al importarse
+    os.environ["DATABASE_URL"] = URL
+    import app as modulo
+    import migraciones
+
+    migraciones.migrar(salida=lambda *_: None)
+    aplicacion = modulo.create_app()
+    aplicacion.testing = True
+    return aplicacion
+
+
+def cliente(app):
+    cliente = app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion["usuario_id"] = 1
+    return cliente
+
+
+def formulario(cedula):
+    hoy = date.today()
+    return {
+        "nombre": "Prueba Concurrencia", "cedula": cedula, "celular": "3000000000",
+        "monto": "100000", "interes": "10", "fecha_prestamo": hoy.isoformat(),
+        "fecha_pago": (hoy + timedelta(days=30)).isoformat(), "medio": "Efectivo",
+        "objeto": "", "tipo_prestamo": "fijo", "plazo_dias": "30",
+    }
+
+
+def crear_prestamo(app, cedula):
+    from db import conexion
+
+    cliente(app).post("/agregar", data=formulario(cedula))
+    with conexion() as conn:
+        c = conn.cursor()
+        c.execute("SELECT MAX(id) FROM prestamos WHERE cedula = %s", (cedula,))
+        return c.fetchone()[0]
+
+
+def en_paralelo(*pasos, separacion=0.1):
+    """Corre cada paso en su hilo, uno tras otro con `separacion`; devuelve los errores."""
+    errores = []
+
+    def correr(paso):
+        try:
+            respuesta = paso()
+            if respuesta.status_code >= 500:
+                errores.append(respuesta.status_code)
+        except Exception as error:
+            errores.append(error)
+
+    hilos = [threading.Thread(target=correr, args=(paso,)) for paso in pasos]
+    for hilo in hilos:
+        hilo.start()
+        time.sleep(separacion)
+    for hilo in hilos:
+        hilo.join()
+    return errores
+
+
+def demorar(monkeypatch, modulo, nombre, antes=False):
+    original = getattr(modulo, nombre)
+
+    def demorada(*args, **kwargs):
+        if antes:
+            time.sleep(ESPERA)
+        resultado = original(*args, **kwargs)
+        if not antes:
+            time.sleep(ESPERA)
+        return resultado
+
+    monkeypatch.setattr(modulo, nombre, demorada)
+
+
+def test_agregar_y_abonar_al_mismo_cliente(app, monkeypatch):
+    # agregar bloquea el cliente al asignarlo; abonar a otro préstamo del
+    # mismo cliente llega entre tanto
+    import clientes
+
+    cedula = f"concurrencia-{time.time_ns()}"
+    prestamo_id = crear_prestamo(app, cedula)
+    demorar(monkeypatch, clientes, "asignar")
+
+    errores = en_paralelo(
+        lambda: cliente(app).post("/agregar", data=formulario(cedula)),
+        lambda: cliente(app).post(f"/abonar/{prestamo_id}", data={"abono": "1000"}),
+    )
+    assert errores == []
+
+
+def test_dos_abonos_al_mismo_prestamo(app, monkeypatch):
+    # Los abonos no comparan versión: dos operadores pueden abonar al mismo
+    # préstamo a la vez y ambos abonos deben quedar
+    import clientes
+    from db import conexion
+
+    prestamo_id = crear_prestamo(app, f"concurrencia-{time.time_ns()}")
+    demorar(monkeypatch, clientes, "quitar_prestamos", antes=True)
+
+    errores = en_paralelo(
+        lambda: cliente(app).post(f"/abonar/{prestamo_id}", data={"abono": "1000"}),
+        lambda: cliente(app).post(f"/abonar/{prestamo_id}", data={"abono": "2000"}),
+    )
+    assert errores == []
+
+    with conexion() as conn:
+        c = conn.cursor()
+        c.execute("SELECT SUM(monto) FROM abonos WHERE prestamo_id = %s", (prestamo_id,))
+        assert c.fetchone()[0] == 3000
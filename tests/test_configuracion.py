@@ -0,0 +1,104 @@
+import os
+import time
+from datetime import date, timedelta
+
+import pytest
+
+# =========================
+# TASA CAMBIADA EN OTRO WORKER
+# =========================
+# Otro worker cambia la tasa de mora mientras este la tiene en caché: las
+# escrituras deben guardar la tasa nueva y las páginas cacheadas cambiar de
+# etiqueta sin esperar CONFIG_TTL.
+
+URL = os.environ.get("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not URL, reason="Sin TEST_DATABASE_URL")
+
+
+@pytest.fixture
+def app():
+    # db.py lee DATABASE_URL al importarse
+    os.environ["DATABASE_URL"] = URL
+    import app as modulo
+    import migraciones
+
+    migraciones.migrar(salida=lambda *_: None)
+    aplicacion = modulo.create_app()
+    aplicacion.testing = True
+    return aplicacion
+
+
+@pytest.fixture
+def tasa_de_otro_worker(app):
+    """Deja la tasa vieja en la caché de este worker y la cambia en la base."""
+    import configuracion
+    from db import conexion
+
+    with conexion() as conn:
+        c = conn.cursor()
+        anterior = configuracion.mora_vigente(c)
+        nueva = anterior + 1
+        configuracion.cambiar_mora_diaria(c, nueva)
+
+    yield anterior, nueva
+
+    with conexion() as conn:
+        configuracion.cambiar_mora_diaria(conn.cursor(), anterior)
+    configuracion.invalidar()
+
+
+def cliente(app):
+    cliente = app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion["usuario_id"] = 1
+    return cliente
+
+
+def test_escritura_guarda_la_tasa_nueva(app, tasa_de_otro_worker):
+    from calculos import calcular_cartera
+    from db import conexion
+
+    anterior, nueva = tasa_de_otro_worker
+    hoy = date.today()
+    cedula = f"configuracion-{time.time_ns()}"
+    # Fijo vencido hace 10 días: la mora depende de la tasa
+    cliente(app).post("/agregar", data={
+        "nombre": "Prueba Tasa", "cedula": cedula, "celular": "3000000000",
+        "monto": "100000", "interes": "10",
+        "fecha_prestamo": (hoy - timedelta(days=40)).isoformat(),
+        "fecha_pago": (hoy - timedelta(days=10)).isoformat(), "medio": "Efectivo",
+        "objeto": "", "tipo_prestamo": "fijo", "plazo_dias": "30",
+    })
+
+    with conexion() as conn:
+        c = conn.cursor()
+        c.execute("SELECT mora FROM prestamos WHERE cedula = %s", (cedula,))
+        mora = c.fetchone()[0]
+
+    cartera = {
+        "monto": [100000], "interes": [10], "fecha_prestamo": [hoy - timedelta(days=40)],
+        "tipo_prestamo": ["fijo"], "plazo_dias": [30], "pagado": [False], "total_abonos": [0],
+    }
+    assert float(mora) == calcular_cartera(cartera, nueva, hoy)["mora"][0]
+    assert float(mora) != calcular_cartera(cartera, anterior, hoy)["mora"][0]
+
+
+def test_pagina_cacheada_cambia_de_etiqueta(app):
+    import configuracion
+    from db import conexion
+
+    primera = cliente(app).get("/estadisticas")
+    etiqueta = primera.headers["ETag"]
+
+    with conexion() as conn:
+        c = conn.cursor()
+        anterior = configuracion.mora_vigente(c)
+        configuracion.cambiar_mora_diaria(c, anterior + 1)
+    try:
+        segunda = cliente(app).get("/estadisticas", headers={"If-None-Match": etiqueta})
+        assert segunda.status_code == 200
+        assert str(anterior + 1) in segunda.get_data(as_text=True)
+    finally:
+        with conexion() as conn:
+            configuracion.cambiar_mora_diaria(conn.cursor(), anterior)
+        configuracion.invalidar()
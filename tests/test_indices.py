@@ -0,0 +1,39 @@
+import os
+
+import pytest
+
+# =========================
+# ÍNDICES DEL CAMINO CALIENTE
+# =========================
+# migraciones.verificar_indices() con EXPLAIN sobre las consultas que arman
+# app.py y resumen.py: un índice borrado o que el planificador ya no puede
+# usar hace fallar la prueba.
+
+URL = os.environ.get("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not URL, reason="Sin TEST_DATABASE_URL")
+
+
+@pytest.fixture
+def migraciones():
+    # db.py lee DATABASE_URL al importarse
+    os.environ["DATABASE_URL"] = URL
+    import migraciones
+
+    migraciones.migrar(salida=lambda *_: None)
+    return migraciones
+
+
+def test_consultas_calientes_usan_su_indice(migraciones):
+    lineas = []
+    assert migraciones.verificar_indices(salida=lineas.append), "\n".join(lineas)
+    assert len(lineas) == len(migraciones.consultas_calientes())
+
+
+def test_indice_que_no_se_usa_falla(migraciones, monkeypatch):
+    nombre, sql, params, _, uso = migraciones.consultas_calientes()[0]
+    monkeypatch.setattr(migraciones, "consultas_calientes", lambda: [
+        (nombre, sql, params, "idx_que_no_existe", uso),
+    ])
+    lineas = []
+    assert not migraciones.verificar_indices(salida=lineas.append)
+    assert lineas[0].startswith("FALLA")
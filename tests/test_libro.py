@@ -0,0 +1,69 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+
+import libro
+from calculos import calcular_cartera
+from tests.referencia import cartera_aleatoria
+
+# =========================
+# SALDO DEL LIBRO
+# =========================
+# El saldo final del cronograma de un préstamo debe ser su deuda_restante
+# en calcular_cartera(): en centavos y sin saldo a favor.
+
+HOY = date(2024, 3, 15)
+
+
+def movimientos(cartera, i):
+    """Movimientos de un préstamo como los lee libro.cronograma()."""
+    fecha_prestamo = cartera["fecha_prestamo"][i]
+    # La base devuelve NUMERIC como Decimal y los números de JSONB como float
+    lista = [{
+        "id": 1, "tipo": "desembolso", "fecha": fecha_prestamo,
+        "monto": Decimal(str(cartera["monto"][i])),
+        "detalle": {
+            "interes": cartera["interes"][i],
+            "tipo_prestamo": cartera["tipo_prestamo"][i],
+            "plazo_dias": cartera["plazo_dias"][i],
+            "fecha_prestamo": fecha_prestamo.isoformat(),
+        },
+    }]
+    if cartera["total_abonos"][i]:
+        lista.append({
+            "id": 2, "tipo": "abono", "fecha": max(fecha_prestamo, HOY - timedelta(days=3)),
+            "monto": Decimal(str(cartera["total_abonos"][i])), "detalle": None,
+        })
+    if cartera["pagado"][i]:
+        lista.append({"id": 3, "tipo": "pagado", "fecha": HOY, "monto": None, "detalle": None})
+    return lista
+
+
+@pytest.mark.parametrize("semilla", range(5))
+@pytest.mark.parametrize("mora_porcentaje", [0.5, 2.5, 3.33])
+def test_saldo_final_como_calcular_cartera(semilla, mora_porcentaje):
+    rnd = random.Random(semilla)
+    cartera = cartera_aleatoria(rnd, 300, HOY)
+    # Abonos por valores con decimales sueltos, como los del formulario
+    cartera["total_abonos"] = [round(valor, 2) for valor in cartera["total_abonos"]]
+    calculo = calcular_cartera(cartera, mora_porcentaje, HOY)
+
+    for i in range(len(cartera["monto"])):
+        filas = list(libro.generar(movimientos(cartera, i), HOY, mora_porcentaje))
+        esperado = calculo["deuda_restante"][i].item()
+        assert filas[-1]["saldo"] == Decimal(repr(esperado)), {
+            nombre: columna[i] for nombre, columna in cartera.items()
+        }
+
+
+def test_abonos_de_mas_no_dejan_saldo_negativo():
+    cartera = {
+        "monto": [100000], "interes": [10], "fecha_prestamo": [HOY - timedelta(days=10)],
+        "tipo_prestamo": ["fijo"], "plazo_dias": [30], "pagado": [False],
+        "total_abonos": [150000],
+    }
+    filas = list(libro.generar(movimientos(cartera, 0), HOY, 1))
+    assert filas[-1]["saldo"] == 0
+    assert all(fila["saldo"] >= 0 for fila in filas)
@@ -0,0 +1,81 @@
+import os
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+
+# =========================
+# CIERRE DE UN DÍA PASADO
+# =========================
+# tareas.py --fecha con un día pasado solo registra los totales de ese día:
+# los valores guardados en los préstamos y la deuda de los clientes siguen
+# siendo los de hoy, que usan el listado y /clientes.
+
+URL = os.environ.get("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not URL, reason="Sin TEST_DATABASE_URL")
+
+SQL_GUARDADOS = """
+    SELECT id, dias_vencidos, interes_total, mora, proxima_fecha_pago, calculado_al
+    FROM prestamos
+    ORDER BY id
+"""
+
+
+@pytest.fixture
+def cursor():
+    # db.py lee DATABASE_URL al importarse
+    os.environ["DATABASE_URL"] = URL
+    import migraciones
+    from db import conexion
+
+    migraciones.migrar(salida=lambda *_: None)
+    with conexion() as conn:
+        yield conn.cursor()
+
+
+def leer(c):
+    c.execute(SQL_GUARDADOS)
+    prestamos = c.fetchall()
+    c.execute("SELECT id, deuda, prestamos_vencidos FROM clientes ORDER BY id")
+    return prestamos, c.fetchall()
+
+
+def test_dia_pasado_no_toca_los_valores_de_hoy(cursor):
+    import configuracion
+    import tareas
+    from calculos import calcular_cartera, columnas
+
+    hoy = date.today()
+    pasado = hoy - timedelta(days=45)
+    salida = lambda *_: None
+
+    assert tareas.ejecutar(hoy=hoy, fecha=hoy, salida=salida) == [hoy]
+    antes = leer(cursor)
+    cursor.connection.commit()
+
+    assert tareas.ejecutar(hoy=hoy, fecha=pasado, salida=salida) == [pasado]
+    assert leer(cursor) == antes
+    assert tareas.al_dia(cursor, hoy)
+
+    # Los totales del día pasado sí salen a esa fecha
+    mora_porcentaje = configuracion.mora_vigente(cursor)
+    nombres = [
+        "monto", "interes", "fecha_prestamo", "tipo_prestamo", "plazo_dias",
+        "pagado", "total_abonos",
+    ]
+    cursor.execute("""
+        SELECT p.monto, p.interes, p.fecha_prestamo, p.tipo_prestamo, p.plazo_dias,
+               p.pagado, COALESCE(r.total_abonos, 0)
+        FROM prestamos p
+        LEFT JOIN resumen_prestamos r ON r.prestamo_id = p.id
+        WHERE p.pagado = FALSE AND p.fecha_prestamo <= %s
+    """, (pasado,))
+    calculo = calcular_cartera(columnas(cursor.fetchall(), nombres), mora_porcentaje, pasado)
+
+    cursor.execute(
+        "SELECT prestamos_vencidos, mora_total FROM cierres_diarios WHERE fecha = %s",
+        (pasado,),
+    )
+    vencidos, mora_total = cursor.fetchone()
+    assert vencidos == int((calculo["dias_vencidos"] > 0).sum())
+    assert mora_total == sum(Decimal(repr(mora)) for mora in calculo["mora"].tolist())
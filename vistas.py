@@ -0,0 +1,94 @@
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from functools import wraps
+
+from flask import Response, make_response, request
+
+from db import conexion
+import configuracion
+
+# =========================
+# VISTAS CACHEADAS
+# =========================
+# Las páginas del tablero solo cambian cuando cambian los datos, la tasa de
+# mora o el día. Con esas tres cosas se arma una etiqueta por petición (una
+# consulta de una fila):
+#
+#   - si el navegador ya tiene esa etiqueta (If-None-Match) se responde 304
+#     sin consultar ni renderizar nada más;
+#   - si no, se reutiliza el HTML que este worker ya renderizó para la misma
+#     ruta y etiqueta, o se renderiza y se guarda.
+#
+# La versión de los datos sube en cada escritura (ver resumen.py), así que
+# nunca se sirve una página vieja después de un cambio.
+
+MAX_ENTRADAS = int(os.environ.get("CACHE_VISTAS", 256))
+
+# Cambia con cada despliegue, para no responder 304 con plantillas viejas
+DESPLIEGUE = os.environ.get("DESPLIEGUE") or str(int(max(
+    os.path.getmtime(os.path.join(raiz, archivo))
+    for raiz, _, archivos in os.walk(os.path.join(os.path.dirname(__file__), "templates"))
+    for archivo in archivos
+)))
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def etiqueta(c, hoy):
+    # La versión de la configuración viaja en la misma consulta: si otro
+    # worker cambió la tasa, esta petición ya no usa la de la caché
+    c.execute("""
+        SELECT d.version, (SELECT version FROM configuracion ORDER BY id LIMIT 1)
+        FROM version_datos d
+        WHERE d.id = 1
+    """)
+    version_datos, version_configuracion = c.fetchone()
+    configuracion.comprobar(version_configuracion)
+    return f"{DESPLIEGUE}-{version_datos}-{version_configuracion}-{hoy.isoformat()}"
+
+
+def _leer(clave, etiqueta_actual):
+    with _lock:
+        entrada = _cache.get(clave)
+        if entrada is None or entrada[0] != etiqueta_actual:
+            return None
+        _cache.move_to_end(clave)
+        return entrada[1]
+
+
+def _guardar(clave, etiqueta_actual, html):
+    with _lock:
+        _cache[clave] = (etiqueta_actual, html)
+        _cache.move_to_end(clave)
+        while len(_cache) > MAX_ENTRADAS:
+            _cache.popitem(last=False)
+
+
+def cacheada(f):
+    """Responde 304 o el HTML guardado si los datos no cambiaron."""
+    @wraps(f)
+    def envoltura(*args, **kwargs):
+        with conexion() as conn:
+            etiqueta_actual = etiqueta(conn.cursor(), datetime.now().date())
+
+        if request.if_none_match.contains_weak(etiqueta_actual):
+            respuesta = Response(status=304)
+        else:
+            clave = (request.endpoint, request.full_path)
+            html = _leer(clave, etiqueta_actual)
+            if html is None:
+                html = f(*args, **kwargs)
+                # Redirecciones y errores pasan sin guardarse
+                if not isinstance(html, str):
+                    return html
+                _guardar(clave, etiqueta_actual, html)
+            respuesta = make_response(html)
+
+        respuesta.set_etag(etiqueta_actual, weak=True)
+        # El navegador guarda la página pero pregunta antes de usarla
+        respuesta.headers["Cache-Control"] = "private, no-cache"
+        return respuesta
+    return envoltura